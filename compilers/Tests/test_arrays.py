@@ -0,0 +1,153 @@
+# coding=utf-8
+#
+# Filename: test_arrays.py
+#
+# Tests for arrays and bounds check elimination.
+#
+# Run:  python3 -m pytest Tests/test_arrays.py
+
+import io
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.ircode import compile_ircode
+from goneref.interp import run, link_functions, OutputSink
+from goneref.llvmgen import compile_llvm
+from goneref.compile import compile_executable, c_compiler
+from goneref.session import CompilationSession
+
+source = '''
+const N = 6;
+var squares int[N];
+var n int = 4;
+var weights float[n];
+
+func fill(a int[]) int {
+    var i int = 0;
+    while i < len(a) {
+        a[i] = i * i;
+        i = i + 1;
+    }
+    return len(a);
+}
+
+func total(a float[]) float {
+    var s float = 0.0;
+    var i int = 0;
+    while i < len(a) {
+        s = s + a[i];
+        i = i + 1;
+    }
+    return s;
+}
+
+func main() int {
+    var flags bool[3];
+    var k int = 0;
+    print fill(squares);
+    print squares[5];
+    weights[1] = 1.5;
+    weights[3] = 2.0;
+    print total(weights);
+    flags[1] = squares[2] == 4;
+    print flags[1];
+    print flags[2];
+    while k < 2 {
+        var counts int[k + 2];
+        print fill(counts) + counts[k + 1];
+        k = k + 1;
+    }
+    return 0;
+}
+'''
+
+def code(functions):
+    return [ inst for func, body in link_functions(functions) for inst in body ]
+
+def checked(text):
+    functions = compile_ircode(text, CompilationSession(echo=False))
+    return [ inst[1] for inst in code(functions) if inst[0] == 'check_index' ]
+
+def test_interp():
+    output = io.BytesIO()
+    assert run(compile_ircode(source), OutputSink(output)) == 0
+    assert output.getvalue() == b'6\n25\n3.5\nTrue\nFalse\n3\n7\n'
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_executable(tmpdir):
+    outputs = []
+    for ssa in (False, True):
+        exe = os.path.join(str(tmpdir), 'arrays')
+        compile_executable(compile_llvm(source, ssa=ssa), exe, opt_level=2)
+        outputs.append(subprocess.check_output([exe]))
+    assert outputs[0] == outputs[1] == b'6\n25\n3.500000\ntrue\nfalse\n3\n7\n'
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_out_of_range(tmpdir):
+    exe = os.path.join(str(tmpdir), 'bad')
+    text = 'var a int[3];\nfunc main() int {\n    print 1;\n    print a[len(a)];\n    return 0;\n}\n'
+    compile_executable(compile_llvm(text), exe)
+    result = subprocess.run([exe], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 1
+    assert result.stdout == b'1\n'
+    assert result.stderr == b'Line 4: index 3 out of range (length 3)\n'
+
+    output = io.BytesIO()
+    with pytest.raises(SystemExit):
+        run(compile_ircode(text), OutputSink(output))
+    assert output.getvalue() == b'1\n'
+
+def test_bounds_checks_removed():
+    # weights has no fixed length, and counts[k + 1] isn't a counting loop access
+    assert checked(source) == ['weights', 'weights', 'counts']
+
+def test_bounds_checks_kept():
+    assert checked('''
+func f(a int[], n int) int {
+    var i int = 0;
+    var j int = 0;
+    var k int = n;
+    while i < len(a) {
+        a[i] = 1;       // Not checked
+        a[k] = 2;       // k may be negative
+        i = i + 1;
+        a[i] = 3;       // i changed
+    }
+    while j < 10 {
+        a[j] = 4;       // a may be shorter
+        j = j - 1;
+    }
+    return 0;
+}
+''') == ['a', 'a', 'a']
+
+def test_errors():
+    session = CompilationSession(echo=False)
+    compile_ircode('''
+var x int[];
+var y string[3];
+func f(a int[3]) int[] { return a; }
+func main() int {
+    var a int[2] = 3;
+    var b int[2];
+    a = b;
+    print b;
+    print b[1.0];
+    print len(3);
+    return 0;
+}
+''', session)
+    assert session.error_messages() == [
+        '2: Array x needs a size',
+        '3: Arrays of string not supported',
+        "4: Array parameter a can't have a size. Use int[]",
+        "4: Function f can't return an array",
+        "6: Array a can't be initialized",
+        "8: Type error. Can't assign to array a",
+        "9: Type error. Can't print an array",
+        '10: Type error. Array index must be int',
+        '11: Type error. len() needs an array',
+        ]
@@ -0,0 +1,48 @@
+# coding=utf-8
+#
+# Filename: test_batch.py
+#
+# Tests for the batch compiler.
+#
+# Run:  python3 -m pytest Tests/test_batch.py
+
+import os
+
+import pytest
+
+from goneref.batch import compile_batch, expand_sources
+from goneref.llvmgen import compile_llvm
+from goneref.session import CompilationSession
+
+def program(n):
+    return 'func main() int {\n    print %d;\n    return %d;\n}\n' % (n, n)
+
+@pytest.fixture
+def sources(tmpdir):
+    filenames = []
+    for n in range(6):
+        filename = str(tmpdir.join('prog%d.g' % n))
+        with open(filename, 'w') as f:
+            f.write(program(n) if n != 3 else 'func main() int {\n    return 2.5;\n}\n')
+        filenames.append(filename)
+    return filenames
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_ordered_results(sources, jobs):
+    results = compile_batch(sources, jobs=jobs)
+    assert [ filename for filename, output, messages in results ] == sources
+    for n, (filename, output, messages) in enumerate(results):
+        if n == 3:
+            assert output is None
+            assert messages == ['%s:2: Type error in return.  float != int' % filename]
+        else:
+            assert messages == []
+            assert output == compile_llvm(program(n), session=CompilationSession())
+
+def test_objects(sources):
+    results = compile_batch(sources[:2], jobs=2, emit='obj', opt_level=2)
+    assert all(output[:4] == b'\x7fELF' for filename, output, messages in results)
+
+def test_expand_sources(sources, tmpdir):
+    pattern = os.path.join(str(tmpdir), 'prog*.g')
+    assert expand_sources([sources[5], pattern]) == [sources[5]] + sources[:5]
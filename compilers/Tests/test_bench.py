@@ -0,0 +1,71 @@
+# coding=utf-8
+#
+# Filename: test_bench.py
+#
+# Tests for the benchmark runner (comparing result files).
+#
+# Run:  python3 -m pytest Tests/test_bench.py
+
+import sys
+import json
+
+import pytest
+
+from goneref.bench import bench_program, compare_results, main
+
+def results(*entries):
+    return { 'metadata' : {},
+             'results' : [ { 'program' : program, 'engine' : engine,
+                             'compile' : { 'median' : compile_time },
+                             'run' : { 'median' : run_time } }
+                           for program, engine, compile_time, run_time in entries ] }
+
+old = results(('fib.g', 'interp', 0.5, 2.0),
+              ('fib.g', 'jit-O2', 0.25, 0.0),
+              ('mandel.g', 'interp', 0.5, 4.0))
+
+new = results(('fib.g', 'interp', 0.5, 3.0),      # run 50% slower
+              ('fib.g', 'jit-O2', 0.3, 0.5),      # compile 20% slower, no old run time
+              ('mandel.g', 'interp', 0.25, 4.2),  # run 5% slower
+              ('fact.g', 'interp', 1.0, 1.0))     # not in old
+
+def test_compare_results():
+    assert compare_results(old, new) == [
+        ('fib.g', 'interp', 'run', 2.0, 3.0, 1.5),
+        ('fib.g', 'jit-O2', 'compile', 0.25, 0.3, pytest.approx(1.2)),
+        ]
+    assert compare_results(old, new, threshold=0.25) == [('fib.g', 'interp', 'run', 2.0, 3.0, 1.5)]
+    assert compare_results(old, new, threshold=0.01) == [
+        ('fib.g', 'interp', 'run', 2.0, 3.0, 1.5),
+        ('fib.g', 'jit-O2', 'compile', 0.25, 0.3, pytest.approx(1.2)),
+        ('mandel.g', 'interp', 'run', 4.0, 4.2, pytest.approx(1.05)),
+        ]
+    assert compare_results(new, new) == []
+
+def compare(tmpdir, monkeypatch, *options):
+    files = []
+    for name, data in (('old.json', old), ('new.json', new)):
+        files.append(str(tmpdir.join(name)))
+        with open(files[-1], 'w') as f:
+            json.dump(data, f)
+    monkeypatch.setattr(sys, 'argv', ['bench', '--compare'] + files + list(options))
+    main()
+
+def test_compare_files(tmpdir, monkeypatch, capsys):
+    with pytest.raises(SystemExit) as exc:
+        compare(tmpdir, monkeypatch)
+    assert exc.value.code == 1
+    assert capsys.readouterr().out.splitlines() == [
+        'REGRESSION fib.g interp run: 2.0000s -> 3.0000s (+50.0%)',
+        'REGRESSION fib.g jit-O2 compile: 0.2500s -> 0.3000s (+20.0%)',
+        ]
+
+    compare(tmpdir, monkeypatch, '--threshold', '0.6')
+    assert capsys.readouterr().out == 'No regressions over 60.0%\n'
+
+def test_bench_program():
+    result = bench_program('small', 'func main() int { print 1; return 0; }', 'interp',
+                           repeat=2, warmup=0)
+    assert (result['program'], result['engine']) == ('small', 'interp')
+    assert len(result['run']['times']) == 2
+    assert result['run']['min'] <= result['run']['median']
@@ -0,0 +1,113 @@
+# coding=utf-8
+#
+# Filename: test_check_parallel.py
+#
+# Tests for checking function bodies in parallel (checker.check_parallel).
+#
+# Run:  python3 -m pytest Tests/test_check_parallel.py
+
+from goneref.ast import LoadVariable, LoadArray, VarDeclaration, ParmDeclaration, flatten
+from goneref.checker import check_program, split_chunks
+from goneref.ircode import GenerateCode
+from goneref.interp import link_functions
+from goneref.parser import parse
+from goneref.session import CompilationSession
+from goneref.synth import generate_program
+
+errors_source = '''var a int = 1.5;
+func f(x int) int {
+    var y float = x;
+    return g(x);
+}
+var b int = c;
+func g(x int) int {
+    print b + 1.0;
+    return f(x) + a;
+}
+func f(z int) int {
+    return z;
+}
+func h() float {
+    var q int = undefined;
+    if q { print 1; }
+    return 1;
+}
+const c = 2;
+func main() int {
+    return h();
+}
+'''
+
+def check(source, jobs):
+    session = CompilationSession(filename='prog.g', echo=False)
+    ast = parse(source, session)
+    check_program(ast, session, jobs=jobs)
+    return ast, session
+
+def intermediate_code(ast):
+    gen = GenerateCode()
+    gen.visit(ast)
+    return [ (func.name, code) for func, code in link_functions(gen.functions) ]
+
+def test_errors_in_order():
+    ast, session = check(errors_source, None)
+    expected = session.error_messages()
+    # Bodies only see the names declared before them (g, c in f and b)
+    assert 'prog.g:4: Undefined name g' in expected
+    assert 'prog.g:6: c undefined' in expected
+    for jobs in (2, 3):
+        ast, session = check(errors_source, jobs)
+        assert session.error_messages() == expected
+
+def test_same_code():
+    source = generate_program(5, functions=40)
+    ast, session = check(source, None)
+    assert session.error_messages() == []
+    expected = intermediate_code(ast)
+    ast, session = check(source, 4)
+    assert session.error_messages() == []
+    assert intermediate_code(ast) == expected
+
+def test_references():
+    # node.sym refers to the declarations in this process's tree
+    source = '''
+var total int = 0;
+var a int[4];
+func f(n int) int {
+    var x int = n + total;
+    if x > 0 {
+        var y int = x;
+        total = y;
+    }
+    return a[x] + f(x);
+}
+func g() int {
+    return total + a[1];
+}
+'''
+    ast, session = check(source, 2)
+    assert session.error_messages() == []
+    nodes = [ node for depth, node in flatten(ast) ]
+    declarations = dict((node.name, node) for node in nodes
+                        if isinstance(node, (VarDeclaration, ParmDeclaration)))
+    loads = [ node for node in nodes if isinstance(node, (LoadVariable, LoadArray)) ]
+    assert [ node.name for node in loads ] == ['n', 'total', 'x', 'x', 'y', 'a', 'x', 'x', 'total', 'a']
+    for node in loads:
+        assert node.sym is declarations[node.name]
+    assert loads[4].resolved == (2, 2)
+    assert str(loads[5].type) == 'int'
+
+def test_session_option():
+    session = CompilationSession(echo=False, options={'check_jobs': 2})
+    ast = parse(errors_source, session)
+    check_program(ast, session)
+    assert session.errors_reported() == 11
+
+def test_split_chunks():
+    class Node(object):
+        def __init__(self, lineno):
+            self.lineno = lineno
+    functions = [ (n, Node(lineno)) for n, lineno in enumerate([1, 11, 21, 31, 41, 51]) ]
+    chunks = split_chunks(functions, 3)
+    assert [ [ visible for visible, node in chunk ] for chunk in chunks ] == [[0, 1], [2, 3], [4, 5]]
+    assert len(split_chunks(functions[:1], 8)) == 1
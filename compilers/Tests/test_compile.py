@@ -0,0 +1,180 @@
+# coding=utf-8
+#
+# Filename: test_compile.py
+#
+# Tests for standalone compilation (object emission and linking).
+#
+# Run:  python3 -m pytest Tests/test_compile.py
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.llvmgen import compile_llvm
+from goneref.compile import compile_object, compile_executable, c_compiler, runtime_object
+
+source = '''
+func fact(n int) int {
+    if n < 2 {
+        return 1;
+    }
+    return n * fact(n - 1);
+}
+
+func main() int {
+    print fact(10);
+    print 2.5;
+    print 3 < 4;
+    return 0;
+}
+'''
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_runtime_object(tmpdir, monkeypatch):
+    monkeypatch.setenv('XDG_CACHE_HOME', str(tmpdir))
+    cachedir = tmpdir.join('gone')
+    cachedir.ensure(dir=True)
+    cachedir.join('gonert-0000000000000000.o').write('stale')
+    objname = runtime_object()
+    assert os.path.dirname(objname) == str(cachedir)
+    # The object built from an older runtime is gone, and nothing else is left behind
+    assert os.listdir(str(cachedir)) == [os.path.basename(objname)]
+    assert runtime_object() == objname
+
+def test_object():
+    obj = compile_object(compile_llvm(source))
+    assert obj[:4] in (b'\x7fELF', b'\xcf\xfa\xed\xfe')
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_executable(tmpdir):
+    exe = os.path.join(str(tmpdir), 'fact')
+    compile_executable(compile_llvm(source), exe, opt_level=2)
+    output = subprocess.check_output([exe])
+    assert output == b'3628800\n2.500000\ntrue\n'
+
+ssa_source = '''
+var g int = 5;
+
+func find(limit int) int {
+    var i int = 0;
+    while i < limit {
+        if i * i > 50 {
+            return i;
+        } else {
+            var t int = i + 1;
+            g = g + t;
+        }
+        i = i + 1;
+    }
+    return -1;
+}
+
+func flip(n int) bool {
+    var b bool = false;
+    while n > 0 {
+        b = !b;
+        n = n - 1;
+    }
+    return b;
+}
+
+func main() int {
+    print find(100);
+    print find(3);
+    print g;
+    print flip(3);
+    print 1.5;
+    return 0;
+}
+'''
+
+def test_ssa_no_allocas():
+    assert 'alloca' not in compile_llvm(ssa_source, ssa=True)
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_ssa_executable(tmpdir):
+    outputs = []
+    for ssa in (False, True):
+        exe = os.path.join(str(tmpdir), 'prog%d' % ssa)
+        compile_executable(compile_llvm(ssa_source, ssa), exe)
+        outputs.append(subprocess.check_output([exe]))
+    assert outputs[0] == outputs[1] == b'8\n-1\n47\ntrue\n1.500000\n'
+
+def test_fast_math():
+    float_source = 'func main() int { var x float = 1.5; print x * 2.0 + 1.0; return 0; }'
+    assert 'fmul fast' not in compile_llvm(float_source)
+    for ssa in (False, True):
+        llvm_code = compile_llvm(float_source, ssa, fast_math=True)
+        assert 'fmul fast' in llvm_code and 'fadd fast' in llvm_code
+
+def test_runtime_linked():
+    import llvmlite.binding as llvm
+    from goneref.run import create_target_machine, parse_module
+    create_target_machine()
+    mod = parse_module(compile_llvm(source))
+    defined = [ f.name for f in mod.functions if not f.is_declaration ]
+    assert '_print_int' in defined and '_print_bool' in defined
+
+def test_runtime_outbuf_size():
+    # The IR versions of the print functions use the buffer size from gonert.c
+    from goneref.runtime import RuntimeBuilder, runtime_constant, outbuf_size
+    assert outbuf_size == runtime_constant('GONE_OUTBUF_SIZE') == 65536
+    assert '@"_gone_outbuf" = external global [65536 x i8]' in str(RuntimeBuilder().module)
+    with pytest.raises(RuntimeError):
+        runtime_constant('GONE_NO_SUCH_CONSTANT')
+
+@pytest.mark.skipif(not shutil.which(c_compiler()) or not os.path.exists('/dev/full'),
+                    reason='no C compiler or /dev/full')
+def test_flush_error(tmpdir):
+    # flush() reports output that could not be written
+    exe = os.path.join(str(tmpdir), 'flush')
+    compile_executable(compile_llvm('''
+extern func flush() int;
+func main() int {
+    print 1;
+    return flush() + 2;
+}
+'''), exe)
+    assert subprocess.run([exe], stdout=subprocess.PIPE).returncode == 2
+    with open('/dev/full', 'w') as full:
+        assert subprocess.run([exe], stdout=full).returncode == 1
+
+def test_target_machine(monkeypatch):
+    import llvmlite.binding as llvm
+    from goneref.run import create_target_machine, host_cpu
+    created = []
+    original = llvm.Target.create_target_machine
+    def create(self, **kwargs):
+        created.append((kwargs['cpu'], kwargs['features']))
+        return original(self, **kwargs)
+    monkeypatch.setattr(llvm.Target, 'create_target_machine', create)
+
+    create_target_machine()
+    create_target_machine(cpu='generic')
+    create_target_machine(cpu='generic', features='+sse4.2')
+    assert created == [host_cpu(), ('generic', ''), ('generic', '+sse4.2')]
+
+def test_vectorizer_passes():
+    from goneref.run import create_target_machine, parse_module, pass_manager_builder
+    for opt_level in (1, 2, 3):
+        pmb = pass_manager_builder(opt_level)
+        assert pmb.opt_level == opt_level
+        assert pmb.loop_vectorize == pmb.slp_vectorize == (opt_level == 3)
+
+    # Only -O3 vectorizes loops that aren't tagged for it
+    llvm_code = compile_llvm('''
+var a float[1000];
+func scale(x float) int {
+    var i int = 0;
+    while i < len(a) {
+        a[i] = a[i] * x;
+        i = i + 1;
+    }
+    return 0;
+}
+''', ssa=True)
+    for opt_level in (2, 3):
+        mod = parse_module(llvm_code, opt_level, create_target_machine(opt_level))
+        assert ('llvm.loop.isvectorized' in str(mod)) == (opt_level == 3)
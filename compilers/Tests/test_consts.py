@@ -0,0 +1,75 @@
+# coding=utf-8
+#
+# Filename: test_consts.py
+#
+# Tests for constants computed at compile time.
+#
+# Run:  python3 -m pytest Tests/test_consts.py
+
+import io
+
+from goneref.ircode import compile_ircode
+from goneref.interp import run, link_functions, OutputSink
+from goneref.llvmgen import compile_llvm
+from goneref.session import CompilationSession
+
+source = '''
+const WIDTH = 80.0;
+const HALF = WIDTH / 2.0;
+const N = 7;
+const Q = -N / 2;
+const BIG = 2147483647 + 1;
+const WIDE = HALF > 30.0 && !(N == 8);
+var count int = 3;
+const START = count * 2;
+
+func main() int {
+    const LOCAL = N * 3;
+    print HALF;
+    print Q;
+    print BIG;
+    print WIDE;
+    print LOCAL;
+    print START;
+    return 0;
+}
+'''
+
+def code(functions):
+    return [ inst for func, body in link_functions(functions) for inst in body ]
+
+def test_values():
+    output = io.BytesIO()
+    assert run(compile_ircode(source), OutputSink(output)) == 0
+    assert output.getvalue() == b'40.0\n-3\n-2147483648\nTrue\n21\n6\n'
+
+def test_no_storage():
+    text = source + 'const ZERO = 0;\nconst BAD = N / ZERO;\n'
+    instructions = code(compile_ircode(text, CompilationSession(echo=False)))
+    declared = [ inst[1] for inst in instructions if inst[0].startswith(('global_', 'alloc_')) ]
+    # Uses of a variable and division by zero are left for run time
+    assert declared == ['count', 'START', 'BAD']
+    assert ('literal_float', 40.0, '__float_0') in instructions
+
+def test_llvm():
+    llvm_code = compile_llvm(source, session=CompilationSession(echo=False))
+    assert '@"HALF"' not in llvm_code and '@"LOCAL"' not in llvm_code
+    assert '@"START" = global' in llvm_code
+
+def test_strings_not_folded():
+    text = '''
+const S = "hi";
+func main() int {
+    const T = S;
+    print S;
+    print T;
+    return 0;
+}
+'''
+    instructions = code(compile_ircode(text))
+    declared = [ inst[1] for inst in instructions if inst[0].startswith(('global_', 'alloc_')) ]
+    assert declared == ['S', 'T']
+    assert [ inst[0] for inst in instructions if 'hi' in inst ] == ['literal_string']
+    output = io.BytesIO()
+    assert run(compile_ircode(text), OutputSink(output)) == 0
+    assert output.getvalue() == b'hi\nhi\n'
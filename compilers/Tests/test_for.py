@@ -0,0 +1,205 @@
+# coding=utf-8
+#
+# Filename: test_for.py
+#
+# Tests for counted for loops (for i in a..b by step).
+#
+# Run:  python3 -m pytest Tests/test_for.py
+
+import io
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.tokenizer import GoneLexer
+from goneref.ircode import compile_ircode
+from goneref.interp import run, link_functions, OutputSink
+from goneref.llvmgen import compile_llvm
+from goneref.compile import compile_executable, c_compiler
+from goneref.run import create_target_machine, parse_module
+from goneref.session import CompilationSession
+from goneref.tiered import TieredInterpreter
+
+source = '''
+const BIG = 2147483647;
+var in int = 3;
+var a int[10];
+
+func find(n int) int {
+    for i in 0..100 {
+        if i * i >= n {
+            return i;
+        }
+    }
+    return -1;
+}
+
+func main() int {
+    var total int = 0;
+    for i in 0..len(a) {
+        a[i] = i * i;
+    }
+    for i in len(a) - 1..-1 by -1 {
+        total = total + a[i];
+    }
+    print total;
+    for i in 10..in by -3 {
+        print i;
+    }
+    for i in 5..5 {
+        print 999;
+    }
+    for i in -BIG - 1..BIG by 2000000000 {
+        print i;
+    }
+    for i in 0..3 {
+        for j in i..3 {
+            total = total - j;
+        }
+    }
+    print total;
+    print find(50);
+    return 0;
+}
+'''
+
+expected = [285, 10, 7, 4, -2147483648, -147483648, 1852516352, 277, 8]
+
+def interp_output(text):
+    output = io.BytesIO()
+    run(compile_ircode(text), OutputSink(output))
+    return output.getvalue()
+
+def test_lex_range():
+    toks = list(GoneLexer().tokenize('for i in 0..10 by 2.5'))
+    assert [t.type for t in toks] == ['FOR', 'ID', 'ID', 'INTEGER', 'DOTDOT', 'INTEGER', 'ID', 'FLOAT']
+    assert [t.value for t in toks][3:] == [0, '..', 10, 'by', 2.5]
+
+def test_interp():
+    assert interp_output(source) == ''.join('%d\n' % n for n in expected).encode()
+
+def test_fused_instructions():
+    # The step, loop test and branch back are one instruction
+    code = dict((func.name, body) for func, body in link_functions(compile_ircode(source)))
+    ops = [ inst[0] for inst in code['find'] ]
+    assert ops.count('for_start') == ops.count('for_next') == 1
+    assert code['find'][ops.index('for_next')][4] == ops.index('for_start') + 1
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+@pytest.mark.parametrize('ssa', [False, True])
+def test_executable(tmpdir, ssa):
+    exe = os.path.join(str(tmpdir), 'for')
+    compile_executable(compile_llvm(source, ssa=ssa), exe, opt_level=2)
+    assert subprocess.check_output([exe]) == ''.join('%d\n' % n for n in expected).encode()
+
+def test_tiered():
+    interpreter = TieredInterpreter(compile_ircode('''
+func count(n int) int {
+    var total int = 0;
+    for i in 0..n {
+        total = total + i;
+    }
+    return total;
+}
+func main() int {
+    return count(10);
+}
+'''), 5)
+    assert interpreter.run() == 45
+    # count() was promoted by the back-edges of its loop
+    assert [ promotion[0] for promotion in interpreter.promotions ] == ['count']
+
+def test_bounds_checks():
+    functions = compile_ircode('''
+var a int[10];
+var b int[20];
+func f(c int[]) int {
+    for i in 0..len(a) {
+        b[i] = c[i] + a[i];         // Only c[i] is checked
+    }
+    for i in len(c) - 1..-1 by -1 {
+        c[i] = a[i];                // Only a[i] is checked
+    }
+    for i in 0..20 by 2 {
+        b[i] = a[i];                // Only a[i] is checked
+    }
+    return 0;
+}
+''')
+    checked = [ inst[1] for func, body in link_functions(functions) for inst in body
+                if inst[0] == 'check_index' ]
+    assert checked == ['c', 'a', 'a']
+
+def test_loop_metadata():
+    llvm_code = compile_llvm('''
+var a float[1000];
+func f(x float) int {
+    for i in 0..len(a) {
+        a[i] = a[i] * x + 1.0;
+    }
+    for i in 0..len(a) by 100 {
+        print a[i];
+    }
+    return 0;
+}
+''')
+    # Both loops are tagged.  Only the first one can be vectorized.
+    assert llvm_code.count('!llvm.loop') == 2
+    assert llvm_code.count('"llvm.loop.vectorize.enable"') == 1
+    module = parse_module(llvm_code, 2, create_target_machine(2))
+    assert 'llvm.loop.isvectorized' in str(module)
+
+def test_no_vectorizer_warnings(capfd):
+    llvm_code = compile_llvm('''
+func f(a int[], n int) int {
+    var t int = 1;
+    var s int = 0;
+    var total int = 0;
+    for i in 0..n {
+        t = t * 3 + 1;
+    }
+    for i in 0..len(a) {
+        s = s * 2 + a[i];
+    }
+    for i in 0..len(a) {
+        total = total + a[i];
+    }
+    return t + s + total;
+}
+''')
+    # t and s aren't reductions, so only the last loop is tagged
+    assert llvm_code.count('"llvm.loop.vectorize.enable"') == 1
+    for opt_level in (2, 3):
+        module = parse_module(llvm_code, opt_level, create_target_machine(opt_level))
+        assert 'llvm.loop.isvectorized' in str(module)
+    assert capfd.readouterr().err == ''
+
+def test_errors():
+    session = CompilationSession(echo=False)
+    compile_ircode('''
+func main() int {
+    var n int = 2;
+    for i in 0..1.5 {
+        i = 3;
+    }
+    for i in 0..10 by n {
+        var i int = 1;
+    }
+    print i;
+    return 0;
+}
+''', session)
+    assert session.error_messages() == [
+        '4: Type error. Loop range must be int',
+        "5: Type error. Can't assign to loop variable i",
+        '7: Loop step must be a nonzero int constant',
+        '8: i already defined. Previous definition on line 7',
+        '10: i undefined',
+        ]
+
+def test_syntax_error():
+    session = CompilationSession(echo=False)
+    compile_ircode('func main() int { for i of 0..3 { } return 0; }', session)
+    assert session.error_messages() == ["1: Syntax error in input at token 'of'"]
@@ -0,0 +1,118 @@
+# coding=utf-8
+#
+# Filename: test_incremental.py
+#
+# Tests for incremental compilation (only changed functions and their
+# dependents are compiled again).
+#
+# Run:  python3 -m pytest Tests/test_incremental.py
+
+import pytest
+
+from goneref.incremental import IncrementalCompiler, split_chunks
+from goneref.ircode import compile_ircode
+from goneref.interp import run, OutputSink
+
+source = '''/* Incremental test */
+const K = 2;
+var total int = 0;
+
+func twice(x int) int {
+    return x * K;
+}
+
+func show() int {
+    print K;
+    return 0;
+}
+
+func add(x int) int {
+    total = total + twice(x);
+    return total;
+}
+
+func main() int {
+    var x int = add(1) + add(2) + show();
+    print total;
+    return 0;
+}
+'''
+
+def build(compiler, text):
+    engine = compiler.build(text)
+    assert engine is not None, compiler.session.error_messages()
+    return engine, dict(compiler.stats)
+
+def run_main(engine):
+    from goneref.run import run_engine
+    return run_engine(engine)
+
+def interp_output(text):
+    import io
+    output = io.BytesIO()
+    run(compile_ircode(text), output=OutputSink(output))
+    return output.getvalue()
+
+def test_split_chunks():
+    chunks = split_chunks(source)
+    assert [ lineno for text, lineno in chunks ] == [2, 3, 5, 9, 14, 19]
+    assert chunks[0][0] == 'const K = 2;'
+    assert chunks[1][0] == 'var total int = 0;'
+    assert chunks[2][0].startswith('func twice') and chunks[2][0].endswith('}')
+
+def test_unchanged_rebuild():
+    compiler = IncrementalCompiler()
+    engine, stats = build(compiler, source)
+    assert stats['changed'] == 4 and stats['compiled'] == 4
+    assert run_main(engine) == 0
+    engine, stats = build(compiler, source)
+    assert stats == { 'parsed' : 0, 'changed' : 0, 'dependents' : 0, 'reused' : 4, 'compiled' : 0 }
+    assert run_main(engine) == 0
+
+def test_body_change():
+    compiler = IncrementalCompiler()
+    build(compiler, source)
+    engine, stats = build(compiler, source.replace('return x * K;', 'return x * K + 1;'))
+    assert stats['changed'] == 1 and stats['compiled'] == 1
+    assert stats['dependents'] == 0 and stats['reused'] == 3
+    assert run_main(engine) == 0
+
+def test_value_change_recompiles_dependents():
+    # The value of K is compiled into the functions using it
+    compiler = IncrementalCompiler()
+    build(compiler, source)
+    engine, stats = build(compiler, source.replace('const K = 2;', 'const K = 3;'))
+    assert stats['dependents'] == 2
+    assert stats['compiled'] == 2 and stats['reused'] == 2
+
+def test_type_change_recompiles_dependents():
+    compiler = IncrementalCompiler()
+    build(compiler, source)
+    text = source.replace('const K = 2;', 'const K = 2.5;').replace('return x * K;', 'return x * 2;')
+    engine, stats = build(compiler, text)
+    # twice changed, show uses K
+    assert stats['changed'] == 1 and stats['dependents'] == 1
+    assert stats['compiled'] == 2 and stats['reused'] == 2
+
+def test_signature_change_errors():
+    compiler = IncrementalCompiler('inc.g')
+    build(compiler, source)
+    text = source.replace('func twice(x int) int {\n    return x * K;',
+                          'func twice(x int) float {\n    return 1.5;')
+    assert compiler.build(text) is None
+    assert compiler.session.error_messages()[0].startswith('inc.g:15:')
+
+    # Reused chunks get the line numbers of where they are now
+    text = '\n\n' + source.replace('print total;', 'print total + 0.5;')
+    assert compiler.build(text) is None
+    assert compiler.session.error_messages()[0].startswith('inc.g:23:')
+
+def test_output(capfd):
+    compiler = IncrementalCompiler()
+    build(compiler, source)
+    text = source.replace('return x * K;', 'print x;\n    return x * K;')
+    engine, stats = build(compiler, text)
+    capfd.readouterr()
+    run_main(engine)
+    out, err = capfd.readouterr()
+    assert out.startswith(interp_output(text).decode('utf-8'))
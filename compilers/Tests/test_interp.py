@@ -0,0 +1,47 @@
+# coding=utf-8
+#
+# Filename: test_interp.py
+#
+# Tests for the IR interpreter.
+#
+# Run:  python3 -m pytest Tests/test_interp.py
+
+import io
+
+from goneref.ircode import compile_ircode
+from goneref.interp import run, OutputSink
+
+source = '''
+extern func putchar(c int) int;
+extern func flush() int;
+
+func main() int {
+    var n int = 0;
+    var r int;
+    while n < 3 {
+        print n;
+        r = putchar(65 + n);
+        r = putchar(10);
+        n = n + 1;
+    }
+    r = flush();
+    return 42;
+}
+'''
+
+def test_captured_output():
+    output = io.BytesIO()
+    result = run(compile_ircode(source), OutputSink(output))
+    assert result == 42
+    assert output.getvalue() == b'0\nA\n1\nB\n2\nC\n'
+
+def test_sink_threshold():
+    output = io.BytesIO()
+    sink = OutputSink(output, threshold=4)
+    sink.write(b'ab')
+    assert output.getvalue() == b''
+    sink.write(b'cd')
+    assert output.getvalue() == b'abcd'
+    sink.write(b'e')
+    sink.flush()
+    assert output.getvalue() == b'abcde'
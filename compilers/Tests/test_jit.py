@@ -0,0 +1,69 @@
+# coding=utf-8
+#
+# Filename: test_jit.py
+#
+# Tests for calling JIT-compiled Gone functions from Python.
+#
+# Run:  python3 -m pytest Tests/test_jit.py
+
+import pytest
+
+from goneref.jit import JITModule, CompileError
+
+source = '''
+var calls int = 0;
+var scale float = 0.5;
+
+func fact(n int) int {
+    calls = calls + 1;
+    if n < 2 {
+        return 1;
+    }
+    return n * fact(n - 1);
+}
+
+func scaled(x float) float {
+    return x * scale;
+}
+
+func between(x int, lo int, hi int) bool {
+    return lo <= x && x <= hi;
+}
+
+func count() int {
+    return calls;
+}
+
+func main() int {
+    return fact(5);
+}
+'''
+
+def test_calls():
+    mod = JITModule(source, opt_level=2)
+    assert mod.fact(10) == 3628800
+    assert mod.scaled(3.0) == 1.5
+    assert mod.between(5, 1, 10) is True
+    assert mod.between(11, 1, 10) is False
+    assert mod.main() == 120
+
+def test_cached_and_initialized_once():
+    mod = JITModule(source)
+    fact = mod.function('fact')
+    assert mod.function('fact') is fact
+    assert mod.count() == 0
+    fact(3)
+    fact(3)
+    # __init ran once, so calls was not reset between lookups
+    mod.function('scaled')
+    assert mod.count() == 6
+    assert sorted(mod.functions()) == ['between', 'count', 'fact', 'main', 'scaled']
+
+def test_errors():
+    mod = JITModule(source)
+    with pytest.raises(KeyError):
+        mod.function('missing')
+    with pytest.raises(AttributeError):
+        mod.missing
+    with pytest.raises(CompileError):
+        JITModule('func f() int { var y int = 2.5; return 1; }')
@@ -0,0 +1,121 @@
+# coding=utf-8
+#
+# Filename: test_lazy.py
+#
+# Tests for lazy (compile on first call) JIT compilation.
+#
+# Run:  python3 -m pytest Tests/test_lazy.py
+
+import threading
+
+import pytest
+
+from goneref.errors import clear_errors
+from goneref.ircode import compile_ircode
+from goneref.lazy import LazyJIT
+
+source = '''
+var calls int = 0;
+var scale float = 0.5;
+
+func fact(n int) int {
+    calls = calls + 1;
+    if n < 2 {
+        return 1;
+    }
+    return n * fact(n - 1);
+}
+
+func scaled(x float) float {
+    return x * scale;
+}
+
+func between(x int, lo int, hi int) bool {
+    return lo <= x && x <= hi;
+}
+
+func unused(x int) int {
+    return fact(x) + 1;
+}
+
+func main() int {
+    if between(3, 1, 10) && scaled(4.0) == 2.0 {
+        return fact(5) + calls;
+    }
+    return 0;
+}
+'''
+
+def compile_source():
+    clear_errors()
+    return compile_ircode(source)
+
+@pytest.mark.parametrize('opt_level,ssa', [(0, False), (2, True)])
+def test_only_called_functions_compiled(opt_level, ssa):
+    jit = LazyJIT(compile_source(), opt_level=opt_level, ssa=ssa)
+    assert jit.compiled == {}
+    assert jit.run() == 125
+    assert sorted(jit.compiled) == ['__init', 'between', 'fact', 'main', 'scaled']
+
+def test_slots_patched():
+    jit = LazyJIT(compile_source())
+    stub = jit.slots['fact'].value
+    address = jit.compile_function('fact')
+    assert jit.slots['fact'].value == address != stub
+    # Compiling again returns the same code
+    assert jit.compile_function('fact') == address
+
+@pytest.mark.parametrize('ssa', [False, True])
+def test_compile_error(capfd, ssa):
+    clear_errors()
+    jit = LazyJIT(compile_ircode('''
+func fact(n int) int {
+    if n < 2 {
+        return 1;
+    }
+    return n * fact(n - 1);
+}
+func g(n int) int {
+    var i int = 0;
+    var total int = 0;
+    while i < n {
+        total = total + fact(i);
+        i = i + 1;
+    }
+    return total;
+}
+func big(n int) bool {
+    return fact(n) > 5;
+}
+func main() int {
+    print 1;
+    for i in 0..3 {
+        print big(i + 2);
+        print g(i + 3);
+    }
+    print 2;
+    return 7;
+}
+'''), ssa=ssa)
+    compile_function = jit.compile_function
+
+    def failing_compile(name):
+        if name == 'fact':
+            raise RuntimeError('cannot compile fact')
+        return compile_function(name)
+
+    jit.compile_function = failing_compile
+    threads = threading.active_count()
+    with pytest.raises(RuntimeError, match='cannot compile fact'):
+        jit.run()
+    # The program unwound from the call instead of going on with a bogus result
+    output = capfd.readouterr()
+    assert output.out == '1\n'
+    assert 'Exception ignored' not in output.err
+    assert 'fact' not in jit.compiled
+    assert threading.active_count() == threads
+
+    # The same program runs once fact() can be compiled
+    jit.compile_function = compile_function
+    assert jit.run() == 7
+    assert capfd.readouterr().out == '1\nfalse\n4\ntrue\n10\ntrue\n34\n2\n'
@@ -0,0 +1,159 @@
+# coding=utf-8
+#
+# Filename: test_modules.py
+#
+# Tests for separately compiled modules (import and interface files).
+#
+# Run:  python3 -m pytest Tests/test_modules.py
+
+import os
+import json
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.compile import c_compiler
+from goneref.llvmgen import compile_llvm
+from goneref.modules import ModuleLoader
+from goneref.session import CompilationSession
+
+vec_source = '''/* vec.g */
+const SCALE = 2.5;
+var calls int = 0;
+
+func dot(ax float, ay float, bx float, by float) float {
+    calls = calls + 1;
+    return ax * bx + ay * by;
+}
+'''
+
+geometry_source = '''
+import vec;
+
+var area_calls int = 10;
+
+func area(w float, h float) float {
+    area_calls = area_calls + 1;
+    return w * h * SCALE;
+}
+
+func norm2(x float, y float) float {
+    return dot(x, y, x, y);
+}
+'''
+
+program = '''
+import geometry;
+import vec;
+
+func main() int {
+    print area(2.0, 3.0);
+    print norm2(3.0, 4.0);
+    print calls;
+    print area_calls;
+    print SCALE;
+    return 0;
+}
+'''
+
+expected = b'15.000000\n25.000000\n1\n11\n2.500000\n'
+
+def write(directory, name, source):
+    with open(os.path.join(directory, name), 'w') as f:
+        f.write(source)
+
+@pytest.fixture
+def libdir(tmpdir):
+    write(str(tmpdir), 'vec.g', vec_source)
+    write(str(tmpdir), 'geometry.g', geometry_source)
+    return str(tmpdir)
+
+def build(libdir, source=program):
+    modules = ModuleLoader([libdir])
+    session = CompilationSession(modules=modules, echo=False)
+    llvm_code = compile_llvm(source, session=session)
+    return modules, session, llvm_code
+
+def test_interface(libdir):
+    modules, session, llvm_code = build(libdir)
+    assert session.error_messages() == []
+    assert modules.built == ['vec', 'geometry']
+    assert modules.order == ['vec', 'geometry']
+    with open(os.path.join(libdir, 'vec.gi')) as f:
+        interface = json.load(f)
+    assert interface['functions'] == [['dot', 'float', ['float', 'float', 'float', 'float']]]
+    assert interface['consts'] == [['SCALE', 'float', 2.5]]
+    assert interface['vars'] == [['calls', 'int']]
+    assert os.path.exists(os.path.join(libdir, 'vec.o'))
+
+    # Init functions run in dependency order, each once
+    assert llvm_code.index('call void @"__init_vec"') < llvm_code.index('call void @"__init_geometry"')
+    assert llvm_code.count('call void @"__init_vec"') == 1
+
+def test_unchanged_modules_not_rebuilt(libdir):
+    build(libdir)
+    modules, session, llvm_code = build(libdir)
+    assert modules.built == []
+    assert modules.order == ['vec', 'geometry']
+
+def test_body_change_rebuilds_only_module(libdir):
+    build(libdir)
+    write(libdir, 'vec.g', vec_source.replace('calls + 1', 'calls + 2'))
+    modules, session, llvm_code = build(libdir)
+    assert modules.built == ['vec']
+
+def test_interface_change_rebuilds_importers(libdir):
+    build(libdir)
+    write(libdir, 'vec.g', vec_source.replace('const SCALE = 2.5;', 'const SCALE = 2.5;\nconst EXTRA = 1;'))
+    modules, session, llvm_code = build(libdir)
+    assert modules.built == ['vec', 'geometry']
+
+def test_option_change_rebuilds(libdir):
+    build(libdir)
+    modules = ModuleLoader([libdir], opt_level=2)
+    compile_llvm(program, session=CompilationSession(modules=modules, echo=False))
+    assert sorted(modules.built) == ['geometry', 'vec']
+
+def test_errors(libdir):
+    write(libdir, 'vec.g', vec_source.replace('return ax', 'return ay < 1;\n    return ax'))
+    modules, session, llvm_code = build(libdir)
+    messages = session.error_messages()
+    assert messages[0] == '%s:7: Type error: float < int' % os.path.join(libdir, 'vec.g')
+    # geometry isn't checked against a module that failed
+    assert not any('geometry.g' in message for message in messages)
+
+def test_import_errors(libdir):
+    source = 'import nothere;\nvar dot int = 1;\nimport vec;\nfunc main() int {\n    import vec;\n    return 0;\n}\n'
+    modules, session, llvm_code = build(libdir, source)
+    assert session.error_messages() == [
+        '1: No module named nothere',
+        '3: dot already defined. Previous definition on line 2',
+        '5: import must be at the top level',
+        ]
+
+def test_import_cycle(libdir):
+    write(libdir, 'vec.g', 'import geometry;\n' + vec_source)
+    modules, session, llvm_code = build(libdir)
+    assert session.error_messages()[0].endswith('Import cycle: geometry -> vec -> geometry')
+
+def test_module_main(libdir):
+    write(libdir, 'vec.g', vec_source + 'func main() int {\n    return 0;\n}\n')
+    modules, session, llvm_code = build(libdir)
+    assert session.error_messages()[0].endswith('vec.g:9: A module can not define main()')
+
+def test_run(libdir, capfd):
+    from goneref.run import run
+    modules, session, llvm_code = build(libdir)
+    capfd.readouterr()
+    assert run(llvm_code, objects=modules.objects()) == 0
+    out, err = capfd.readouterr()
+    assert out.encode('utf-8') == expected
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_executable(libdir):
+    from goneref.compile import compile_executable
+    modules, session, llvm_code = build(libdir)
+    exe = os.path.join(libdir, 'prog')
+    compile_executable(llvm_code, exe, objects=modules.objects())
+    assert subprocess.check_output([exe]) == expected
@@ -0,0 +1,73 @@
+# coding=utf-8
+#
+# Filename: test_parallel.py
+#
+# Tests for parallel code generation.
+#
+# Run:  python3 -m pytest Tests/test_parallel.py
+
+import os
+import ctypes
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.ircode import compile_ircode
+from goneref.parallel import partition_functions, module_declarations, compile_jit_parallel
+from goneref.compile import compile_executable_parallel, c_compiler
+
+source = '''
+extern func putchar(c int) int;
+
+var x float = 2.5;
+var n int = 7;
+
+func getx() float {
+    return x + 1.0;
+}
+
+func getn() int {
+    return n + 1;
+}
+
+func both() int {
+    var r int = putchar(66);
+    r = putchar(10);
+    x = getx();
+    return getn() + 1;
+}
+
+func main() int {
+    print both();
+    print getx();
+    return 0;
+}
+'''
+
+def test_partitions():
+    functions = compile_ircode(source)
+    partitions = partition_functions(functions, 3)
+    assert len(partitions) == 3
+    assert partitions[0][0].name == '__init'
+    assert sorted(func.name for part in partitions for func in part) == sorted(func.name for func in functions)
+
+def test_declarations():
+    global_vars, externs, signatures = module_declarations(compile_ircode(source))
+    assert global_vars == [('x', 'float'), ('n', 'int')]
+    assert externs == [('putchar', 'int', ['int'])]
+    assert signatures['getx'] == ('float', [])
+
+def test_jit():
+    engine = compile_jit_parallel(compile_ircode(source), jobs=4)
+    ctypes.CFUNCTYPE(None)(engine.get_function_address('__init'))()
+    getx = ctypes.CFUNCTYPE(ctypes.c_double)(engine.get_function_address('getx'))
+    getn = ctypes.CFUNCTYPE(ctypes.c_int)(engine.get_function_address('getn'))
+    assert getx() == 3.5
+    assert getn() == 8
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+def test_executable(tmpdir):
+    exe = os.path.join(str(tmpdir), 'prog')
+    compile_executable_parallel(compile_ircode(source), exe, jobs=4, opt_level=2, ssa=True)
+    assert subprocess.check_output([exe]) == b'B\n9\n4.500000\n'
@@ -0,0 +1,178 @@
+# coding=utf-8
+#
+# Filename: test_scopes.py
+#
+# Tests for nested scopes (the scope-chain symbol table of the checker).
+#
+# Run:  python3 -m pytest Tests/test_scopes.py
+
+import io
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from goneref.ast import NodeVisitor
+from goneref.checker import check_program
+from goneref.ircode import compile_ircode
+from goneref.interp import run, link_functions, OutputSink
+from goneref.llvmgen import compile_llvm
+from goneref.compile import compile_executable, c_compiler
+from goneref.lazy import LazyJIT
+from goneref.parser import parse
+from goneref.session import CompilationSession
+from goneref.tiered import TieredInterpreter
+
+source = '''
+var x int = 1;
+
+func f(n int) int {
+    var x int = n * 10;
+    var i int = 0;
+    while i < n {
+        var x int = i;
+        if x > 1 {
+            var x float = 2.5;
+            print x;
+        } else {
+            const x = true;
+            print x;
+        }
+        print x;
+        i = i + 1;
+    }
+    return x;
+}
+
+func main() int {
+    print f(3);
+    print x;
+    return 0;
+}
+'''
+
+class CollectVariables(NodeVisitor):
+    def __init__(self):
+        self.found = []
+
+    def visit_VarDeclaration(self, node):
+        self.found.append(('var', node.name, node.lineno, node.resolved))
+        self.generic_visit(node)
+
+    def visit_LoadVariable(self, node):
+        self.found.append(('load', node.name, node.lineno, node.resolved))
+
+    def visit_StoreVariable(self, node):
+        self.found.append(('store', node.name, node.lineno, node.resolved))
+
+def check(text):
+    session = CompilationSession(echo=False)
+    ast = parse(text, session)
+    check_program(ast, session)
+    return ast, session
+
+def test_resolution():
+    ast, session = check(source)
+    assert session.error_messages() == []
+    collect = CollectVariables()
+    collect.visit(ast)
+    found = collect.found
+    # Global slots 0-3 hold the builtin types
+    assert ('var', 'x', 2, (0, 4)) in found
+    # Parameter n is slot 0 of f, then x and i
+    assert ('load', 'n', 5, (1, 0)) in found
+    assert ('var', 'x', 5, (1, 1)) in found
+    assert ('load', 'i', 7, (1, 2)) in found
+    assert ('var', 'x', 8, (2, 3)) in found
+    assert ('load', 'x', 9, (2, 3)) in found
+    assert ('var', 'x', 10, (3, 4)) in found
+    assert ('load', 'x', 11, (3, 4)) in found
+    assert ('load', 'x', 14, (3, 5)) in found
+    assert ('load', 'x', 16, (2, 3)) in found
+    assert ('store', 'i', 17, (1, 2)) in found
+    assert ('load', 'x', 19, (1, 1)) in found
+    assert ('load', 'x', 24, (0, 4)) in found
+
+def test_shadowed_names():
+    functions = compile_ircode(source, CompilationSession(echo=False))
+    func, code = link_functions(functions)[1]
+    allocs = [ inst[1] for inst in code if inst[0].startswith('alloc_') ]
+    # const x = true (slot 5) needs no storage.  Every x is renamed,
+    # as the name belongs to a global.
+    assert allocs == ['x.1', 'i', 'x.3', 'x.4']
+
+def test_run():
+    output = io.BytesIO()
+    assert run(compile_ircode(source), OutputSink(output)) == 0
+    assert output.getvalue() == b'True\n0\nTrue\n1\n2.5\n2\n30\n1\n'
+
+# Variables in blocks with the name of a global, in a function and at
+# the top level
+global_source = '''
+var x int = 1;
+var seen int = 0;
+if true {
+    var x int = 5;
+    var main int = 2;
+    seen = x * main;
+}
+func main() int {
+    if true {
+        var x int = 20;
+        print x;
+        seen = seen + x;
+    }
+    print x;
+    var x int = 3;
+    return seen * 10 + x;
+}
+'''
+
+global_output = b'20\n1\n'
+
+def test_global_names():
+    functions = compile_ircode(global_source, CompilationSession(echo=False))
+    declared = [ inst[1] for func, body in link_functions(functions) for inst in body
+                 if inst[0].startswith(('global_', 'alloc_')) ]
+    assert declared == ['x', 'seen', 'x.6', 'main.7', 'x.0', 'x.1']
+
+def test_global_names_interp():
+    output = io.BytesIO()
+    assert run(compile_ircode(global_source), OutputSink(output)) == 303
+    assert output.getvalue() == global_output
+
+def test_global_names_tiered():
+    assert TieredInterpreter(compile_ircode(global_source), 0).run() == 303
+
+@pytest.mark.parametrize('ssa', [False, True])
+def test_global_names_lazy(ssa):
+    assert LazyJIT(compile_ircode(global_source), ssa=ssa).run() == 303
+
+@pytest.mark.skipif(not shutil.which(c_compiler()), reason='no C compiler')
+@pytest.mark.parametrize('ssa', [False, True])
+def test_global_names_executable(tmpdir, ssa):
+    exe = os.path.join(str(tmpdir), 'scopes')
+    compile_executable(compile_llvm(global_source, ssa=ssa), exe)
+    result = subprocess.run([exe], stdout=subprocess.PIPE)
+    assert (result.returncode, result.stdout) == (303 % 256, global_output)
+
+def test_errors():
+    ast, session = check('''
+func main() int {
+    var a int = 1;
+    var a int = 2;
+    if a > 0 {
+        var a int = 3;
+        var b int = a;
+        var b int = 4;
+    }
+    print b;
+    return 0;
+}
+''')
+    assert session.error_messages() == [
+        '4: a already defined. Previous definition on line 3',
+        '8: b already defined. Previous definition on line 7',
+        '10: b undefined',
+        ]
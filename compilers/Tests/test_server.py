@@ -0,0 +1,134 @@
+# coding=utf-8
+#
+# Filename: test_server.py
+#
+# Tests for the compile server and its client.
+#
+# Run:  python3 -m pytest Tests/test_server.py
+
+import os
+import base64
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from goneref.client import request
+from goneref.server import CompileServer
+from goneref.llvmgen import compile_llvm
+from goneref.session import CompilationSession
+
+good = '''
+func main() int {
+    var n int = 0;
+    while n < 3 {
+        print n;
+        n = n + 1;
+    }
+    return 7;
+}
+'''
+
+bad = '''
+func main() int {
+    var x int = 2.5;
+    return 0;
+}
+'''
+
+@pytest.fixture
+def server(tmpdir):
+    path = str(tmpdir.join('server.sock'))
+    server = CompileServer(path, workers=2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    server.shutdown()
+    thread.join()
+    assert not os.path.exists(path)
+
+def test_requests(server):
+    response = request({ 'op' : 'llvm', 'source' : good }, server.path)
+    assert response['ok']
+    assert response['llvm'] == compile_llvm(good, session=CompilationSession())
+
+    response = request({ 'op' : 'obj', 'source' : good, 'options' : { 'opt_level' : 2 } }, server.path)
+    assert base64.b64decode(response['object'])[:4] == b'\x7fELF'
+
+    response = request({ 'op' : 'run', 'source' : good }, server.path)
+    assert response['output'] == '0\n1\n2\n'
+    assert response['result'] == 7
+
+    response = request({ 'op' : 'llvm', 'source' : bad, 'filename' : 'bad.g' }, server.path)
+    assert not response['ok']
+    assert response['diagnostics'] == ['bad.g:3: Type error int = float']
+
+    response = request({ 'op' : 'bogus' }, server.path)
+    assert not response['ok'] and 'bogus' in response['error']
+
+def test_concurrent_and_cached(server):
+    def compile_one(n):
+        source = bad if n % 2 else good.replace('7', str(n))
+        return request({ 'op' : 'llvm', 'source' : source }, server.path)
+
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(compile_one, range(20)))
+    assert [ response['ok'] for response in responses ] == [True, False] * 10
+    assert all(len(response['diagnostics']) == 1 for response in responses[1::2])
+
+    # Compiling the same source again is a cache hit
+    hits = request({ 'op' : 'ping' }, server.path)['cache_hits']
+    assert compile_one(1) == responses[1]
+    assert request({ 'op' : 'ping' }, server.path)['cache_hits'] == hits + 1
+
+def test_concurrent_objects(server):
+    # Each worker thread compiles in an LLVM context of its own
+    def compile_one(n):
+        source = good.replace('7', str(n))
+        return request({ 'op' : 'obj', 'source' : source, 'options' : { 'opt_level' : 2 } }, server.path)
+
+    with ThreadPoolExecutor(4) as pool:
+        responses = list(pool.map(compile_one, range(16)))
+    assert all(response['ok'] for response in responses)
+    assert all(base64.b64decode(response['object'])[:4] == b'\x7fELF' for response in responses)
+    assert compile_one(3) == responses[3]
+
+def test_time_limit(tmpdir):
+    path = str(tmpdir.join('server.sock'))
+    server = CompileServer(path, workers=1, time_limit=0.2)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        for loop in ('while true { }', 'for i in 0..2147483647 { }'):
+            source = 'func main() int {\n    print 1;\n    %s\n    return 0;\n}\n' % loop
+            response = request({ 'op' : 'run', 'source' : source }, path)
+            assert not response['ok']
+            assert response['error'] == 'Program ran for more than 0.2 seconds'
+        # The worker is free again
+        assert request({ 'op' : 'run', 'source' : good }, path)['result'] == 7
+    finally:
+        server.shutdown()
+        thread.join()
+
+def test_socket_in_use(server, tmpdir):
+    with pytest.raises(RuntimeError):
+        CompileServer(server.path, workers=1)
+    assert request({ 'op' : 'ping' }, server.path)['ok']
+
+    # A socket file nobody listens on is replaced
+    stale = str(tmpdir.join('stale.sock'))
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(stale)
+    other = CompileServer(stale, workers=1)
+    other.close()
+    assert not os.path.exists(stale)
+
+def test_shutdown_request(tmpdir):
+    path = str(tmpdir.join('server.sock'))
+    server = CompileServer(path, workers=1)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    assert request({ 'op' : 'shutdown' }, path)['ok']
+    thread.join()
+    assert not os.path.exists(path)
@@ -0,0 +1,63 @@
+# coding=utf-8
+#
+# Filename: test_session.py
+#
+# Tests for compilation sessions (isolated error reporting).
+#
+# Run:  python3 -m pytest Tests/test_session.py
+
+from concurrent.futures import ThreadPoolExecutor
+
+from goneref.errors import errors_reported, clear_errors
+from goneref.ircode import compile_ircode
+from goneref.llvmgen import compile_llvm
+from goneref.session import CompilationSession, current_session
+
+good = '''
+func main() int {
+    var x float = 2.5;
+    print x * 2.0;
+    return 0;
+}
+'''
+
+bad = '''
+func main() int {
+    var x int = 2.5;
+    print y;
+    return 0;
+}
+'''
+
+def test_errors_isolated():
+    clear_errors()
+    bad_session = CompilationSession(filename='bad.g', echo=False)
+    assert compile_ircode(bad, bad_session) == []
+    assert bad_session.errors_reported() == 2
+    assert bad_session.error_messages()[0].startswith('bad.g:3: ')
+
+    # Neither the default session nor a later session sees the errors
+    assert errors_reported() == 0
+    good_session = CompilationSession()
+    assert compile_ircode(good, good_session)
+    assert good_session.errors_reported() == 0
+    assert current_session() is not good_session
+
+def test_options_and_cache():
+    session = CompilationSession(options={'ssa': True})
+    llvm_code = compile_llvm(good, session=session)
+    assert session.cache['llvm'] == llvm_code
+    assert session.cache['ircode'] and session.cache['ast']
+    # In SSA mode, locals don't get stack slots
+    assert 'alloca' not in llvm_code
+    assert 'alloca' in compile_llvm(good, session=CompilationSession())
+
+def test_concurrent():
+    def compile_one(n):
+        session = CompilationSession(echo=False, cache=False)
+        compile_llvm(bad if n % 2 else good, session=session)
+        return session.errors_reported()
+
+    with ThreadPoolExecutor(4) as pool:
+        counts = list(pool.map(compile_one, range(40)))
+    assert counts == [0, 2] * 20
@@ -0,0 +1,34 @@
+# coding=utf-8
+#
+# Filename: test_synth.py
+#
+# Tests for the synthetic program generator.
+#
+# Run:  python3 -m pytest Tests/test_synth.py
+
+import pytest
+
+from goneref.synth import generate_program, parse_size
+from goneref.parser import parse
+from goneref.checker import check_program
+from goneref.errors import errors_reported, clear_errors
+
+@pytest.mark.parametrize('seed', range(20))
+def test_generated_programs_check(seed):
+    clear_errors()
+    source = generate_program(seed, functions=6, depth=3, expr_size=6)
+    check_program(parse(source))
+    assert errors_reported() == 0
+
+def test_same_seed_same_program():
+    assert generate_program(7) == generate_program(7)
+    assert generate_program(7) != generate_program(8)
+
+def test_target_size():
+    source = generate_program(1, functions=1, target_size=20000)
+    assert len(source) >= 20000
+
+def test_parse_size():
+    assert parse_size('100') == 100
+    assert parse_size('10KB') == 10 * 1024
+    assert parse_size('1.5mb') == 3 * 512 * 1024
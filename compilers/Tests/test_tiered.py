@@ -0,0 +1,114 @@
+# coding=utf-8
+#
+# Filename: test_tiered.py
+#
+# Tests for tiered execution (interpreter first, JIT for hot functions).
+#
+# Run:  python3 -m pytest Tests/test_tiered.py
+
+import io
+import os
+import sys
+import subprocess
+
+import pytest
+
+from goneref.errors import clear_errors
+from goneref.ircode import compile_ircode
+from goneref.tiered import TieredInterpreter
+
+source = '''
+var total int = 0;
+var scale float = 0.5;
+
+func add(x int) int {
+    total = total + x;
+    return total;
+}
+
+func positive(x int) bool {
+    return x > 0;
+}
+
+func half(x float) float {
+    return x * scale;
+}
+
+func loop(n int) int {
+    var i int = 0;
+    while i < n {
+        i = i + 1;
+    }
+    return i;
+}
+
+func main() int {
+    var i int = 0;
+    while i < 10 {
+        i = add(i) - total + i + 1;
+    }
+    if positive(-7 / 2) {
+        return 0;
+    }
+    return add(-7 / 2) + loop(20) + loop(1);
+}
+'''
+
+def make_interpreter(threshold, log=None):
+    clear_errors()
+    return TieredInterpreter(compile_ircode(source), threshold, log)
+
+@pytest.mark.parametrize('threshold', [0, 3, 1000])
+def test_same_result(threshold):
+    # 0+1+...+9 = 45, -7/2 rounds toward zero
+    assert make_interpreter(threshold).run() == 45 - 3 + 20 + 1
+
+@pytest.mark.parametrize('threshold', [0, 1000])
+def test_wrapping(capfd, threshold):
+    # Interpreted int arithmetic wraps at 32 bits like native code
+    clear_errors()
+    interpreter = TieredInterpreter(compile_ircode('''
+func f(n int) int {
+    var x int = 2147483647;
+    return x + n;
+}
+func g(n int) int {
+    var x int = -2147483647;
+    return -(x - n) + (x - n) * 3;
+}
+func main() int {
+    print f(2) / 2;
+    print g(1);
+    print -2147483647 * 2;
+    return 0;
+}
+'''), threshold)
+    assert interpreter.run() == 0
+    assert capfd.readouterr().out == '-1073741823\n0\n2\n'
+
+def test_promotions():
+    log = io.StringIO()
+    interpreter = make_interpreter(5, log)
+    interpreter.run()
+    promoted = [ name for name, calls, backedges, seconds in interpreter.promotions ]
+    # main() is hot after 1 call and 4 back-edges, add() after 5 calls
+    # and loop() during its first call
+    assert promoted == ['main', 'add', 'loop']
+    assert interpreter.calls['add'] == 5
+    assert interpreter.calls['loop'] == 1
+    assert 'tiered: promoted add after 5 calls' in log.getvalue()
+    # Globals are shared between the interpreter and native code
+    assert interpreter.globals['total'] == 45 - 3
+
+def test_arrays_fall_back(tmpdir):
+    # Programs with arrays run in the plain interpreter
+    path = tmpdir.join('arrays.g')
+    path.write('var a int[3];\nfunc main() int {\n    a[1] = 4;\n    print a[1];\n    return 0;\n}\n')
+    with pytest.raises(NotImplementedError):
+        TieredInterpreter(compile_ircode(path.read()), 0)
+    result = subprocess.run([sys.executable, '-m', 'goneref.tiered', str(path)],
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert result.returncode == 0
+    assert result.stdout == b'4\n'
+    assert result.stderr == b'gone.tiered: Tiered execution does not support arrays.  Running in the interpreter only.\n'
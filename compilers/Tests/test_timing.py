@@ -0,0 +1,58 @@
+# coding=utf-8
+#
+# Filename: test_timing.py
+#
+# Tests for the compiler phase timing support.
+#
+# Run:  python3 -m pytest Tests/test_timing.py
+
+import time
+
+from goneref.timing import time_passes, timing_enabled, enable_timing, disable_timing, \
+    phase, timings_reported
+
+source = '''
+const n = 10;
+func main() int {
+    var x int = n * 2;
+    print x;
+    return 0;
+}
+'''
+
+def test_ircode_phases():
+    timings = time_passes(source, stage='ircode')
+    assert list(timings) == ['lex', 'parse', 'check', 'ircode']
+    for rec in timings.values():
+        assert rec['wall'] >= 0.0
+        assert rec['cpu'] >= 0.0
+        assert rec['peak_memory'] >= 0
+        assert rec['calls'] == 1
+    assert not timing_enabled()
+
+def test_llvm_phases_without_memory():
+    timings = time_passes(source, stage='llvm', memory=False)
+    assert list(timings) == ['lex', 'parse', 'check', 'ircode', 'llvmgen']
+    assert timings['llvmgen']['peak_memory'] is None
+
+def test_nested_phases():
+    enable_timing()
+    try:
+        with phase('check'):
+            big = [ 0 ] * 500000
+            del big
+            with phase('ircode'):
+                time.sleep(0.1)
+                small = [ 0 ] * 1000
+            with phase('ircode'):
+                pass
+        timings = timings_reported()
+    finally:
+        disable_timing()
+    # The time of the inner phase is only charged to it
+    assert timings['ircode']['wall'] >= 0.1
+    assert timings['ircode']['calls'] == 2
+    assert timings['check']['wall'] < 0.1
+    # The inner phase doesn't hide the peak of the outer one
+    assert timings['check']['peak_memory'] >= 500000 * 8
+    assert timings['ircode']['peak_memory'] < 500000 * 8
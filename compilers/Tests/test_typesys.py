@@ -0,0 +1,46 @@
+# coding=utf-8
+#
+# Filename: test_typesys.py
+#
+# Tests for the type system (interned types and operator tables).
+#
+# Run:  python3 -m pytest Tests/test_typesys.py
+
+import pickle
+
+from goneref.parser import parse
+from goneref.checker import check_program
+from goneref.session import CompilationSession
+from goneref.typesys import lookup_type, lookup_binop, lookup_unaryop, check_binop, \
+    int_type, float_type, string_type, bool_type, error_type
+
+def test_interned():
+    assert lookup_type('int') is int_type
+    assert lookup_type('nothing') is None
+    assert str(float_type) == 'float'
+    assert [ ty.id for ty in (int_type, float_type, string_type, bool_type) ] == [0, 1, 2, 3]
+    assert pickle.loads(pickle.dumps(bool_type)) is bool_type
+    assert int_type.opcodes['load'] == 'load_int'
+
+def test_operators():
+    assert lookup_binop(int_type, '+', int_type) == (int_type, 'add_int')
+    assert lookup_binop(float_type, '<=', float_type) == (bool_type, 'le_float')
+    assert lookup_binop(bool_type, '&&', bool_type) == (bool_type, 'and_bool')
+    assert lookup_binop(int_type, '*', string_type) == (string_type, 'mul_int')
+    assert lookup_binop(int_type, '+', float_type) == (error_type, None)
+    assert lookup_binop(error_type, '+', int_type) == (error_type, None)
+    assert lookup_unaryop('-', float_type) == (float_type, 'usub_float')
+    assert lookup_unaryop('!', int_type) == (error_type, None)
+    assert check_binop(int_type, '==', int_type) is bool_type
+
+def test_checker_records_opcodes():
+    session = CompilationSession(echo=False)
+    ast = parse('var x float = -2.0 * 3.0;\nvar b bool = 1 < 2;\n', session)
+    check_program(ast, session)
+    assert session.error_messages() == []
+    first, second = ast.statements.statements
+    assert first.type is float_type
+    assert first.expr.opcode == 'mul_float'
+    assert first.expr.left.opcode == 'usub_float'
+    assert second.expr.opcode == 'lt_int'
+    assert second.type is bool_type
@@ -172,6 +172,12 @@ class ExternFunctionDeclaration(AST):
     '''
     _fields = ['prototype']
 
+class ImportDeclaration(AST):
+    '''
+    An import of a module compiled separately.  import geometry;
+    '''
+    _fields = ['name']
+
 # Conditions and while loops (Project 7)
 class IfElseStatement(AST):
     '''
@@ -185,6 +191,14 @@ class WhileStatement(AST):
     '''
     _fields = ['condition', 'statements']
 
+class ForStatement(AST):
+    '''
+    A counted loop: for name in start..stop by step { statements }.
+    step is None when not given (1).  The statement also declares the
+    loop variable name.
+    '''
+    _fields = ['name', 'start', 'stop', 'step', 'statements']
+
 # Functions (Project 8)
 class ReturnStatement(AST):
     '''
@@ -0,0 +1,177 @@
+# gone/batch.py
+'''
+Batch Compilation
+=================
+
+Compiling many source files with one run of llvmgen.py or compile.py
+per file pays for starting Python, importing the compiler (which builds
+the SLY lexer and parser tables) and initializing LLVM every time.
+This program compiles any number of files in a pool of worker
+processes.  Each worker does that setup once and then compiles file
+after file::
+
+    bash % python3 -m gone.batch -j 8 'src/**/*.g'
+    bash % python3 -m gone.batch --emit obj -O2 -o build/ a.g b.g c.g
+
+Arguments may be file names or glob patterns.  Each file is compiled in
+its own compilation session (see session.py).  The output (LLVM IR or
+an object file) is written next to the source or into the -o
+directory.  Errors are printed per file.  Files are processed and
+reported in the order given (glob matches are sorted), no matter which
+worker finishes first.
+'''
+
+import os
+import sys
+import glob
+from concurrent.futures import ProcessPoolExecutor
+
+# Per-process compiler state, set up by init_worker()
+_options = None
+_target_machine = None
+
+# Output file extension for each kind of output
+extensions = { 'llvm' : '.ll', 'obj' : '.o' }
+
+def init_worker(options):
+    '''
+    Set up a worker process: import the compiler and initialize LLVM
+    once, so that each file only pays for its own compilation
+    '''
+    global _options, _target_machine
+    from . import parser, checker, ircode, llvmgen
+    _options = options
+    if options['emit'] == 'obj':
+        from .run import create_target_machine
+        from .runtime import runtime_ir
+        _target_machine = create_target_machine(options['opt_level'], reloc='pic',
+                                                cpu=options['cpu'], features=options['features'],
+                                                codemodel='small')
+        runtime_ir()
+
+def compile_file(filename):
+    '''
+    Compile one file in a worker.  Returns (filename, output, messages),
+    where output is LLVM IR (a string) or object code (bytes), or
+    None if there were errors.
+    '''
+    from .llvmgen import compile_llvm
+    from .session import CompilationSession
+
+    session = CompilationSession(filename=filename, echo=False, cache=False)
+    try:
+        with open(filename) as f:
+            source = f.read()
+    except OSError as e:
+        return (filename, None, ['%s: %s' % (filename, e.strerror)])
+
+    try:
+        llvm_code = compile_llvm(source, _options['ssa'], _options['fast_math'], session)
+        if session.errors_reported():
+            return (filename, None, session.error_messages())
+        if _options['emit'] == 'llvm':
+            return (filename, llvm_code, [])
+
+        from .run import parse_module
+        mod = parse_module(llvm_code, _options['opt_level'], _target_machine)
+        return (filename, _target_machine.emit_object(mod), [])
+    except Exception as e:
+        # A bug in the compiler shouldn't stop the rest of the batch
+        return (filename, None, session.error_messages() +
+                ['%s: internal compiler error: %s: %s' % (filename, type(e).__name__, e)])
+
+def expand_sources(patterns):
+    '''
+    Turn a list of file names and glob patterns into a list of file
+    names.  Matches of each pattern are sorted.  Duplicates are dropped.
+    '''
+    filenames = []
+    seen = set()
+    for pattern in patterns:
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern, recursive=True))
+        else:
+            matches = [ pattern ]
+        for filename in matches:
+            if filename not in seen:
+                seen.add(filename)
+                filenames.append(filename)
+    return filenames
+
+def compile_batch(filenames, jobs=None, emit='llvm', opt_level=0, ssa=False, fast_math=False,
+                  cpu=None, features=None):
+    '''
+    Compile a list of files in jobs worker processes (default: one per
+    CPU).  emit is 'llvm' or 'obj'.  Returns a list of (filename,
+    output, messages) in the same order as filenames.
+    '''
+    if emit not in extensions:
+        raise ValueError('Bad output kind %r' % emit)
+    options = { 'emit' : emit, 'opt_level' : opt_level, 'ssa' : ssa, 'fast_math' : fast_math,
+                'cpu' : cpu, 'features' : features }
+    jobs = jobs or os.cpu_count()
+    if jobs == 1 or len(filenames) <= 1:
+        init_worker(options)
+        return [ compile_file(filename) for filename in filenames ]
+
+    # Hand out work in chunks to keep the number of round trips down
+    chunksize = max(1, len(filenames) // (jobs * 4))
+    with ProcessPoolExecutor(jobs, initializer=init_worker, initargs=(options,)) as pool:
+        return list(pool.map(compile_file, filenames, chunksize=chunksize))
+
+def output_filename(filename, emit, outdir=None):
+    base = os.path.splitext(filename)[0] + extensions[emit]
+    if outdir is not None:
+        base = os.path.join(outdir, os.path.basename(base))
+    return base
+
+def main():
+    import argparse
+    from .run import opt_levels
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.batch')
+    argparser.add_argument('sources', nargs='+', help='source files or glob patterns')
+    argparser.add_argument('--emit', choices=sorted(extensions), default='llvm',
+                           help='write LLVM IR (.ll) or object files (.o)')
+    argparser.add_argument('-o', dest='outdir', default=None,
+                           help='output directory (default: next to each source)')
+    argparser.add_argument('-j', dest='jobs', type=int, default=None,
+                           help='number of worker processes (default: one per CPU)')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=opt_levels, default=0,
+                           help='LLVM optimization level (for object files)')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--cpu', default=None,
+                           help='target CPU name (default: the host CPU, or "generic")')
+    argparser.add_argument('--features', default=None,
+                           help='target CPU features such as "+avx2,+fma" (default: those of the host CPU, or none with --cpu)')
+    args = argparser.parse_args()
+
+    filenames = expand_sources(args.sources)
+    if args.outdir is not None:
+        outputs = [ output_filename(filename, args.emit, args.outdir) for filename in filenames ]
+        if len(set(outputs)) != len(outputs):
+            argparser.error('source files with the same name can not share an output directory')
+        os.makedirs(args.outdir, exist_ok=True)
+
+    results = compile_batch(filenames, args.jobs, args.emit, args.opt_level, args.ssa,
+                            args.fast_math, args.cpu, args.features)
+    failed = 0
+    for filename, output, messages in results:
+        for message in messages:
+            print(message, file=sys.stderr)
+        if output is None:
+            failed += 1
+            continue
+        mode = 'w' if args.emit == 'llvm' else 'wb'
+        with open(output_filename(filename, args.emit, args.outdir), mode) as f:
+            f.write(output)
+
+    print('%d files compiled, %d failed' % (len(results) - failed, failed), file=sys.stderr)
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,7 @@ basic blocks.  You need to write all of the code needed yourself.
 See Exercise 7.
 '''
 
-__all__ = [ 'BasicBlock', 'IfBlock', 'WhileBlock', 'BlockVisitor', 'PrintBlocks' ]
+__all__ = [ 'BasicBlock', 'IfBlock', 'WhileBlock', 'ForBlock', 'BlockVisitor', 'PrintBlocks' ]
 
 class Block(object):
     '''
@@ -53,6 +53,22 @@ class WhileBlock(Block):
         self.body = None
         self.testvar = None
 
+class ForBlock(WhileBlock):
+    '''
+    Class for representing a counted loop.  The variable var goes from
+    the value of start up to (but not including) the value of stop,
+    adding the constant step each time.  With a negative step, it
+    counts down to stop.  start and stop are computed once, before
+    the block.  testvar names the test made on every trip around the
+    loop (the instructions of the block are empty).
+    '''
+    def __init__(self):
+        super(ForBlock,self).__init__()
+        self.var = None
+        self.start = None
+        self.stop = None
+        self.step = 1
+
 class BlockVisitor(object):
     '''
     Class for visiting basic blocks.  Define a subclass and define
@@ -85,3 +101,9 @@ class PrintBlocks(BlockVisitor):
         self.visit_BasicBlock(block)
         self.visit(block.body)
 
+    def visit_ForBlock(self, block):
+        print('Block:[%s] for %s in %s..%s by %d' % (block, block.var, block.start,
+                                                      block.stop, block.step))
+        print('')
+        self.visit(block.body)
+
@@ -0,0 +1,375 @@
+# gone/bench.py
+'''
+Benchmark Runner
+================
+
+This program measures how long Gone programs take to compile and to
+run on each of the available execution engines:
+
+    interp       The IR interpreter (interp.py)
+    tiered       The interpreter, compiling hot functions (tiered.py)
+    jit-O0..O3   The LLVM JIT at each optimization level (run.py)
+    jit-ssa-O0..O3  The same, with SSA code generation (llvmgen.py --ssa)
+    aot          A standalone executable (compile.py)
+
+Compile time and run time are measured separately.  Each measurement
+is repeated several times after a number of warmup runs that are
+thrown away.  Program output is discarded.
+
+To run the standard benchmarks (fib.g, fact.g and mandel.g in the
+Programs/ directory) and save the results::
+
+    bash % python3 -m gone.bench -o results.json
+
+Specific programs, engines and synthetic workloads can be chosen::
+
+    bash % python3 -m gone.bench --engines jit-O0,jit-O3 Tests/mandel.g
+    bash % python3 -m gone.bench --synthetic loop --size 100000
+
+The 'generated' synthetic workload is a random program from synth.py
+whose size (in bytes) is given by --size.
+
+Two result files (for example, from two different commits) can be
+compared.  Any benchmark that got slower by more than the threshold
+is reported and the exit status is non-zero::
+
+    bash % python3 -m gone.bench --compare old.json new.json --threshold 0.10
+'''
+
+import os
+import sys
+import json
+import time
+import ctypes
+import shutil
+import platform
+import statistics
+import subprocess
+import tempfile
+from contextlib import contextmanager
+
+_path = os.path.dirname(__file__)
+
+# Default benchmark programs
+default_programs = [ os.path.join(_path, '..', 'Programs', name)
+                     for name in ('fib.g', 'fact.g', 'mandel.g') ]
+
+# Parameterized synthetic workloads.  {n} is replaced by the size.
+synthetic_workloads = {
+    'loop' : '''
+func main() int {
+    var i int = 0;
+    var s int = 0;
+    while i < {n} {
+        s = s + i;
+        if s > 1000000 {
+            s = s - 1000000;
+        }
+        i = i + 1;
+    }
+    print s;
+    return 0;
+}
+''',
+    'floatloop' : '''
+func main() int {
+    var i int = 0;
+    var x float = 0.0;
+    while i < {n} {
+        x = x * 0.5 + 1.0;
+        i = i + 1;
+    }
+    print x;
+    return 0;
+}
+''',
+    'calls' : '''
+func add(x int, y int) int {
+    return x + y;
+}
+
+func main() int {
+    var i int = 0;
+    var s int = 0;
+    while i < {n} {
+        s = add(s, 1);
+        i = i + 1;
+    }
+    print s;
+    return 0;
+}
+''',
+}
+
+def make_synthetic(workload, size):
+    '''
+    Make the source code for a synthetic workload of a given size.  The
+    'generated' workload is a random program (see synth.py) of about
+    size bytes.
+    '''
+    if workload == 'generated':
+        from .synth import generate_program
+        return generate_program(seed=0, target_size=size)
+    return synthetic_workloads[workload].replace('{n}', str(size))
+
+all_engines = [ 'interp', 'tiered', 'jit-O0', 'jit-O1', 'jit-O2', 'jit-O3',
+                'jit-ssa-O0', 'jit-ssa-O1', 'jit-ssa-O2', 'jit-ssa-O3', 'aot' ]
+
+def available_engines():
+    '''
+    Return the list of engines that can be used on this machine
+    '''
+    engines = [ 'interp' ]
+    try:
+        import llvmlite
+    except ImportError:
+        return engines
+    if os.path.exists(os.path.join(_path, 'gonert.so')):
+        engines.append('tiered')
+        engines.extend(engine for engine in all_engines if engine.startswith('jit-'))
+    from .compile import c_compiler
+    if shutil.which(c_compiler()):
+        engines.append('aot')
+    return engines
+
+@contextmanager
+def discard_output():
+    '''
+    Send everything written to stdout (from Python or C) to /dev/null
+    '''
+    libc = ctypes.CDLL(None)
+    sys.stdout.flush()
+    saved_fd = os.dup(1)
+    saved_stdout = sys.stdout
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = saved_stdout
+        libc.fflush(None)
+        os.dup2(saved_fd, 1)
+        os.close(saved_fd)
+        os.close(devnull)
+
+# Each engine is a pair of functions.  compile(source) returns an
+# object that is passed to execute() to run the program once.
+
+def compile_interp(source):
+    from .ircode import compile_ircode
+    return compile_ircode(source)
+
+def execute_interp(functions):
+    from .interp import run
+    run(functions)
+
+def execute_tiered(functions):
+    from .tiered import run
+    run(functions)
+
+def compile_jit(source, opt_level, ssa=False):
+    from .llvmgen import compile_llvm
+    from .run import compile_jit
+    engine = compile_jit(compile_llvm(source, ssa), opt_level)
+    init_func = ctypes.CFUNCTYPE(None)(engine.get_function_address('__init'))
+    main_func = ctypes.CFUNCTYPE(ctypes.c_int)(engine.get_function_address('_gone_main'))
+    return (engine, init_func, main_func)
+
+def execute_jit(compiled):
+    from .run import flush_output
+    engine, init_func, main_func = compiled
+    init_func()
+    main_func()
+    flush_output()
+
+def compile_aot(source, tmpdir):
+    from .llvmgen import compile_llvm
+    from .compile import compile_executable
+    exe = os.path.join(tmpdir, 'bench.exe')
+    compile_executable(compile_llvm(source), exe)
+    return exe
+
+def execute_aot(exe):
+    subprocess.run([exe], stdout=subprocess.DEVNULL, check=False)
+
+def summarize(times):
+    return {
+        'min' : min(times),
+        'median' : statistics.median(times),
+        'mean' : statistics.mean(times),
+        'stdev' : statistics.stdev(times) if len(times) > 1 else 0.0,
+        'times' : times,
+    }
+
+def bench_program(name, source, engine, repeat=5, warmup=1):
+    '''
+    Benchmark a single program on a single engine.  Returns a dict of
+    compile and run time statistics (in seconds).
+    '''
+    from .errors import errors_reported, clear_errors
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if engine == 'interp':
+            compile_func, execute_func = compile_interp, execute_interp
+        elif engine == 'tiered':
+            compile_func, execute_func = compile_interp, execute_tiered
+        elif engine.startswith('jit-'):
+            ssa = engine.startswith('jit-ssa-')
+            opt_level = int(engine[-1])
+            compile_func = lambda source: compile_jit(source, opt_level, ssa)
+            execute_func = execute_jit
+        elif engine == 'aot':
+            compile_func = lambda source: compile_aot(source, tmpdir)
+            execute_func = execute_aot
+        else:
+            raise ValueError('Unknown engine %r' % engine)
+
+        compile_times = []
+        run_times = []
+        for n in range(warmup + repeat):
+            clear_errors()
+            start = time.perf_counter()
+            compiled = compile_func(source)
+            compile_time = time.perf_counter() - start
+            if errors_reported():
+                raise RuntimeError('%s failed to compile' % name)
+
+            with discard_output():
+                start = time.perf_counter()
+                execute_func(compiled)
+                run_time = time.perf_counter() - start
+
+            if n >= warmup:
+                compile_times.append(compile_time)
+                run_times.append(run_time)
+
+    return {
+        'program' : name,
+        'engine' : engine,
+        'compile' : summarize(compile_times),
+        'run' : summarize(run_times),
+    }
+
+def run_benchmarks(programs, engines, repeat=5, warmup=1, log=sys.stderr):
+    '''
+    Benchmark a list of (name, source) programs on each engine.
+    Returns a dict suitable for saving as JSON.
+    '''
+    results = []
+    for name, source in programs:
+        for engine in engines:
+            result = bench_program(name, source, engine, repeat, warmup)
+            if log:
+                print('%-30s %-8s compile %9.4fs  run %9.4fs' % (
+                    name, engine, result['compile']['median'], result['run']['median']),
+                      file=log)
+            results.append(result)
+
+    return {
+        'metadata' : {
+            'timestamp' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit' : git_commit(),
+            'python' : platform.python_version(),
+            'platform' : platform.platform(),
+            'repeat' : repeat,
+            'warmup' : warmup,
+        },
+        'results' : results,
+    }
+
+def git_commit():
+    '''
+    Return the current git commit hash (if any)
+    '''
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=_path,
+                                       stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_results(old, new, threshold=0.10):
+    '''
+    Compare two sets of benchmark results.  Returns a list of tuples
+    (program, engine, measure, old_time, new_time, ratio) for every
+    median time that is more than threshold slower in new.
+    '''
+    old_results = { (r['program'], r['engine']): r for r in old['results'] }
+    regressions = []
+    for r in new['results']:
+        key = (r['program'], r['engine'])
+        if key not in old_results:
+            continue
+        for measure in ('compile', 'run'):
+            old_time = old_results[key][measure]['median']
+            new_time = r[measure]['median']
+            ratio = new_time / old_time if old_time else 1.0
+            if ratio > 1.0 + threshold:
+                regressions.append(key + (measure, old_time, new_time, ratio))
+    return regressions
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.bench')
+    argparser.add_argument('programs', nargs='*', help='Gone source files to benchmark')
+    argparser.add_argument('--engines', default=None,
+                           help='comma separated list of engines (default: all available)')
+    argparser.add_argument('--synthetic', default=None,
+                           help='comma separated list of synthetic workloads (%s, generated)' % ', '.join(synthetic_workloads))
+    argparser.add_argument('--size', type=int, default=100000,
+                           help='size parameter for synthetic workloads')
+    argparser.add_argument('--repeat', type=int, default=5, help='number of timed runs')
+    argparser.add_argument('--warmup', type=int, default=1, help='number of untimed warmup runs')
+    argparser.add_argument('-o', '--output', help='write JSON results to this file')
+    argparser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                           help='compare two JSON result files')
+    argparser.add_argument('--threshold', type=float, default=0.10,
+                           help='allowed slowdown when comparing (default 0.10 = 10%%)')
+    args = argparser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        regressions = compare_results(old, new, args.threshold)
+        for program, engine, measure, old_time, new_time, ratio in regressions:
+            print('REGRESSION %s %s %s: %.4fs -> %.4fs (%+.1f%%)' % (
+                program, engine, measure, old_time, new_time, 100.0 * (ratio - 1.0)))
+        if regressions:
+            raise SystemExit(1)
+        print('No regressions over %.1f%%' % (100.0 * args.threshold))
+        return
+
+    if args.engines:
+        engines = args.engines.split(',')
+        for engine in engines:
+            if engine not in all_engines:
+                argparser.error('Unknown engine %s' % engine)
+    else:
+        engines = available_engines()
+
+    programs = []
+    if args.synthetic:
+        for workload in args.synthetic.split(','):
+            if workload not in synthetic_workloads and workload != 'generated':
+                argparser.error('Unknown synthetic workload %s' % workload)
+            source = make_synthetic(workload, args.size)
+            programs.append(('synthetic:%s(n=%d)' % (workload, args.size), source))
+    filenames = args.programs or ([] if args.synthetic else default_programs)
+    for filename in filenames:
+        with open(filename) as f:
+            programs.append((os.path.basename(filename), f.read()))
+
+    results = run_benchmarks(programs, engines, args.repeat, args.warmup)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+# gone/bounds.py
+'''
+Bounds Check Elimination
+========================
+
+Every array access is checked against the length of the array unless
+this pass can show that the index is always in range.  The checker
+marks each LoadArray and StoreArray node with checked = True.  For
+each function, this pass clears the flag of accesses such as a[i] in::
+
+    var i int = 0;
+    while i < len(a) {
+        total = total + a[i];
+        i = i + 1;
+    }
+
+The index is in range when all of these hold:
+
+1.  i is a local int variable, and it is never negative.  This is the
+    case when every assignment to i (in the whole function) stores a
+    constant >= 0, or adds a constant >= 0 to i.
+
+2.  The test of an enclosing while loop is i < B (or B > i), possibly
+    combined with other tests by &&.  B is len(a), or a constant no
+    bigger than the length of a fixed-size array a.
+
+3.  i can't overflow.  Every statement adding to i is in the body of
+    that loop (and not in a loop nested in it), and the constants
+    added come to at most max_array_length.  An array has at most
+    max_array_length elements, so i stays below 2**31.
+
+4.  The access comes before any statement of the loop body that
+    assigns to i.
+
+The variable of a for loop can't be assigned, and the range is
+computed once, so a[i] in the body of::
+
+    for i in 0..len(a) { ... }
+
+is in range when the loop counts up from a constant >= 0 to len(a),
+or to a constant (or the length of another fixed-size array) no
+bigger than the length of a fixed-size array a.
+Counting down (with a negative step), the loop must start at
+len(a) - c (c >= 1), or at a constant below the fixed length, and
+stop at a constant >= -1.
+
+An index that is a constant in range of a fixed-size array isn't
+checked either.  To see which accesses are checked::
+
+    bash % python3 -m gone.bounds program.g
+'''
+
+from .ast import *
+from .checker import constant_value
+from .typesys import int_type, max_array_length
+
+def array_length(decl):
+    '''
+    Return the length of a fixed-size array declaration, or None
+    '''
+    if isinstance(decl, VarDeclaration) and isinstance(decl.typename, ArrayType):
+        return decl.typename.length
+    return None
+
+class IndexVariables(NodeVisitor):
+    '''
+    Finds the local int variables of a function that are never
+    negative (see rule 1 above).  For each, records the innermost loop
+    around every statement adding to it and the sum of the constants
+    added.
+    '''
+    def __init__(self):
+        # {declaration: (set of loops, total added)} of the candidates
+        self.increments = {}
+        self.rejected = set()
+        self.loops = [None]
+
+    def visit_VarDeclaration(self, node):
+        if node.type == int_type and not node.is_global:
+            value = constant_value(node.expr) if node.expr else 0
+            if value is not None and value >= 0:
+                self.increments[node] = (set(), 0)
+                return
+        self.rejected.add(node)
+
+    def visit_WhileStatement(self, node):
+        self.loops.append(node)
+        self.visit(node.statements)
+        self.loops.pop()
+
+    visit_ForStatement = visit_WhileStatement
+
+    def visit_AssignmentStatement(self, node):
+        decl = getattr(node.store_location, 'sym', None)
+        if not isinstance(node.store_location, StoreVariable) or decl not in self.increments:
+            return
+        value = constant_value(node.expr)
+        if value is not None and value >= 0:
+            return
+        step = increment(node.expr, decl)
+        if step is None:
+            self.rejected.add(decl)
+        else:
+            loops, total = self.increments[decl]
+            self.increments[decl] = (loops | { self.loops[-1] }, total + step)
+
+    def counters(self, loop):
+        '''
+        Return the variables that are never negative and can't
+        overflow while loop runs (rules 1 and 3)
+        '''
+        return { decl for decl, (loops, total) in self.increments.items()
+                 if decl not in self.rejected and loops <= { loop } and total <= max_array_length }
+
+def increment(expr, decl):
+    '''
+    If expr is decl + c (or c + decl) with a constant c >= 0, return c
+    '''
+    if not isinstance(expr, Binop) or expr.op != '+':
+        return None
+    for var, step in ((expr.left, expr.right), (expr.right, expr.left)):
+        if isinstance(var, LoadVariable) and var.sym is decl:
+            value = constant_value(step)
+            if value is not None and 0 <= value <= max_array_length:
+                return value
+    return None
+
+def length_of(expr):
+    '''
+    If expr is len(a), return the declaration of a
+    '''
+    if (isinstance(expr, FunctionCall) and expr.builtin == 'len' and
+        isinstance(expr.arglist[0], LoadVariable)):
+        return expr.arglist[0].sym
+    return None
+
+def loop_bounds(condition, counters):
+    '''
+    Return {declaration of i: [bounds]} for the tests i < B in a loop
+    condition (rule 2).  A bound is ('len', array declaration) or
+    ('const', value).
+    '''
+    if isinstance(condition, Binop) and condition.op == '&&':
+        bounds = loop_bounds(condition.left, counters)
+        for decl, found in loop_bounds(condition.right, counters).items():
+            bounds.setdefault(decl, []).extend(found)
+        return bounds
+    if isinstance(condition, Binop) and condition.op in ('<', '>'):
+        var, bound = condition.left, condition.right
+        if condition.op == '>':
+            var, bound = bound, var
+        if isinstance(var, LoadVariable) and var.sym in counters:
+            if length_of(bound):
+                return { var.sym: [('len', length_of(bound))] }
+            value = constant_value(bound)
+            if value is not None:
+                return { var.sym: [('const', value)] }
+    return {}
+
+def in_bounds(bounds, decl):
+    '''
+    Return True if one of bounds is at most the length of the array decl
+    '''
+    for kind, bound in bounds:
+        if kind == 'len' and bound is decl:
+            return True
+        length = array_length(decl)
+        if kind == 'const' and length is not None and bound <= length:
+            return True
+    return False
+
+def constant_bound(expr):
+    '''
+    Return the value of expr if it's a constant, or the length of a if
+    it's len(a) of a fixed-size array a (else None)
+    '''
+    value = constant_value(expr)
+    if value is None and length_of(expr):
+        value = array_length(length_of(expr))
+    return value
+
+def range_in_bounds(loop, decl):
+    '''
+    Return True if every value of the variable of a for loop is an
+    index of the array decl
+    '''
+    length = array_length(decl)
+    if loop.step_value > 0:
+        # start <= i < stop
+        first = constant_value(loop.start)
+        if first is None or first < 0:
+            return False
+        last = constant_bound(loop.stop)
+        return length_of(loop.stop) is decl or (last is not None and length is not None and
+                                                 last <= length)
+    else:
+        # stop < i <= start
+        last = constant_value(loop.stop)
+        if last is None or last < -1:
+            return False
+        start = loop.start
+        if isinstance(start, Binop) and start.op == '-' and length_of(start.left) is decl:
+            offset = constant_value(start.right)
+            return offset is not None and offset >= 1
+        first = constant_bound(start)
+        return first is not None and length is not None and first < length
+
+def assigned(node):
+    '''
+    Return the declarations of the variables assigned to in a statement
+    '''
+    return { getattr(child, 'sym', None) for depth, child in flatten(node)
+             if isinstance(child, StoreVariable) }
+
+def accesses(node):
+    return [ child for depth, child in flatten(node) if isinstance(child, (LoadArray, StoreArray)) ]
+
+def remove_bounds_checks(function):
+    '''
+    Clear node.checked on the array accesses of a FunctionDeclaration
+    whose index is always in range
+    '''
+    variables = IndexVariables()
+    variables.visit(function.statements)
+
+    # Constant indexes of fixed-size arrays
+    for access in accesses(function.statements):
+        index = constant_value(access.index)
+        length = array_length(access.sym)
+        if index is not None and length is not None and 0 <= index < length:
+            access.checked = False
+
+    # Counting loops
+    for depth, loop in flatten(function.statements):
+        if not isinstance(loop, WhileStatement):
+            continue
+        bounds = loop_bounds(loop.condition, variables.counters(loop))
+        for stmt in (loop.statements.statements if loop.statements else []):
+            for decl in assigned(stmt):
+                bounds.pop(decl, None)
+            if not bounds:
+                break
+            for access in accesses(stmt):
+                index = access.index
+                if (isinstance(index, LoadVariable) and index.sym in bounds and
+                    in_bounds(bounds[index.sym], access.sym)):
+                    access.checked = False
+
+    # For loops
+    for depth, loop in flatten(function.statements):
+        if not isinstance(loop, ForStatement):
+            continue
+        for access in accesses(loop.statements):
+            index = access.index
+            if (isinstance(index, LoadVariable) and index.sym is loop and
+                range_in_bounds(loop, access.sym)):
+                access.checked = False
+
+def main():
+    '''
+    Report which array accesses of a program are checked
+    '''
+    import argparse
+    from .parser import parse
+    from .checker import check_program
+    from .errors import errors_reported
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.bounds')
+    argparser.add_argument('filename')
+    args = argparser.parse_args()
+
+    ast = parse(open(args.filename).read())
+    check_program(ast)
+    if errors_reported():
+        return
+    for depth, node in flatten(ast):
+        if isinstance(node, FunctionDeclaration):
+            remove_bounds_checks(node)
+            for access in accesses(node.statements):
+                print('%d: %s[...] %s' % (access.lineno, access.name,
+                                          'checked' if access.checked else 'not checked'))
+
+if __name__ == '__main__':
+    main()
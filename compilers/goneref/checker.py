@@ -171,34 +171,150 @@ It's not always clear how to best organize all of that.  So, expect to
 fumble around a bit at first.
 '''
 
+import os
+import sys
+import gc
+
 from .errors import error
 from .ast import *
-from .typesys import check_binop, check_unaryop, builtin_types, error_type, bool_type
+from .typesys import lookup_binop, lookup_unaryop, evaluate, builtin_types, error_type, bool_type, \
+    int_type, float_type, array_type, max_array_length
+from .timing import phase
+from .session import using_session, current_session
+
+def constant_value(node):
+    '''
+    Return the value of an expression that only uses literals and
+    constants with known values, or None
+    '''
+    if isinstance(node, Literal):
+        return node.value
+    elif isinstance(node, LoadVariable):
+        return node.value
+    elif isinstance(node, Unaryop) and node.opcode:
+        value = constant_value(node.expr)
+        return evaluate(node.opcode, value) if value is not None else None
+    elif isinstance(node, Binop) and node.opcode:
+        left = constant_value(node.left)
+        right = constant_value(node.right)
+        if left is None or right is None:
+            return None
+        return evaluate(node.opcode, left, right)
+    return None
+
+def is_array(type):
+    '''
+    Return True if type is an array type
+    '''
+    return type is not error_type and type.element is not None
+
+class Symbol(object):
+    '''
+    A name declared in a scope.  depth is the nesting depth of the
+    scope: 0 for globals, 1 for the parameters and top-level variables
+    of a function, 2 and up for the bodies of if, while and for statements.
+    slot numbers the globals, or the variables of one function, in the
+    order they are declared.  Slots aren't reused within a function, so
+    a variable shadowing another gets its own.
+    '''
+    __slots__ = ('name', 'node', 'depth', 'slot')
+
+    def __init__(self, name, node, depth, slot):
+        self.name = name
+        self.node = node
+        self.depth = depth
+        self.slot = slot
 
 class SymbolTable(object):
     '''
-    Class representing a symbol table.   For now, this is just a dictionary
-    that maps names to AST nodes.  There is some extra functionality to
-    report errors.
+    Class representing a symbol table: a chain of nested scopes.  Each
+    name maps to a stack of the symbols declared with that name in the
+    scopes open right now, innermost last.  Looking up a name is one
+    dictionary access however deeply scopes are nested.  When a scope
+    ends, the names it declared are popped off their stacks.
     '''
     def __init__(self):
         self.symbols = {}
 
+        # Names declared in each open scope (the first is the global scope)
+        self.scopes = [[]]
+
+        # Next free slot for globals and for the current function
+        self.next_slot = [0]
+
+    @property
+    def depth(self):
+        return len(self.scopes) - 1
+
+    def push_scope(self, function=False):
+        '''
+        Open a new scope.  A function scope starts numbering slots from 0.
+        '''
+        self.scopes.append([])
+        if function:
+            self.next_slot.append(0)
+
+    def pop_scope(self, function=False):
+        for name in self.scopes.pop():
+            stack = self.symbols[name]
+            stack.pop()
+            if not stack:
+                del self.symbols[name]
+        if function:
+            self.next_slot.pop()
+
     def add(self, name, node):
         '''
-        Add a new symbol to the table or report an error if already defined.
+        Add a new symbol to the current scope or report an error if
+        already defined there.  Returns the Symbol (or None).
         '''
-        if name in self.symbols:
+        stack = self.symbols.setdefault(name, [])
+        if stack and stack[-1].depth == self.depth:
             error(node.lineno, '%s already defined. Previous definition on line %s' % 
-                  (name, getattr(self.symbols[name], 'lineno', '<unknown>')))
-        else:
-            self.symbols[name] = node
+                  (name, getattr(stack[-1].node, 'lineno', '<unknown>')))
+            return None
+        sym = Symbol(name, node, self.depth, self.next_slot[-1])
+        self.next_slot[-1] += 1
+        stack.append(sym)
+        self.scopes[-1].append(name)
+        return sym
+
+    def resolve(self, name):
+        '''
+        Return the innermost Symbol for a name (or None).
+        '''
+        stack = self.symbols.get(name)
+        return stack[-1] if stack else None
 
     def lookup(self, name):
         '''
         Lookup and return the node associated with a symbol (or None).
         '''
-        return self.symbols.get(name)
+        stack = self.symbols.get(name)
+        return stack[-1].node if stack else None
+
+    def lookup_global(self, name):
+        '''
+        Return the node a name is bound to in the global scope (or None)
+        '''
+        stack = self.symbols.get(name)
+        return stack[0].node if stack and stack[0].depth == 0 else None
+
+    def global_symbols(self, count=None):
+        '''
+        Return the symbols of the global scope in the order they were
+        declared (only the first count, if given)
+        '''
+        return [ self.symbols[name][0] for name in self.scopes[0][:count] ]
+
+    def declare(self, sym):
+        '''
+        Add a symbol made by another SymbolTable to the current scope,
+        keeping its slot
+        '''
+        self.symbols.setdefault(sym.name, []).append(sym)
+        self.scopes[-1].append(sym.name)
+        self.next_slot[-1] = max(self.next_slot[-1], sym.slot + 1)
 
 class CheckProgramVisitor(NodeVisitor):
     '''
@@ -207,36 +323,48 @@ class CheckProgramVisitor(NodeVisitor):
     for each kind of AST node that you want to process.
     '''
     def __init__(self):
-        # Two-level scoping
-        self.global_symtab = SymbolTable()
-        self.local_symtab = None
+        # Nested scopes (see SymbolTable)
+        self.symtab = SymbolTable()
         self.current_function = None
 
+        # Module loader used when the session has none, and the modules
+        # whose init functions the program runs (see modules.py)
+        self.modules = None
+        self.initialized = set()
+
+        # If a list, function bodies aren't checked but added to it with
+        # the number of global symbols they can see and the number of
+        # errors reported before them (see check_parallel())
+        self.deferred = None
+
         # Add built-in type names (int, float, string) to the symbol table
         for ty in builtin_types:
-            self.symtab_add(ty, ty)
+            self.symtab_add(ty.name, ty)
 
-    # Method for adding a symbol to the appropriate symbol table
+    # Method for adding a symbol to the current scope.  Declarations
+    # are marked with where they were put: node.resolved = (depth, slot)
     def symtab_add(self, name, node):
-        if self.local_symtab:
-            self.local_symtab.add(name, node)
-        else:
-            self.global_symtab.add(name, node)
+        sym = self.symtab.add(name, node)
+        if sym and isinstance(node, AST):
+            node.resolved = (sym.depth, sym.slot)
 
-    # Method for looking up a symbol (checks both symbol tables)
+    # Method for looking up a symbol (innermost scope first)
     def symtab_lookup(self, name):
-        result = None
-        if self.local_symtab:
-            result = self.local_symtab.lookup(name)
-        if result is None:
-            result = self.global_symtab.lookup(name)
-        return result
+        return self.symtab.lookup(name)
+
+    # Method for looking up a variable.  The node using it is marked
+    # with where the variable is (see symtab_add())
+    def resolve_variable(self, node):
+        sym = self.symtab.resolve(node.name)
+        node.resolved = (sym.depth, sym.slot) if sym else None
+        return sym.node if sym else None
 
     def visit_Unaryop(self, node):
         # 1. Make sure that the operation is supported by the type
         # 2. Set the result type to the same as the operand
+        # 3. Record the IR opcode for the operation
         self.visit(node.expr)
-        node.type = check_unaryop(node.op, node.expr.type)
+        node.type, node.opcode = lookup_unaryop(node.op, node.expr.type)
         if (node.expr.type != error_type and
             node.type == error_type):
             error(node.lineno, 'Type error: %s %s' % (node.op, node.expr.type))
@@ -245,9 +373,10 @@ class CheckProgramVisitor(NodeVisitor):
         # 1. Make sure left and right operands have the same type
         # 2. Make sure the operation is supported
         # 3. Assign the result type
+        # 4. Record the IR opcode for the operation
         self.visit(node.left)
         self.visit(node.right)
-        node.type = check_binop(node.left.type, node.op, node.right.type)
+        node.type, node.opcode = lookup_binop(node.left.type, node.op, node.right.type)
         if (node.left.type != error_type and
             node.right.type != error_type and
             node.type == error_type):
@@ -258,7 +387,18 @@ class CheckProgramVisitor(NodeVisitor):
         # 2. Check the number of arguments
         # 3. Check the argument types for a match
         symnode = self.symtab_lookup(node.name)
-        if symnode:
+        node.builtin = None
+        if symnode is None and node.name == 'len':
+            # Builtin len(array), unless the program defines len itself
+            node.builtin = 'len'
+            for arg in node.arglist:
+                self.visit(arg)
+            if len(node.arglist) != 1:
+                error(node.lineno, 'len expected 1 argument. Got %d.' % len(node.arglist))
+            elif node.arglist[0].type != error_type and not is_array(node.arglist[0].type):
+                error(node.lineno, 'Type error. len() needs an array')
+            node.type = int_type
+        elif symnode:
             if not isinstance(symnode, FunctionPrototype):
                 error(node.lineno, '%s not a function' % node.name)
                 node.type = error_type
@@ -291,9 +431,19 @@ class CheckProgramVisitor(NodeVisitor):
 
     def visit_ConstDeclaration(self, node):
         # 1. Check that the constant name is not already defined
-        # 2. Add an entry to the symbol table
+        # 2. Compute the value of an int, float or bool constant, if it
+        #    only depends on literals and other constants (node.value
+        #    is None otherwise).  String constants keep their storage.
+        # 3. Add an entry to the symbol table
         self.visit(node.expr)
         node.type = node.expr.type
+        if node.type in (int_type, float_type, bool_type):
+            node.value = constant_value(node.expr)
+        else:
+            node.value = None
+        if is_array(node.type):
+            error(node.lineno, 'Type error. %s can\'t be an array constant' % node.name)
+            node.type = error_type
         self.symtab_add(node.name, node)
         node.is_global = False if self.current_function else True
 
@@ -304,7 +454,14 @@ class CheckProgramVisitor(NodeVisitor):
         # 4. If there is no expression, set an initial value for the value
         self.visit(node.typename)
         node.type = node.typename.type
-        if node.expr:
+        if isinstance(node.typename, ArrayType):
+            # 5. Arrays need a size and start out filled with zeros
+            if node.typename.size is None:
+                error(node.lineno, 'Array %s needs a size' % node.name)
+            if node.expr:
+                error(node.lineno, 'Array %s can\'t be initialized' % node.name)
+                self.visit(node.expr)
+        elif node.expr:
             self.visit(node.expr)
             if (node.expr.type != node.type and 
                 node.expr.type != error_type): 
@@ -314,8 +471,11 @@ class CheckProgramVisitor(NodeVisitor):
 
     def visit_ParmDeclaration(self, node):
         # 1. Visit the typename and propagate types
+        # 2. Array parameters take arrays of any size
         self.visit(node.typename)
         node.type = node.typename.type
+        if isinstance(node.typename, ArrayType) and node.typename.size is not None:
+            error(node.lineno, 'Array parameter %s can\'t have a size. Use %s' % (node.name, node.type))
 
     def visit_FunctionPrototype(self, node):
         # 1. Make sure the function name is not already defined
@@ -326,7 +486,37 @@ class CheckProgramVisitor(NodeVisitor):
             self.visit(parm)
         self.visit(node.typename)
         node.type = node.typename.type
+        if is_array(node.type):
+            error(node.lineno, 'Function %s can\'t return an array' % node.name)
         self.symtab_add(node.name, node)
+
+    def visit_ExternFunctionDeclaration(self, node):
+        # 1. Check the prototype
+        # 2. Arrays can't be passed to external functions
+        self.visit(node.prototype)
+        for parm in node.prototype.parameters:
+            if is_array(parm.type):
+                error(parm.lineno, 'Array parameter %s not allowed in extern function' % parm.name)
+
+    def visit_ArrayType(self, node):
+        # 1. Make sure the element type is int, float or bool
+        # 2. Check the size (if any) and compute it if it is a constant.
+        #    node.length is None for arrays allocated at run time.
+        self.visit(node.typename)
+        node.type = array_type(node.typename.type)
+        if node.typename.type != error_type and node.type is None:
+            error(node.lineno, 'Arrays of %s not supported' % node.typename.type)
+            node.type = error_type
+        node.length = None
+        if node.size is not None:
+            self.visit(node.size)
+            if node.size.type != int_type:
+                if node.size.type != error_type:
+                    error(node.lineno, 'Array size must be int')
+            else:
+                node.length = constant_value(node.size)
+                if node.length is not None and not 0 <= node.length <= max_array_length:
+                    error(node.lineno, 'Bad array size %d' % node.length)
     
     def visit_Typename(self, node):
         # 1. Make sure the typename is valid and that it's actually a type
@@ -344,10 +534,14 @@ class CheckProgramVisitor(NodeVisitor):
     def visit_LoadVariable(self, node):
         # 1. Make sure the location is a valid variable or constant value
         # 2. Assign the type of the location to the node
-        sym = self.symtab_lookup(node.name)
+        sym = self.resolve_variable(node)
+        node.value = None
         if sym:
-            if isinstance(sym, (ConstDeclaration, VarDeclaration, ParmDeclaration)):
+            if isinstance(sym, (ConstDeclaration, VarDeclaration, ParmDeclaration, ForStatement)):
                 node.type = sym.type
+                if isinstance(sym, ConstDeclaration):
+                    # The value of the constant, if known
+                    node.value = sym.value
             else:
                 error(node.lineno, '%s not a valid location' % node.name)
                 node.type = error_type
@@ -360,13 +554,19 @@ class CheckProgramVisitor(NodeVisitor):
     def visit_StoreVariable(self, node):
         # 1. Make sure the location can be assigned
         # 2. Assign the appropriate type
-        sym = self.symtab_lookup(node.name)
+        sym = self.resolve_variable(node)
         if sym:
             if isinstance(sym, (VarDeclaration, ParmDeclaration)):
                 node.type = sym.type
+                if is_array(sym.type):
+                    error(node.lineno, 'Type error. Can\'t assign to array %s' % node.name)
+                    node.type = error_type
             elif isinstance(sym, ConstDeclaration):
                 error(node.lineno, 'Type error. %s is constant' % node.name)
                 node.type = sym.type
+            elif isinstance(sym, ForStatement):
+                error(node.lineno, 'Type error. Can\'t assign to loop variable %s' % node.name)
+                node.type = sym.type
             else:
                 error(node.lineno, '%s not a valid location' % node.name)
                 node.type = error_type
@@ -375,6 +575,35 @@ class CheckProgramVisitor(NodeVisitor):
             node.type = error_type
         node.sym = sym
         
+    def visit_LoadArray(self, node):
+        # 1. Make sure the location is an array
+        # 2. Check that the index is an int
+        # 3. The type is the element type.  Accesses are bounds checked
+        #    unless bounds.py finds that the index is always in range.
+        sym = self.resolve_variable(node)
+        self.visit(node.index)
+        if node.index.type != int_type and node.index.type != error_type:
+            error(node.lineno, 'Type error. Array index must be int')
+        if sym is None:
+            error(node.lineno, '%s undefined' % node.name)
+            node.type = error_type
+        elif not (isinstance(sym, (VarDeclaration, ParmDeclaration)) and is_array(sym.type)):
+            error(node.lineno, '%s is not an array' % node.name)
+            node.type = error_type
+        else:
+            node.type = sym.type.element
+        node.sym = sym
+        node.checked = True
+
+    visit_StoreArray = visit_LoadArray
+
+    def visit_PrintStatement(self, node):
+        # 1. Visit the expression
+        # 2. Arrays can't be printed
+        self.visit(node.expr)
+        if is_array(node.expr.type):
+            error(node.lineno, 'Type error. Can\'t print an array')
+
     def visit_Literal(self, node):
         # Lookup the literal typename in the symbol table to get the type object
         # Note: the typename is set implicitly in the parser. 
@@ -387,8 +616,8 @@ class CheckProgramVisitor(NodeVisitor):
         self.visit(node.condition)
         if node.condition.type != bool_type:
             error(node.lineno, 'Conditional expression must evaluate to bool')
-        self.visit(node.if_statements)
-        self.visit(node.else_statements)
+        self.visit_block(node.if_statements)
+        self.visit_block(node.else_statements)
 
     def visit_WhileStatement(self, node):
         # 1. Check if the conditional expression evaluates to a boolean
@@ -396,7 +625,40 @@ class CheckProgramVisitor(NodeVisitor):
         self.visit(node.condition)
         if node.condition.type != bool_type:
             error(node.lineno, 'Conditional expression must evaluate to bool')
+        self.visit_block(node.statements)
+
+    def visit_ForStatement(self, node):
+        # 1. Check that the range is int.  It's evaluated once, before
+        #    the loop starts.
+        # 2. The step must be a nonzero constant, so the direction of
+        #    the loop is known (node.step_value)
+        # 3. Declare the loop variable in the scope of the body.  The
+        #    node itself is its declaration.  It can't be assigned.
+        self.visit(node.start)
+        self.visit(node.stop)
+        for expr in (node.start, node.stop):
+            if expr.type != int_type and expr.type != error_type:
+                error(node.lineno, 'Type error. Loop range must be int')
+        node.step_value = 1
+        if node.step:
+            self.visit(node.step)
+            node.step_value = constant_value(node.step)
+            if node.step.type != int_type or not node.step_value:
+                if node.step.type != error_type:
+                    error(node.lineno, 'Loop step must be a nonzero int constant')
+                node.step_value = 1
+        node.type = int_type
+        node.is_global = False if self.current_function else True
+        self.symtab.push_scope()
+        self.symtab_add(node.name, node)
         self.visit(node.statements)
+        self.symtab.pop_scope()
+
+    def visit_block(self, statements):
+        # The body of an if or while statement is a scope of its own
+        self.symtab.push_scope()
+        self.visit(statements)
+        self.symtab.pop_scope()
 
     # Function call support
     def visit_ReturnStatement(self, node):
@@ -409,11 +671,51 @@ class CheckProgramVisitor(NodeVisitor):
             self.visit(node.expr)
             if node.expr.type != self.current_function.prototype.type:
                 error(node.lineno, 'Type error in return.  %s != %s' % (
-                        node.expr.type.name,
-                        self.current_function.prototype.type.name
+                        node.expr.type,
+                        self.current_function.prototype.type
                         )
                       )
 
+    # Modules (see modules.py)
+    def visit_ImportDeclaration(self, node):
+        # 1. Make sure the import is at the top level
+        # 2. Load the interface of the module (building the module if needed)
+        # 3. Add the names the module exports to the symbol table
+        # 4. In a program, note the modules whose init functions must run
+        node.declarations = []
+        node.init_modules = []
+        if self.current_function:
+            error(node.lineno, 'import must be at the top level')
+            return
+        session = current_session()
+        modules = session.modules
+        if modules is None:
+            # Look for modules next to the file being checked
+            if self.modules is None:
+                from .modules import ModuleLoader
+                directory = os.path.dirname(session.filename) if session.filename else ''
+                self.modules = ModuleLoader([directory or '.'])
+            modules = self.modules
+        interface = modules.load(node.name, node.lineno)
+        if interface is None:
+            return
+
+        node.declarations = interface.declarations(node.lineno)
+        for decl in node.declarations:
+            if isinstance(decl, (ConstDeclaration, VarDeclaration)):
+                # Declared, and given a value or size, in the module
+                self.visit(decl.typename)
+                decl.type = decl.typename.type
+                decl.is_global = True
+                self.symtab_add(decl.name, decl)
+            else:
+                self.visit(decl)
+
+        if 'module' not in session.options:
+            node.init_modules = [ name for name in modules.init_order(node.name)
+                                  if name not in self.initialized ]
+            self.initialized.update(node.init_modules)
+
     # Function declaration
     def visit_FunctionDeclaration(self, node):
         # 1. Check to make sure not nested function
@@ -426,41 +728,290 @@ class CheckProgramVisitor(NodeVisitor):
             error(node.lineno, 'Nested functions not supported.')
         else:
             self.visit(node.prototype)
-            self.local_symtab = SymbolTable()
-            self.current_function = node
+            if self.deferred is not None:
+                self.deferred.append((node, len(self.symtab.scopes[0]),
+                                      current_session().errors_reported()))
+            else:
+                self.check_function_body(node)
+
+    def check_function_body(self, node):
+        self.symtab.push_scope(function=True)
+        self.current_function = node
 
-            # Process the function parameters
-            for parm in node.prototype.parameters:
-                self.symtab_add(parm.name, parm)
+        # Process the function parameters
+        for parm in node.prototype.parameters:
+            self.symtab_add(parm.name, parm)
 
-            self.visit(node.statements)
-            self.local_symtab = None
-            self.current_function = None
+        self.visit(node.statements)
+        self.symtab.pop_scope(function=True)
+        self.current_function = None
 
 # ----------------------------------------------------------------------
 #                       DO NOT MODIFY ANYTHING BELOW       
 # ----------------------------------------------------------------------
 
-def check_program(ast):
+def check_program(ast, session=None, jobs=None):
+    '''
+    Check the supplied program (in the form of an AST).  Errors are
+    reported to session (see session.py), if given.  With jobs (by
+    default, the 'check_jobs' option of the session), function bodies are
+    checked in that many processes (see check_parallel()).
     '''
-    Check the supplied program (in the form of an AST)
+    with using_session(session) as session:
+        if jobs is None:
+            jobs = session.options.get('check_jobs')
+        with phase('check'):
+            if jobs and jobs > 1:
+                check_parallel(ast, session, jobs)
+            else:
+                checker = CheckProgramVisitor()
+                checker.visit(ast)
+
+# Parallel checking
+#
+# Once the global declarations and function prototypes have been
+# checked, the body of each function can be checked on its own.  A body
+# sees the global names declared before its function (including the
+# function itself), and those never change.  check_parallel() makes a
+# first pass over the program that checks everything except function
+# bodies.  For each function, it notes how many global symbols it can
+# see.  The bodies are then split into chunks and checked in a pool of
+# processes.
+#
+# Copying the tree between processes costs more than checking it, so
+# neither direction does.  The workers are forked after the first pass
+# and inherit the tree (with other start methods, each worker gets a
+# pickled copy once).  A worker doesn't send back the checked bodies,
+# only the attributes the checker set on their nodes, with each node
+# given by its position in tree_nodes().  Attributes referring to other
+# nodes (node.sym) are sent as positions too: of a node in the same
+# function, or of a global symbol.  Errors are merged so they come out
+# in the same order as when checking one function after another.
+
+def tree_nodes(node):
     '''
+    Return the nodes of a tree, parents before their children
+    '''
+    nodes = []
+    append = nodes.append
+    def walk(node):
+        append(node)
+        for field in node._fields:
+            value = getattr(node, field, None)
+            if isinstance(value, AST):
+                walk(value)
+            elif isinstance(value, list):
+                for item in value:
+                    if isinstance(item, AST):
+                        walk(item)
+    walk(node)
+    return nodes
+
+def node_annotations(node, global_positions):
+    '''
+    Return the attributes the checker set on the nodes of node (any
+    but the fields and lineno) as two lists.  The first has (position
+    in tree_nodes(), attributes) for attributes that aren't nodes.  The
+    second has (position, name, reference) for those that are, where
+    reference is the position of a node in the same tree, or
+    global_positions[id(n)] for the node n of a global symbol.
+    '''
+    nodes = tree_nodes(node)
+    positions = { id(item): n for n, item in enumerate(nodes) }
+    annotations = []
+    references = []
+    for n, item in enumerate(nodes):
+        changed = {}
+        for name, value in vars(item).items():
+            if name == 'lineno' or name in item._fields:
+                continue
+            if isinstance(value, AST):
+                references.append((n, name, positions.get(id(value), global_positions.get(id(value)))))
+            else:
+                changed[name] = value
+        if changed:
+            annotations.append((n, changed))
+    return annotations, references
+
+def apply_annotations(node, annotations, symbols):
+    '''
+    Set the attributes found by node_annotations() on the nodes of node.
+    Global symbol n is referred to as -1 - n.
+    '''
+    nodes = tree_nodes(node)
+    changed, references = annotations
+    for n, attributes in changed:
+        nodes[n].__dict__.update(attributes)
+    for n, name, ref in references:
+        setattr(nodes[n], name, nodes[ref] if ref >= 0 else symbols[-1 - ref].node)
+
+def check_function_bodies(symbols, functions, filename, options, annotate=True):
+    '''
+    Check the bodies of functions.  symbols are global Symbols, functions
+    a list of (number of symbols visible, FunctionDeclaration).  Returns
+    a list of (diagnostics, annotations), one per function (see
+    node_annotations()).  With annotate=False, annotations is None.
+    '''
+    from .session import CompilationSession
+
+    session = CompilationSession(filename=filename, options=options, echo=False, cache=False)
+    checker = CheckProgramVisitor()
+    checker.symtab = SymbolTable()
+    global_positions = { id(sym.node): -1 - n for n, sym in enumerate(symbols) }
+    declared = 0
+    results = []
+    with session.active():
+        for count, node in functions:
+            for sym in symbols[declared:count]:
+                checker.symtab.declare(sym)
+            declared = max(declared, count)
+            start = len(session.diagnostics)
+            checker.check_function_body(node)
+            results.append((session.diagnostics[start:],
+                            node_annotations(node, global_positions) if annotate else None))
+    return results
+
+# The global symbols and deferred functions of a worker process
+_worker = {}
+
+def start_worker(symbols, functions):
+    '''
+    Initialize a worker process.  Workers only live while checking, so
+    the cyclic garbage collector is turned off.  It would otherwise
+    spend more time looking at the tree than checking it.
+    '''
+    gc.disable()
+    _worker['symbols'] = symbols
+    _worker['functions'] = functions
+
+def check_chunk(start, end, filename, options):
+    '''
+    Check the bodies of functions[start:end] in a worker process
+    '''
+    functions = _worker['functions'][start:end]
+    return check_function_bodies(_worker['symbols'][:functions[-1][0]], functions,
+                                 filename, options)
+
+def split_chunks(functions, count):
+    '''
+    Split a list of (visible symbols, FunctionDeclaration) into at most
+    count runs of consecutive functions with about the same number of
+    source lines
+    '''
+    sizes = []
+    for n, (visible, node) in enumerate(functions):
+        end = functions[n+1][1].lineno if n + 1 < len(functions) else node.lineno + 1
+        sizes.append(max(end - node.lineno, 1))
+    target = sum(sizes) / count
+    chunks = [[]]
+    total = 0
+    for item, size in zip(functions, sizes):
+        if chunks[-1] and total >= target * len(chunks):
+            chunks.append([])
+        chunks[-1].append(item)
+        total += size
+    return chunks
+
+def free_threaded():
+    '''
+    Return True if Python runs without the GIL (threads run in parallel)
+    '''
+    return not getattr(sys, '_is_gil_enabled', lambda: True)()
+
+def check_parallel(ast, session, jobs):
+    '''
+    Check a program, checking function bodies in jobs processes (or
+    threads, on a free-threaded Python)
+    '''
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    from .session import CompilationSession
+
+    # Pass 1: everything except function bodies.  Errors are collected in
+    # a session of their own, to be merged with those of the bodies.
+    first = CompilationSession(filename=session.filename, options=session.options,
+                               echo=False, cache=False, modules=session.modules)
     checker = CheckProgramVisitor()
-    checker.visit(ast)
+    checker.deferred = []
+    with first.active():
+        checker.visit(ast)
+
+    # Pass 2: function bodies
+    functions = [ (visible, node) for node, visible, position in checker.deferred ]
+    results = []
+    if functions:
+        symbols = checker.symtab.global_symbols()
+        chunks = split_chunks(functions, jobs)
+        if free_threaded():
+            # The threads check the tree itself
+            with ThreadPoolExecutor(min(jobs, len(chunks))) as pool:
+                futures = [ pool.submit(check_function_bodies, symbols[:chunk[-1][0]], chunk,
+                                        session.filename, session.options, False)
+                            for chunk in chunks ]
+                results = [ diagnostics for future in futures
+                            for diagnostics, annotations in future.result() ]
+        else:
+            # Forked workers share the tree with this process
+            context = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                context = multiprocessing.get_context('fork')
+            pool = ProcessPoolExecutor(min(jobs, len(chunks)), mp_context=context,
+                                       initializer=start_worker, initargs=(symbols, functions))
+            # The results are many small objects, none of them garbage
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                with pool:
+                    futures = []
+                    start = 0
+                    for chunk in chunks:
+                        futures.append(pool.submit(check_chunk, start, start + len(chunk),
+                                                   session.filename, session.options))
+                        start += len(chunk)
+                    for future in futures:
+                        for (visible, node), (diagnostics, annotations) in \
+                                zip(functions[len(results):], future.result()):
+                            apply_annotations(node, annotations, symbols)
+                            results.append(diagnostics)
+            finally:
+                if enabled:
+                    gc.enable()
+
+    # Report errors in order.  The errors of a body go after those
+    # reported before it in pass 1.
+    bodies = [ [] for n in range(len(first.diagnostics) + 1) ]
+    for (node, visible, position), diagnostics in zip(checker.deferred, results):
+        bodies[position].extend(diagnostics)
+    for n in range(len(first.diagnostics) + 1):
+        for filename, lineno, message in bodies[n]:
+            session.error(lineno, message, filename)
+        if n < len(first.diagnostics):
+            filename, lineno, message = first.diagnostics[n]
+            session.error(lineno, message, filename)
 
 def main():
     '''
     Main program. Used for testing
     '''
-    import sys
+    import argparse
     from .parser import parse
-
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.checker filename\n')
-        raise SystemExit(1)
-
-    ast = parse(open(sys.argv[1]).read())
-    check_program(ast)
+    from .timing import enable_timing, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.checker')
+    argparser.add_argument('filename')
+    argparser.add_argument('-j', dest='jobs', type=int, default=None,
+                           help='check function bodies in this many processes')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
+
+    ast = parse(open(args.filename).read())
+    check_program(ast, jobs=args.jobs)
+
+    if args.time_passes:
+        print_timings()
 
 if __name__ == '__main__':
     main()
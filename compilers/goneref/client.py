@@ -0,0 +1,133 @@
+# gone/client.py
+'''
+Compile Server Client
+=====================
+
+A small client for the compile server (server.py).  It imports nothing
+from the compiler itself, so it starts quickly::
+
+    bash % python3 -m gone.client llvm foo.g > foo.ll
+    bash % python3 -m gone.client obj -O2 foo.g -o foo.o
+    bash % python3 -m gone.client run foo.g
+    bash % python3 -m gone.client shutdown
+
+Use - as the file name to send source text from stdin instead of a
+path.  Errors in the program are printed on stderr and the exit status
+is 1.
+
+Protocol
+--------
+Each connection carries one request and one response.  A message is a
+4-byte big-endian length followed by that many bytes of UTF-8 JSON.  A
+request is an object with an 'op' ('llvm', 'obj', 'run', 'ping' or
+'shutdown'), the program as either 'path' or 'source', an optional
+'filename' for error messages and optional 'options' (opt_level, ssa,
+fast_math).  The response always has 'ok' and 'diagnostics' (a list of
+error messages) plus 'llvm' (a string), 'object' (base64) or 'output'
+and 'result' depending on the op.  'error' describes a request that
+failed for reasons other than errors in the program.
+'''
+
+import os
+import sys
+import json
+import socket
+import struct
+
+# Largest message accepted (in bytes)
+max_message_size = 1 << 30
+
+def default_socket_path():
+    '''
+    Return the socket path from $GONE_SERVER_SOCKET, or a per-user
+    default in the temporary directory
+    '''
+    return os.environ.get('GONE_SERVER_SOCKET') or os.path.join(
+        os.environ.get('TMPDIR', '/tmp'), 'gone-server-%d.sock' % os.getuid())
+
+def send_message(sock, message):
+    data = json.dumps(message).encode('utf-8')
+    sock.sendall(struct.pack('>I', len(data)) + data)
+
+def recv_exactly(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+def recv_message(sock):
+    size, = struct.unpack('>I', recv_exactly(sock, 4))
+    if size > max_message_size:
+        raise ValueError('Message too large (%d bytes)' % size)
+    return json.loads(recv_exactly(sock, size).decode('utf-8'))
+
+def request(message, path=None):
+    '''
+    Send one request to the server listening on path and return its response
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or default_socket_path())
+        send_message(sock, message)
+        return recv_message(sock)
+
+def main():
+    import argparse
+    import base64
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.client')
+    argparser.add_argument('op', choices=['llvm', 'obj', 'run', 'ping', 'shutdown'])
+    argparser.add_argument('filename', nargs='?', help='source file, or - for stdin')
+    argparser.add_argument('-o', dest='output', default=None,
+                           help='output file (default: stdout, or a.o for obj)')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=[0, 1, 2, 3], default=0,
+                           help='LLVM optimization level')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--socket', default=None,
+                           help='server socket (default: %s)' % default_socket_path())
+    args = argparser.parse_intermixed_args()
+
+    message = { 'op' : args.op,
+                'options' : { 'opt_level' : args.opt_level, 'ssa' : args.ssa,
+                              'fast_math' : args.fast_math } }
+    if args.op in ('llvm', 'obj', 'run'):
+        if args.filename is None:
+            argparser.error('%s needs a source file' % args.op)
+        if args.filename == '-':
+            message['source'] = sys.stdin.read()
+            message['filename'] = '<stdin>'
+        else:
+            message['path'] = os.path.abspath(args.filename)
+            message['filename'] = args.filename
+
+    response = request(message, args.socket)
+    for diagnostic in response.get('diagnostics', []):
+        print(diagnostic, file=sys.stderr)
+    if 'error' in response:
+        print('gone.client: %s' % response['error'], file=sys.stderr)
+    if not response['ok']:
+        raise SystemExit(1)
+
+    if args.op == 'llvm':
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(response['llvm'])
+        else:
+            sys.stdout.write(response['llvm'])
+    elif args.op == 'obj':
+        with open(args.output or 'a.o', 'wb') as f:
+            f.write(base64.b64decode(response['object']))
+    elif args.op == 'run':
+        sys.stdout.write(response['output'])
+        print('Program Returned: %s' % response['result'])
+    elif args.op == 'ping':
+        print(json.dumps(response, indent=2, sort_keys=True))
+
+if __name__ == '__main__':
+    main()
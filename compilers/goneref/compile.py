@@ -1,30 +1,189 @@
 # gone/compile.py
 #
-# Compiles Gone code to a standalone executable using Clang.
+# Compiles Gone code to a standalone executable.
+#
+# Machine code is generated in-process by LLVM and written out as an
+# object file.  The runtime library (gonert.c) is compiled once into
+# an object file that is cached in the user's cache directory and
+# reused for every build.  The only external program that runs for a typical
+# build is the system linker (through the C compiler driver, which
+# knows where the C library and startup files live).  With -c, no
+# external program runs at all.
 
 import subprocess
+import hashlib
+import glob
 import sys
-import os.path
+import os
 import tempfile
 
 from .llvmgen import compile_llvm
-from .errors import errors_reported
+from .timing import phase
+
+_path = os.path.dirname(__file__)
+
+# Source of the runtime library
+_rtlib = os.path.join(_path, 'gonert.c')
+
+# C compiler driver used to build the runtime and to link
+def c_compiler():
+    return os.environ.get('CC', 'cc')
+
+_rtflags = ['-DNEED_MAIN', '-O2', '-fPIC']
+
+def cache_directory():
+    '''
+    Return the directory for files cached between builds
+    ($XDG_CACHE_HOME/gone, or ~/.cache/gone), creating it if needed
+    '''
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    path = os.path.join(base, 'gone')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def runtime_object():
+    '''
+    Return the filename of the compiled runtime library, building it
+    first if needed.  The object file name includes a hash of the
+    runtime source and build flags so it is rebuilt whenever they
+    change.  Building it removes the objects built from older versions.
+    '''
+    with open(_rtlib, 'rb') as f:
+        key = hashlib.sha1(f.read())
+    key.update(' '.join([c_compiler()] + _rtflags).encode('utf-8'))
+    cachedir = cache_directory()
+    objname = os.path.join(cachedir, 'gonert-%s.o' % key.hexdigest()[:16])
+    if not os.path.exists(objname):
+        # Build under a temporary name so a concurrent build never sees a partial file
+        fd, tmpname = tempfile.mkstemp(prefix='gonert-', suffix='.tmp', dir=cachedir)
+        os.close(fd)
+        try:
+            subprocess.check_output([c_compiler()] + _rtflags + ['-c', _rtlib, '-o', tmpname])
+            os.replace(tmpname, objname)
+        finally:
+            if os.path.exists(tmpname):
+                os.remove(tmpname)
+        for oldname in glob.glob(os.path.join(cachedir, 'gonert-*.o')):
+            if oldname != objname:
+                try:
+                    os.remove(oldname)
+                except OSError:
+                    # Removed by another build
+                    pass
+    return objname
 
-# Name of the runtime library
-_rtlib = os.path.join(os.path.dirname(__file__), 'gonert.c')
+def compile_object(llvm_code, opt_level=0, cpu=None, features=None):
+    '''
+    Compile LLVM IR (a string) into native object code.  Returns the
+    contents of the object file as bytes.  By default, the code is
+    tuned for the host CPU.  Use cpu='generic' for a portable (and
+    reproducible) build.
+    '''
+    from .run import create_target_machine, parse_module
+    # Position independent code, so it can be linked into a PIE executable
+    target_machine = create_target_machine(opt_level, reloc='pic', cpu=cpu, features=features,
+                                           codemodel='small')
+    mod = parse_module(llvm_code, opt_level, target_machine)
+    with phase('codegen'):
+        return target_machine.emit_object(mod)
+
+def link_executable(objects, output='a.out'):
+    '''
+    Link object files with the runtime library into an executable
+    '''
+    rtobj = runtime_object()
+    with phase('link'):
+        subprocess.check_output([c_compiler()] + list(objects) + [rtobj, '-lm', '-o', output])
+
+def compile_executable(llvm_code, output='a.out', opt_level=0, cpu=None, features=None,
+                       objects=()):
+    '''
+    Compile LLVM IR (a string) into a standalone executable.  objects
+    is a list of other object files (such as imported modules) to link.
+    '''
+    obj = compile_object(llvm_code, opt_level, cpu, features)
+    with tempfile.NamedTemporaryFile(suffix='.o') as f:
+        f.write(obj)
+        f.flush()
+        link_executable([f.name] + list(objects), output)
+
+def compile_executable_parallel(functions, output='a.out', jobs=None, opt_level=0, ssa=False,
+                                fast_math=False, cpu=None, features=None, objects=()):
+    '''
+    Compile intermediate code functions into a standalone executable
+    using several processes (see parallel.py).  objects is a list of
+    other object files to link.
+    '''
+    from .parallel import compile_parallel
+    parts = compile_parallel(functions, jobs, opt_level, ssa, fast_math, cpu, features)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        filenames = []
+        for n, obj in enumerate(parts):
+            filenames.append(os.path.join(tmpdir, 'part%d.o' % n))
+            with open(filenames[-1], 'wb') as f:
+                f.write(obj)
+        link_executable(filenames + list(objects), output)
 
 def main():
-    if len(sys.argv) != 2:
-        sys.stderr.write("Usage: python3 -m gone.compile filename\n")
-        raise SystemExit(1)
-
-    source = open(sys.argv[1]).read()
-    llvm_code = compile_llvm(source)
-    if not errors_reported():
-        with tempfile.NamedTemporaryFile(suffix='.ll') as f:
-            f.write(llvm_code.encode('utf-8'))
-            f.flush()
-            subprocess.check_output(['clang', '-DNEED_MAIN', f.name, _rtlib])
+    import argparse
+    from .modules import ModuleLoader
+    from .run import opt_levels
+    from .session import CompilationSession
+    from .timing import enable_timing, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.compile')
+    argparser.add_argument('filename')
+    argparser.add_argument('-o', dest='output', default=None,
+                           help='output file (default: a.out, or a.o with -c)')
+    argparser.add_argument('-c', dest='object_only', action='store_true',
+                           help='write an object file and do not link')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=opt_levels, default=0,
+                           help='LLVM optimization level')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--cpu', default=None,
+                           help='target CPU name (default: the host CPU, or "generic")')
+    argparser.add_argument('--features', default=None,
+                           help='target CPU features such as "+avx2,+fma" (default: those of the host CPU, or none with --cpu)')
+    argparser.add_argument('-j', dest='jobs', type=int, default=None,
+                           help='compile in this many processes (see parallel.py)')
+    argparser.add_argument('-I', dest='module_path', action='append', default=[],
+                           help='directory to search for imported modules (see modules.py)')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
+
+    source = open(args.filename).read()
+    modules = ModuleLoader([os.path.dirname(args.filename) or '.'] + args.module_path,
+                           opt_level=args.opt_level, ssa=args.ssa, fast_math=args.fast_math,
+                           cpu=args.cpu, features=args.features)
+    session = CompilationSession(modules=modules, cache=False)
+    if args.jobs and not args.object_only:
+        from .ircode import compile_ircode
+        functions = compile_ircode(source, session)
+        if not session.errors_reported():
+            compile_executable_parallel(functions, args.output or 'a.out', args.jobs, args.opt_level,
+                                        args.ssa, args.fast_math, args.cpu, args.features,
+                                        modules.objects())
+        if args.time_passes:
+            print_timings()
+        return
+
+    llvm_code = compile_llvm(source, args.ssa, args.fast_math, session)
+    if not session.errors_reported():
+        if args.object_only:
+            with open(args.output or 'a.o', 'wb') as f:
+                f.write(compile_object(llvm_code, args.opt_level, args.cpu, args.features))
+        else:
+            compile_executable(llvm_code, args.output or 'a.out', args.opt_level,
+                               args.cpu, args.features, modules.objects())
+
+    if args.time_passes:
+        print_timings()
 
 if __name__ == '__main__':
     main()
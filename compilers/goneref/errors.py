@@ -22,37 +22,28 @@ errors reported so far.  Different stages of the compiler might use
 this to decide whether or not to keep processing or not.
 
 Use clear_errors() to clear the total number of errors.
-'''
 
-import sys
+Errors are reported to the current compilation session (see
+session.py).  Unless a session has been made active, that's a single
+default session shared by the whole process.
+'''
 
-_num_errors = 0
+from .session import current_session
 
 def error(lineno, message, filename=None):
     '''
     Report a compiler error to all subscribers
     '''
-    global _num_errors
-    if not filename:
-        errmsg = "{}: {}".format(lineno, message)
-    else:
-        errmsg = "{}:{}: {}".format(filename,lineno,message)
-
-    print(errmsg, file=sys.stderr)
-    _num_errors += 1
+    current_session().error(lineno, message, filename)
 
 def errors_reported():
     '''
     Return number of errors reported
     '''
-    return _num_errors
+    return current_session().errors_reported()
 
 def clear_errors():
     '''
     Clear the total number of errors reported.
     '''
-    global _num_errors
-    _num_errors = 0
-    
-    
-
+    current_session().clear_errors()
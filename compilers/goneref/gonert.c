@@ -1,26 +1,210 @@
 /* gonert.c
 
-   This file contains runtime support functions for the Gone language 
+   This file contains runtime support functions for the Gone language
    as well as boot-strapping code related to getting the main program
    to run.
+
+   All output goes through a buffer owned by the runtime instead of
+   the C library's stdio (which locks the stream on every call).  The
+   buffer is written out when it fills up, when _gone_flush() is
+   called (Gone code can call it as "extern func flush() int;"), and
+   when the program exits.  If standard output is a terminal, the
+   buffer is also written out at the end of each line.
+
+   The buffer variables are not static.  runtime.py defines versions
+   of _print_int, _print_bool and _gone_putchar in LLVM IR that write
+   into the same buffer, so that LLVM can inline them into Gone code.
+   runtime.py reads the value of GONE_OUTBUF_SIZE from this file.
 */
 
 #include <stdio.h>
+#include <stdlib.h>
+#include <errno.h>
+#include <math.h>
+#include <unistd.h>
+
+#define GONE_OUTBUF_SIZE 65536
+
+char _gone_outbuf[GONE_OUTBUF_SIZE];
+size_t _gone_outlen = 0;
+int _gone_linebuffered = 0;
+
+/* Write out the buffer.  Returns 0, or -1 if the output could not be
+   written (the rest of the buffer is dropped). */
+int _gone_flush(void) {
+  size_t n = 0;
+  int result = 0;
+  while (n < _gone_outlen) {
+    ssize_t count = write(1, _gone_outbuf + n, _gone_outlen - n);
+    if (count < 0 && errno == EINTR) {
+      continue;
+    }
+    if (count <= 0) {
+      result = -1;
+      break;
+    }
+    n += count;
+  }
+  _gone_outlen = 0;
+  return result;
+}
+
+static void _gone_flush_at_exit(void) {
+  _gone_flush();
+}
+
+/* Runs when the program starts (or when gonert.so is loaded) */
+__attribute__((constructor))
+static void _gone_init(void) {
+  _gone_linebuffered = isatty(1);
+  atexit(_gone_flush_at_exit);
+}
+
+/* Make sure there is room for n more characters in the buffer */
+static void _gone_reserve(size_t n) {
+  if (_gone_outlen + n > GONE_OUTBUF_SIZE) {
+    _gone_flush();
+  }
+}
+
+static void _gone_write(const char *s, size_t n) {
+  _gone_reserve(n);
+  while (n--) {
+    _gone_outbuf[_gone_outlen++] = *s++;
+  }
+}
+
+static void _gone_newline(void) {
+  _gone_reserve(1);
+  _gone_outbuf[_gone_outlen++] = '\n';
+  if (_gone_linebuffered) {
+    _gone_flush();
+  }
+}
+
+/* Write the decimal digits of an unsigned integer (at least width digits) */
+static void _gone_write_digits(unsigned long long x, int width) {
+  char digits[24];
+  int n = 0;
+  do {
+    digits[n++] = '0' + (x % 10);
+    x /= 10;
+  } while (x || n < width);
+  _gone_reserve(n);
+  while (n) {
+    _gone_outbuf[_gone_outlen++] = digits[--n];
+  }
+}
+
+int _gone_putchar(int c) {
+  if (c == '\n') {
+    _gone_newline();
+  } else {
+    _gone_reserve(1);
+    _gone_outbuf[_gone_outlen++] = (char) c;
+  }
+  return c;
+}
 
 void _print_int(int x) {
-  printf("%i\n", x);
+  if (x < 0) {
+    _gone_write("-", 1);
+    _gone_write_digits(-(unsigned long long) x, 1);
+  } else {
+    _gone_write_digits(x, 1);
+  }
+  _gone_newline();
 }
 
+/* Prints the same text as printf("%f\n", x) */
 void _print_float(double x) {
-  printf("%f\n", x);
+  char tmp[512];
+  int neg, n;
+  double ax, frac, scaled, rem, err, diff;
+  unsigned long long ipart, fpart;
+
+  if (!(x > -9007199254740992.0 && x < 9007199254740992.0)) {
+    /* NaN, infinity and very large values are left to the C library */
+    n = snprintf(tmp, sizeof(tmp), "%f", x);
+    _gone_write(tmp, n);
+    _gone_newline();
+    return;
+  }
+
+  neg = signbit(x);
+  ax = neg ? -x : x;
+  ipart = (unsigned long long) ax;
+  frac = ax - (double) ipart;            /* Exact */
+
+  /* Round frac to 6 decimal places, ties to even.  fma() gives the
+     exact rounding error of the multiply so that values very close
+     to a tie round the same way as printf. */
+  scaled = frac * 1e6;
+  err = fma(frac, 1e6, -scaled);
+  fpart = (unsigned long long) scaled;
+  rem = scaled - (double) fpart;         /* Exact */
+  diff = (rem - 0.5) + err;
+  if (diff > 0.0 || (diff == 0.0 && (fpart & 1))) {
+    fpart++;
+  }
+  if (fpart >= 1000000) {
+    fpart -= 1000000;
+    ipart++;
+  }
+
+  if (neg) {
+    _gone_write("-", 1);
+  }
+  _gone_write_digits(ipart, 1);
+  _gone_write(".", 1);
+  _gone_write_digits(fpart, 6);
+  _gone_newline();
 }
 
 void _print_bool(int x) {
   if (x) {
-    printf("true\n");
+    _gone_write("true", 4);
   } else {
-    printf("false\n");
+    _gone_write("false", 5);
   }
+  _gone_newline();
+}
+
+/* Arrays.  A Gone array is a pointer to its elements and a length
+   (see llvmgen.py).  Arrays whose size is only known at run time are
+   allocated here, and freed when the function declaring them
+   returns.  Bounds checks are done by _gone_check_index(),
+   which runtime.py defines in LLVM IR so that it can be inlined.  It
+   calls _gone_index_error() when an index is out of range. */
+
+#define GONE_MAX_ARRAY_LENGTH (1 << 30)
+
+static void _gone_runtime_error(int lineno, const char *message, int value, int length) {
+  _gone_flush();
+  fprintf(stderr, "Line %d: ", lineno);
+  fprintf(stderr, message, value, length);
+  fputc('\n', stderr);
+  exit(1);
+}
+
+void *_gone_new_array(int length, int size, int lineno) {
+  void *items;
+  if (length < 0 || length > GONE_MAX_ARRAY_LENGTH) {
+    _gone_runtime_error(lineno, "bad array size %d", length, 0);
+  }
+  items = calloc(length ? length : 1, size);
+  if (!items) {
+    _gone_runtime_error(lineno, "out of memory allocating %d array elements", length, 0);
+  }
+  return items;
+}
+
+void _gone_free_array(void *items) {
+  free(items);
+}
+
+void _gone_index_error(int index, int length, int lineno) {
+  _gone_runtime_error(lineno, "index %d out of range (length %d)", index, length);
 }
 
 /* Bootstrapping code for a stand-alone executable */
@@ -30,7 +214,10 @@ extern void __init(void);
 extern int _gone_main(void);
 
 int main() {
+  int result;
   __init();
-  return _gone_main();
+  result = _gone_main();
+  _gone_flush();
+  return result;
 }
 #endif
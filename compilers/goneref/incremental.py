@@ -0,0 +1,373 @@
+# gone/incremental.py
+'''
+Incremental Compilation
+=======================
+
+When one function in a big program changes, most of the work of
+compiling the program again is wasted.  The IncrementalCompiler keeps
+the results of the last build and only redoes the functions that
+changed or that depend on something that changed.
+
+The source is split into top-level declarations (chunks) with the
+lexer.  A chunk is parsed only if its text wasn't seen in the last
+build.  A function that is parsed again is also checked, turned into
+intermediate code and compiled to an object file again.  An unchanged
+function is reused as is if everything it refers to still looks the
+same.  While a function is checked, the global names it looks up are
+recorded together with the declaration each name resolved to: the
+signature of a called function, or the kind and type of a global
+variable or constant.  If any of those has changed (or a name now
+means something else, or nothing), the function is a dependent of the
+change and is done again.  The bodies of other functions don't matter,
+since functions refer to each other by name.
+
+__init (the global declarations) is cheap and is always regenerated.
+Its object file is reused if its code is unchanged.  The object files
+are then loaded into a new JIT execution engine.
+
+To build and run a program again every time it's saved::
+
+    bash % python3 -m gone.incremental --watch program.g
+'''
+
+import os
+import sys
+import time
+import hashlib
+
+from . import ast
+from .ast import Program, Statements, FunctionDeclaration, FunctionPrototype, \
+    VarDeclaration, ConstDeclaration
+from .checker import CheckProgramVisitor
+from .errors import errors_reported
+from .ircode import GenerateCode
+from .session import CompilationSession
+from .timing import phase
+
+def split_chunks(source):
+    '''
+    Split source into top-level declarations.  Returns a list of
+    (text, lineno) pairs.  Text between declarations (comments and
+    whitespace) is left out.
+    '''
+    from .tokenizer import GoneLexer
+
+    chunks = []
+    depth = 0
+    start = None
+    # Lexing errors are reported when the chunks are parsed
+    with CompilationSession(echo=False, cache=False).active():
+        for tok in GoneLexer().tokenize(source):
+            if start is None:
+                start = tok.index
+                lineno = tok.lineno
+            if tok.type == 'LBRACE':
+                depth += 1
+            elif tok.type == 'RBRACE':
+                depth -= 1
+            if (tok.type == 'RBRACE' and depth <= 0) or (tok.type == 'SEMI' and depth == 0):
+                chunks.append((source[start:tok.index + len(tok.value)], lineno))
+                start = None
+                depth = 0
+    if start is not None:
+        chunks.append((source[start:], lineno))
+    return chunks
+
+def shift_lines(node, delta):
+    '''
+    Add delta to the line numbers of every node in a tree
+    '''
+    for depth, child in ast.flatten(node):
+        if hasattr(child, 'lineno') and isinstance(child.lineno, int):
+            child.lineno += delta
+
+def declaration_key(node):
+    '''
+    Return what a function depends on in the declaration of a global
+    name: the kind and type of a variable, the value of a constant
+    (when known, it is compiled into every use), the signature of a
+    function.  None means the name is undefined.
+    '''
+    if node is None:
+        return None
+    if isinstance(node, FunctionPrototype):
+        return ('func', str(node.type), tuple(str(parm.type) for parm in node.parameters))
+    if isinstance(node, ConstDeclaration):
+        return ('const', str(node.type), node.value)
+    if isinstance(node, VarDeclaration):
+        if isinstance(node.typename, ast.ArrayType):
+            # Accesses to a fixed-size array may rely on its length (see bounds.py)
+            return ('var', str(node.type), node.typename.length)
+        return ('var', str(node.type))
+    return ('type', str(node))
+
+class FunctionRecord(object):
+    '''
+    What is kept of a function between builds
+    '''
+    def __init__(self, deps):
+        # Global names used {name: declaration_key()}
+        self.deps = deps
+
+        # Intermediate code (an ircode.Function) and object code (bytes)
+        self.function = None
+        self.object = None
+
+class IncrementalChecker(CheckProgramVisitor):
+    '''
+    Checker that records the global names each function uses and
+    skips the bodies of functions that can be reused.  records maps the
+    id of each unchanged FunctionDeclaration node to its FunctionRecord.
+    '''
+    def __init__(self, records):
+        CheckProgramVisitor.__init__(self)
+        self.records = records
+        self.deps = None
+
+        # Records reused and the dependencies of functions checked, by
+        # id of FunctionDeclaration node
+        self.reused = {}
+        self.checked = {}
+
+    def record_dep(self, name):
+        sym = self.symtab.resolve(name)
+        if self.deps is not None and (sym is None or sym.depth == 0):
+            self.deps[name] = declaration_key(sym.node if sym else None)
+
+    def symtab_lookup(self, name):
+        self.record_dep(name)
+        return CheckProgramVisitor.symtab_lookup(self, name)
+
+    def resolve_variable(self, node):
+        self.record_dep(node.name)
+        return CheckProgramVisitor.resolve_variable(self, node)
+
+    def visit_FunctionDeclaration(self, node):
+        if self.current_function:
+            # Reports the nested function
+            CheckProgramVisitor.visit_FunctionDeclaration(self, node)
+            return
+
+        self.visit(node.prototype)
+        record = self.records.get(id(node))
+        if record is not None and all(declaration_key(self.symtab.lookup_global(name)) == key
+                                      for name, key in record.deps.items()):
+            self.reused[id(node)] = record
+            return
+
+        self.deps = {}
+        self.check_function_body(node)
+        self.checked[id(node)] = self.deps
+        self.deps = None
+
+class IncrementalGenerateCode(GenerateCode):
+    '''
+    Intermediate code generator that reuses the code of unchanged
+    functions.  records maps the id of every FunctionDeclaration node
+    to its FunctionRecord.
+    '''
+    def __init__(self, records, reused):
+        GenerateCode.__init__(self)
+        self.records = records
+        self.reused = reused
+
+    def visit_FunctionDeclaration(self, node):
+        record = self.records[id(node)]
+        if id(node) in self.reused and record.function is not None:
+            self.functions.append(record.function)
+        else:
+            GenerateCode.visit_FunctionDeclaration(self, node)
+            record.function = self.functions[-1]
+            record.object = None
+
+class IncrementalCompiler(object):
+    '''
+    Compiles successive versions of a program, redoing only what
+    changed.  Each call to build() returns a JIT execution engine (or
+    None if the program has errors).
+    '''
+    def __init__(self, filename=None, opt_level=0, ssa=False, fast_math=False, cpu=None, features=None):
+        from .run import load_runtime, create_target_machine
+
+        load_runtime()
+        self.filename = filename
+        self.opt_level = opt_level
+        self.ssa = ssa
+        self.fast_math = fast_math
+        self.cpu = cpu
+        self.features = features
+        self.target_machine = create_target_machine(opt_level, cpu=cpu, features=features)
+
+        # Parsed chunks {text hash: (lineno, statements)} and records
+        # of functions {text hash: FunctionRecord} from the last build
+        self.chunks = {}
+        self.records = {}
+        self.init_object = (None, None)
+
+        # Session and statistics of the last build.  'changed' counts
+        # functions whose text changed, 'dependents' unchanged functions
+        # that had to be checked again.
+        self.session = None
+        self.stats = {}
+
+    def parse_chunks(self, source):
+        '''
+        Parse the chunks of source that weren't in the last build.
+        Returns a list of (key, statements) pairs.
+        '''
+        from .parser import parse
+
+        parsed = []
+        seen = set()
+        for text, lineno in split_chunks(source):
+            key = hashlib.sha1(text.encode('utf-8')).hexdigest()
+            if key in self.chunks and key not in seen:
+                old_lineno, statements = self.chunks[key]
+                for stmt in statements:
+                    shift_lines(stmt, lineno - old_lineno)
+            else:
+                program = parse(text, lineno=lineno)
+                statements = program.statements.statements if program and program.statements else []
+                self.stats['parsed'] += 1
+            seen.add(key)
+            parsed.append((key, lineno, statements))
+        self.chunks = { key: (lineno, statements) for key, lineno, statements in parsed }
+        return [ (key, statements) for key, lineno, statements in parsed ]
+
+    def build(self, source):
+        '''
+        Build a new version of the program.  Errors are reported to
+        self.session.
+        '''
+        self.session = CompilationSession(filename=self.filename, cache=False)
+        self.stats = { 'parsed' : 0, 'changed' : 0, 'dependents' : 0, 'reused' : 0, 'compiled' : 0 }
+        with self.session.active():
+            return self.build_program(source)
+
+    def build_program(self, source):
+        from .parallel import module_declarations, iter_instructions, load_objects
+
+        chunks = self.parse_chunks(source)
+        if errors_reported():
+            return None
+
+        # Records of unchanged functions
+        node_keys = {}
+        old_records = {}
+        statements = []
+        for key, chunk_statements in chunks:
+            for stmt in chunk_statements:
+                if isinstance(stmt, FunctionDeclaration):
+                    node_keys[id(stmt)] = key
+                    if key in self.records:
+                        old_records[id(stmt)] = self.records[key]
+            statements.extend(chunk_statements)
+        program = Program(Statements(statements) if statements else None)
+
+        checker = IncrementalChecker(old_records)
+        with phase('check'):
+            checker.visit(program)
+        if errors_reported():
+            return None
+
+        # New records for functions checked in this build
+        records = {}
+        for stmt in statements:
+            if isinstance(stmt, FunctionDeclaration):
+                record = checker.reused.get(id(stmt))
+                if record is not None:
+                    self.stats['reused'] += 1
+                else:
+                    record = FunctionRecord(checker.checked[id(stmt)])
+                    self.stats['dependents' if id(stmt) in old_records else 'changed'] += 1
+                records[id(stmt)] = record
+        self.records = { node_keys[node_id]: record for node_id, record in records.items() }
+
+        gen = IncrementalGenerateCode(records, checker.reused)
+        with phase('ircode'):
+            gen.visit(program)
+        functions = gen.functions
+        declarations = module_declarations(functions)
+
+        # Compile the functions that don't have object code
+        objects = []
+        init = functions[0]
+        init_key = repr(list(iter_instructions(init.start_block)))
+        if self.init_object[0] != init_key:
+            self.init_object = (init_key, self.compile_function(init, declarations))
+        objects.append(self.init_object[1])
+        for record in records.values():
+            if record.object is None:
+                record.object = self.compile_function(record.function, declarations)
+                self.stats['compiled'] += 1
+            objects.append(record.object)
+
+        # The engine owns its target machine and may outlive this build
+        from .run import create_target_machine
+        return load_objects(objects, create_target_machine(self.opt_level, cpu=self.cpu,
+                                                           features=self.features))
+
+    def compile_function(self, function, declarations):
+        '''
+        Compile one function into an object file for the JIT
+        '''
+        from .parallel import generate_partition
+        from .run import parse_module
+
+        llvm_code = generate_partition([function], declarations, self.ssa, self.fast_math)
+        mod = parse_module(llvm_code, self.opt_level, self.target_machine)
+        with phase('codegen'):
+            return self.target_machine.emit_object(mod)
+
+def main():
+    import argparse
+    from .run import opt_levels, run_engine
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.incremental')
+    argparser.add_argument('filename')
+    argparser.add_argument('--watch', action='store_true',
+                           help='build and run the program again whenever the file changes')
+    argparser.add_argument('--interval', type=float, default=0.5,
+                           help='seconds between checks for changes (default: 0.5)')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=opt_levels, default=0,
+                           help='LLVM optimization level')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--cpu', default=None,
+                           help='target CPU name (default: the host CPU, or "generic")')
+    argparser.add_argument('--features', default=None,
+                           help='target CPU features such as "+avx2,+fma" (default: those of the host CPU, or none with --cpu)')
+    args = argparser.parse_args()
+
+    compiler = IncrementalCompiler(args.filename, args.opt_level, args.ssa, args.fast_math,
+                                   args.cpu, args.features)
+    last_stat = None
+    while True:
+        try:
+            stat = os.stat(args.filename)
+            stat = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stat = None
+        if stat is not None and stat != last_stat:
+            last_stat = stat
+            with open(args.filename) as f:
+                source = f.read()
+            start = time.perf_counter()
+            engine = compiler.build(source)
+            elapsed = time.perf_counter() - start
+            if engine is not None:
+                run_engine(engine)
+            print('gone.incremental: %(changed)d functions changed, %(dependents)d dependents, '
+                  '%(reused)d reused, %(compiled)d compiled' % compiler.stats
+                  + ' (%.3fs)' % elapsed, file=sys.stderr)
+        if not args.watch:
+            break
+        try:
+            time.sleep(args.interval)
+        except KeyboardInterrupt:
+            break
+
+if __name__ == '__main__':
+    main()
@@ -11,10 +11,71 @@ To run a program use::
 
     bash % python3 -m gone.interp someprogram.g
 
+Program output (from print statements and the putchar() function)
+goes through an OutputSink object which collects it in a buffer and
+writes it out in large chunks.  To capture the output of a program,
+give the interpreter a sink that writes somewhere else::
+
+    output = io.BytesIO()
+    interpreter = Interpreter(output=OutputSink(output))
+
+Arrays are array.array objects.  Like compiled code, the interpreter
+stops the program with an error message on stderr (and exit status 1)
+when an index is out of range.
 '''
 import sys
+from array import array
 from . import bblock
 
+# array.array type codes of the element types of arrays
+array_typecodes = {
+    'int' : 'q',
+    'float' : 'd',
+    'bool' : 'B',
+}
+
+# Must match GONE_MAX_ARRAY_LENGTH in gonert.c
+max_array_length = 2**30
+
+def new_array(typename, length):
+    '''
+    Make an array of length elements, all zero
+    '''
+    code = array_typecodes[typename]
+    return array(code, bytes(array(code).itemsize * length))
+
+class OutputSink(object):
+    '''
+    Buffered output channel.  Output is collected in a bytearray and
+    written to a binary stream whenever more than threshold bytes are
+    waiting or when flush() is called.  If no stream is given, output
+    goes to sys.stdout (looked up at the time of the flush).
+    '''
+    def __init__(self, stream=None, threshold=65536):
+        self.stream = stream
+        self.threshold = threshold
+        self.buffer = bytearray()
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= self.threshold:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        stream = self.stream
+        if stream is None:
+            stream = getattr(sys.stdout, 'buffer', None)
+            if stream is None:
+                # A text stream such as io.StringIO
+                sys.stdout.write(self.buffer.decode('utf-8', 'replace'))
+                self.buffer.clear()
+                return
+        stream.write(self.buffer)
+        stream.flush()
+        self.buffer.clear()
+
 class Frame(object):
     '''
     Object representing a stack frame.
@@ -59,9 +120,11 @@ class Interpreter(object):
     For external function declarations, allow specific Python modules
     (e.g., math, os, etc.) to be registered with the interpreter.
     We don't have namespaces in the source language so this is going
-    to be a bit of sick hack.
+    to be a bit of sick hack.  A few external functions (putchar and
+    flush) are built into the interpreter itself so that they work with
+    the output sink.
     '''
-    def __init__(self,name='module'):
+    def __init__(self,name='module', output=None):
         # Frame stack
         self.framestack = []
 
@@ -83,6 +146,23 @@ class Interpreter(object):
 
         self.external_libs = [ __import__(name) for name in external_libs ]
 
+        # Where program output goes
+        self.output = output if output is not None else OutputSink()
+
+        # External functions provided by the interpreter
+        self.builtin_externs = {
+            'putchar' : self.putchar,
+            'flush' : self.flush,
+            }
+
+    def putchar(self, c):
+        self.output.write(bytes((c & 0xff,)))
+        return c
+
+    def flush(self):
+        self.output.flush()
+        return 0
+
     # Add user-defined functions to the globals.  Builds a dictionary mapping function names
     # to the code associated with each function
     def register_functions(self, functionlist):
@@ -128,12 +208,6 @@ class Interpreter(object):
         '''
         self.frame[target] = self.frame[left] + self.frame[right]
 
-    def run_print_int(self, source):
-        '''
-        Output an integer value.
-        '''
-        print(self.frame[source])
-
     run_literal_float = run_literal_int
     run_literal_string = run_literal_int
     run_literal_bool = run_literal_int
@@ -216,7 +290,7 @@ class Interpreter(object):
     run_usub_float = run_usub_int
 
     def run_print_int(self, source):
-        print(self.frame[source])
+        self.output.write(('%s\n' % self.frame[source]).encode('utf-8'))
 
     run_print_float = run_print_int
     run_print_string = run_print_int
@@ -227,6 +301,9 @@ class Interpreter(object):
         Scan the list of external modules for a matching function name.
         Place a reference to the external function in the dict of vars.
         '''
+        if name in self.builtin_externs:
+            self.globals[name] = self.builtin_externs[name]
+            return
         for module in self.external_libs:
             func = getattr(module, name, None)
             if func:
@@ -315,6 +392,87 @@ class Interpreter(object):
     run_parm_string = run_parm_int
     run_parm_bool = run_parm_int
 
+    run_parm_array_int = run_parm_int
+    run_parm_array_float = run_parm_int
+    run_parm_array_bool = run_parm_int
+
+    # Arrays
+    def runtime_error(self, lineno, message):
+        '''
+        Stop the program with an error, the way the runtime does (gonert.c)
+        '''
+        self.output.flush()
+        sys.stderr.write('Line %d: %s\n' % (lineno, message))
+        raise SystemExit(1)
+
+    def declare_array(self, variables, name, typename, length):
+        variables[name] = new_array(typename, length) if length is not None else None
+
+    def run_alloc_array_int(self, name, length):
+        self.declare_array(self.frame, name, 'int', length)
+
+    def run_alloc_array_float(self, name, length):
+        self.declare_array(self.frame, name, 'float', length)
+
+    def run_alloc_array_bool(self, name, length):
+        self.declare_array(self.frame, name, 'bool', length)
+
+    def run_global_array_int(self, name, length):
+        self.declare_array(self.globals, name, 'int', length)
+
+    def run_global_array_float(self, name, length):
+        self.declare_array(self.globals, name, 'float', length)
+
+    def run_global_array_bool(self, name, length):
+        self.declare_array(self.globals, name, 'bool', length)
+
+    def allocate(self, name, typename, size, lineno):
+        length = self.frame[size]
+        if not 0 <= length <= max_array_length:
+            self.runtime_error(lineno, 'bad array size %d' % length)
+        if name in self.frame:
+            self.frame[name] = new_array(typename, length)
+        else:
+            self.globals[name] = new_array(typename, length)
+
+    def run_new_array_int(self, name, size, lineno):
+        self.allocate(name, 'int', size, lineno)
+
+    def run_new_array_float(self, name, size, lineno):
+        self.allocate(name, 'float', size, lineno)
+
+    def run_new_array_bool(self, name, size, lineno):
+        self.allocate(name, 'bool', size, lineno)
+
+    run_load_array_int = run_load_int
+    run_load_array_float = run_load_int
+    run_load_array_bool = run_load_int
+
+    def run_len_array(self, source, target):
+        self.frame[target] = len(self.frame[source])
+
+    def run_check_index(self, name, index, lineno):
+        items = self.frame[name] if name in self.frame else self.globals[name]
+        if not 0 <= self.frame[index] < len(items):
+            self.runtime_error(lineno, 'index %d out of range (length %d)' % (self.frame[index], len(items)))
+
+    def run_load_index_int(self, name, index, target):
+        items = self.frame[name] if name in self.frame else self.globals[name]
+        self.frame[target] = items[self.frame[index]]
+
+    run_load_index_float = run_load_index_int
+
+    def run_load_index_bool(self, name, index, target):
+        items = self.frame[name] if name in self.frame else self.globals[name]
+        self.frame[target] = bool(items[self.frame[index]])
+
+    def run_store_index_int(self, source, name, index):
+        items = self.frame[name] if name in self.frame else self.globals[name]
+        items[self.frame[index]] = self.frame[source]
+
+    run_store_index_float = run_store_index_int
+    run_store_index_bool = run_store_index_int
+
     def run_jump(self, target):
         self.pc = target
 
@@ -324,6 +482,21 @@ class Interpreter(object):
         else:
             self.pc = false_target
 
+    # For loops.  The linker turns a ForBlock into for_start before the
+    # body and for_next after it.  for_next does the increment, the
+    # test and the branch back in one instruction.
+    def run_for_start(self, name, start, stop, step, exit_target):
+        variables = self.frame.vars if name in self.frame.vars else self.globals
+        value = variables[name] = self.frame[start]
+        if not (value < self.frame[stop] if step > 0 else value > self.frame[stop]):
+            self.pc = exit_target
+
+    def run_for_next(self, name, stop, step, body_target):
+        variables = self.frame.vars if name in self.frame.vars else self.globals
+        value = variables[name] = variables[name] + step
+        if value < self.frame[stop] if step > 0 else value > self.frame[stop]:
+            self.pc = body_target
+
 # BlockLinker.  This block visitor walks through the block structure
 # and turns it into a single sequence of instructions with added
 # jump and cbranch instructions.
@@ -348,6 +521,8 @@ class BlockLinker(bblock.BlockVisitor):
             elif opcode == 'cbranch' and isinstance(instr[2], bblock.Block):
                 newinstr = ('cbranch', instr[1], self.blockmap[id(instr[2])], self.blockmap[id(instr[3])])
                 self.code[n] = newinstr
+            elif opcode == 'for_start' and isinstance(instr[5], bblock.Block):
+                self.code[n] = instr[:5] + (self.blockmap[id(instr[5])],)
 
     def visit_BasicBlock(self, block):
         self.blockmap[id(block)] = len(self.code)
@@ -388,42 +563,77 @@ class BlockLinker(bblock.BlockVisitor):
         # Insert the jump back to the loop test
         self.code.append(('jump', block))
 
+    def visit_ForBlock(self, block):
+        self.blockmap[id(block)] = len(self.code)
+        self.code.extend(block.instructions)
+        self.code.append(('for_start', block.var, block.start, block.stop, block.step,
+                          block.next_block))
+        body = len(self.code)
+
+        # Visit the loop-body
+        self.visit(block.body)
+
+        # Step, test and jump back to the top of the body
+        self.code.append(('for_next', block.var, block.stop, block.step, body))
+
+def link_functions(functions):
+    '''
+    Take the list of functions made by compile_ircode() and build fully
+    linked versions suitable for Interpreter.register_functions()
+    '''
+    linked_functions = []
+    for func in functions:
+        linker = BlockLinker()
+        linker.link_blocks(func.start_block)
+        linked_functions.append((func, linker.code))
+    return linked_functions
+
+def run(functions, output=None):
+    '''
+    Run a program given as the list of functions made by compile_ircode().
+    Returns the value returned by main().  output is an optional
+    OutputSink (or other object with write() and flush() methods).
+    '''
+    interpreter = Interpreter(output=output)
+    interpreter.register_functions(link_functions(functions))
+
+    try:
+        # Execute the __init function which is responsible for global vars and constants
+        interpreter.execute_function('__init', [])
+
+        # Execute the main() entry point
+        return interpreter.execute_function('main',[])
+    finally:
+        interpreter.output.flush()
+
 # ----------------------------------------------------------------------
 #                       DO NOT MODIFY ANYTHING BELOW       
 # ----------------------------------------------------------------------
 
 def main():
-    import sys
+    import argparse
     from .ircode import compile_ircode
     from .errors import errors_reported
+    from .timing import enable_timing, phase, print_timings
 
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.interp filename\n')
-        raise SystemExit(1)
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.interp')
+    argparser.add_argument('filename')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
 
-    source = open(sys.argv[1]).read()
+    source = open(args.filename).read()
     functions = compile_ircode(source)
     if not errors_reported():
-        # Take the list of functions and build fully linked versions
-        linked_functions = []
-        for func in functions:
-            linker = BlockLinker()
-            linker.link_blocks(func.start_block)
-            linked_functions.append((func, linker.code))
-
-        # Monkey patch os with a putchar() function so certain examples work
-        import os
-        os.putchar = lambda x: os.write(1, chr(x).encode('latin-1'))
-
-        interpreter = Interpreter()
-        interpreter.register_functions(linked_functions)
-        # Execute the __init function which is responsible for global vars and constants
-        interpreter.execute_function('__init', [])
-
-        # Execute the main() entry point
-        result = interpreter.execute_function('main',[])
+        with phase('run'):
+            result = run(functions)
         print('Program Returned: %d' % result)
 
+    if args.time_passes:
+        print_timings()
+
 if __name__ == '__main__':
     main()
 
@@ -191,10 +191,42 @@ A distinction between local and global variables is made:
 
 Note: You may need to extend some of the existing op-codes to handle the new
 bool type as well.
+
+Modules (modules.py):
+
+       ('extern_type', name)              # Declare a global variable of another module
+       ('init_module', name)              # Run the init function of a module
+
+Arrays (type is int, float or bool):
+
+       ('global_array_type', name, length)        # Declare a global array
+       ('alloc_array_type', name, length)         # Declare a local array
+       ('new_array_type', name, size, lineno)     # Allocate an array of size elements
+       ('parm_array_type', name, pos)             # Declare an array parameter
+       ('load_array_type', name, target)          # target = array name (to pass it on)
+       ('len_array', source, target)              # target = len(source)
+       ('check_index', name, index, lineno)       # Stop if index is out of range
+       ('load_index_type', name, index, target)   # target = name[index]
+       ('store_index_type', source, name, index)  # name[index] = source
+
+A fixed-size array gives its length when declared.  An array whose
+size is only known at run time is declared with length None and then
+allocated by new_array.  check_index comes before an access unless
+bounds.py has shown that the index is in range.
+
+For loops:
+
+A for statement becomes a ForBlock (see bblock.py).  The loop variable
+is declared, and the start and stop values computed, at the end of the
+block before it.  There are no instructions for the loop test or the
+increment.  Each backend makes its own: a canonical counted loop in
+LLVM, and fused instructions in the interpreter.
 '''
 
 from . import ast
 from .bblock import *
+from .bounds import remove_bounds_checks
+from .typesys import int_type, bool_type
 from collections import defaultdict
 
 class Function(object):
@@ -207,30 +239,11 @@ class Function(object):
         self.parameters = parameters
         self.start_block = start_block
 
-# STEP 1: Map map operator symbol names such as +, -, *, /
-# to actual opcode names 'add','sub','mul','div' to be emitted in
-# the SSA code.   This is easy to do using dictionaries:
-
-binary_ops = {
-    '+' : 'add',
-    '-' : 'sub',
-    '*' : 'mul',
-    '/' : 'div',
-    '<' : 'lt',
-    '<=' : 'le',
-    '>' : 'gt',
-    '>=' : 'ge',
-    '==' : 'eq',
-    '!=' : 'ne',
-    '&&' : 'and',
-    '||' : 'or'
-}
-
-unary_ops = {
-    '+' : 'uadd',
-    '-' : 'usub',
-    '!' : 'not'
-}
+# STEP 1: Operator symbols such as +, -, *, / map to opcode names
+# 'add','sub','mul','div'.  The checker looks up the full opcode of
+# each operation (add_int) in typesys.py and records it on the node
+# as node.opcode.  Other typed instructions are named by
+# node.type.opcodes (e.g. opcodes['load'] is 'load_int').
 
 # STEP 2: Implement the following Node Visitor class so that it creates
 # a sequence of SSA instructions in the form of tuples.  Use the
@@ -255,11 +268,39 @@ class GenerateCode(ast.NodeVisitor):
         # Create the init function
         self.functions.append(Function('__init', 'void', [], self.start_block))
 
+        # Names declared in the global scope of the program.  IR names
+        # of the local variables of the current function (or of the
+        # blocks at the top level), by slot (see checker.SymbolTable),
+        # and the names already taken
+        self.global_names = set()
+        self.slot_names = {}
+        self.local_names = set()
+
+    def variable_name(self, node):
+        '''
+        Return the IR name of the variable a node refers to.  Globals
+        keep their names.  So does the first local variable of each name
+        in a function, unless a global has that name.  Any other variable
+        (one that shadows another in the body of an if, while or for, or
+        a global) gets the slot number appended.
+        '''
+        resolved = getattr(node, 'resolved', None)
+        if not resolved or resolved[0] == 0:
+            return node.name
+        slot = resolved[1]
+        if slot not in self.slot_names:
+            name = node.name
+            if name in self.local_names:
+                name = '%s.%d' % (name, slot)
+            self.local_names.add(name)
+            self.slot_names[slot] = name
+        return self.slot_names[slot]
+
     def new_temp(self, typeobj):
          '''
          Create a new temporary variable of a given type.
          '''
-         typename = str(typeobj)
+         typename = typeobj.name if typeobj.element is None else 'array_%s' % typeobj.element
          name = '__%s_%d' % (typename, self.versions[typename])
          self.versions[typename] += 1
          return name
@@ -271,6 +312,15 @@ class GenerateCode(ast.NodeVisitor):
     # One sample method follows
 
     def visit_Program(self, node):
+        self.global_names = set()
+        for stmt in node.statements.statements if node.statements else []:
+            if isinstance(stmt, ast.ImportDeclaration):
+                self.global_names.update(decl.name for decl in stmt.declarations)
+            elif isinstance(stmt, (ast.VarDeclaration, ast.ConstDeclaration)):
+                self.global_names.add(stmt.name)
+            elif isinstance(stmt, (ast.FunctionDeclaration, ast.ExternFunctionDeclaration)):
+                self.global_names.add(stmt.prototype.name)
+        self.local_names = set(self.global_names)
         self.visit(node.statements)
         
         # Append the final return statement onto the initial function
@@ -278,15 +328,18 @@ class GenerateCode(ast.NodeVisitor):
 
     def visit_LoadVariable(self, node):
         target = self.new_temp(node.type)
-        inst = ('load_' + str(node.type), node.name, target)
+        if getattr(node, 'value', None) is not None:
+            # A constant whose value is known
+            inst = (node.type.opcodes['literal'], node.value, target)
+        else:
+            inst = (node.type.opcodes['load'], self.variable_name(node), target)
         self.code.append(inst)
         node.gen_location = target
 
     def visit_Unaryop(self, node):
         self.visit(node.expr)
         target = self.new_temp(node.expr.type)
-        opcode = unary_ops[node.op] + '_' + str(node.type)
-        inst = (opcode, node.expr.gen_location, target)
+        inst = (node.opcode, node.expr.gen_location, target)
         self.code.append(inst)
         node.gen_location = target
 
@@ -294,8 +347,7 @@ class GenerateCode(ast.NodeVisitor):
         self.visit(node.left)
         self.visit(node.right)
         target = self.new_temp(node.type)
-        opcode = binary_ops[node.op] + '_' + str(node.left.type)
-        inst = (opcode, node.left.gen_location, node.right.gen_location, target)
+        inst = (node.opcode, node.left.gen_location, node.right.gen_location, target)
         self.code.append(inst)
         node.gen_location = target
 
@@ -303,43 +355,102 @@ class GenerateCode(ast.NodeVisitor):
         self.visit(node.expr)
         self.visit(node.store_location)
 
+    def visit_LoadArray(self, node):
+        self.visit(node.index)
+        name = self.variable_name(node)
+        self.check_index(node, name)
+        target = self.new_temp(node.type)
+        inst = (node.sym.type.opcodes['load_index'], name, node.index.gen_location, target)
+        self.code.append(inst)
+        node.gen_location = target
+
+    def visit_StoreArray(self, node):
+        self.visit(node.index)
+        name = self.variable_name(node)
+        self.check_index(node, name)
+        inst = (node.sym.type.opcodes['store_index'], node.expr.gen_location, name,
+                node.index.gen_location)
+        self.code.append(inst)
+
+    def check_index(self, node, name):
+        # Bounds check, unless it was found unnecessary (see bounds.py)
+        if node.checked:
+            self.code.append(('check_index', name, node.index.gen_location, node.lineno))
+
     def visit_StoreVariable(self, node):
-        inst = ('store_' + str(node.type), node.expr.gen_location, node.name)
+        inst = (node.type.opcodes['store'], node.expr.gen_location, self.variable_name(node))
         self.code.append(inst)
 
     def visit_PrintStatement(self, node):
         self.visit(node.expr)
-        inst = ('print_' + str(node.expr.type) ,node.expr.gen_location)
+        inst = (node.expr.type.opcodes['print'], node.expr.gen_location)
         self.code.append(inst)
 
     def visit_VarDeclaration(self, node):
+        name = self.variable_name(node)
+        if isinstance(node.typename, ast.ArrayType):
+            self.declare_array(node, name)
+            return
         if node.is_global:
-            inst = ('global_' + str(node.type), node.name)
+            inst = (node.type.opcodes['global'], name)
         else:
-            inst = ('alloc_' + str(node.type), node.name)
+            inst = (node.type.opcodes['alloc'], name)
         self.code.append(inst)
         if node.expr:
             self.visit(node.expr)
-            inst = ('store_' + str(node.type), node.expr.gen_location, node.name)
+            inst = (node.type.opcodes['store'], node.expr.gen_location, name)
+            self.code.append(inst)
+
+    def declare_array(self, node, name):
+        length = node.typename.length
+        inst = (node.type.opcodes['global' if node.is_global else 'alloc'], name, length)
+        self.code.append(inst)
+        if length is None:
+            self.visit(node.typename.size)
+            inst = (node.type.opcodes['new'], name, node.typename.size.gen_location, node.lineno)
             self.code.append(inst)
 
     def visit_ConstDeclaration(self, node):
+        # Constants with a known value need no storage.  Every use is a literal.
+        if node.value is not None:
+            return
+        name = self.variable_name(node)
         if node.is_global:
-            inst = ('global_' + str(node.expr.type), node.name)
+            inst = (node.expr.type.opcodes['global'], name)
         else:
-            inst = ('alloc_' + str(node.expr.type), node.name)
+            inst = (node.expr.type.opcodes['alloc'], name)
         self.code.append(inst)
         self.visit(node.expr)
-        inst = ('store_' + str(node.expr.type), node.expr.gen_location, node.name)
+        inst = (node.expr.type.opcodes['store'], node.expr.gen_location, name)
         self.code.append(inst)
 
     def visit_ExternFunctionDeclaration(self, node):
         self.visit(node.prototype)
-        inst = ('extern_func', node.prototype.name, str(node.prototype.type)) + \
-            tuple(str(parm.type) for parm in node.prototype.parameters)
+        inst = ('extern_func', node.prototype.name, node.prototype.type.name) + \
+            tuple(parm.type.name for parm in node.prototype.parameters)
         self.code.append(inst)
         
+    def visit_ImportDeclaration(self, node):
+        # Run the init functions of the modules first (see modules.py)
+        for name in node.init_modules:
+            self.code.append(('init_module', name))
+        for decl in node.declarations:
+            if isinstance(decl, ast.FunctionPrototype):
+                inst = ('extern_func', decl.name, decl.type.name) + \
+                    tuple(parm.type.name for parm in decl.parameters)
+            elif isinstance(decl, ast.ConstDeclaration) and decl.value is not None:
+                continue
+            else:
+                inst = (decl.type.opcodes['extern'], decl.name)
+            self.code.append(inst)
+
     def visit_FunctionCall(self, node):
+        if node.builtin == 'len':
+            self.visit(node.arglist[0])
+            target = self.new_temp(node.type)
+            self.code.append(('len_array', node.arglist[0].gen_location, target))
+            node.gen_location = target
+            return
         args = []
         for arg in node.arglist:
             self.visit(arg)
@@ -351,7 +462,7 @@ class GenerateCode(ast.NodeVisitor):
 
     def visit_Literal(self, node):
         target = self.new_temp(node.type)
-        inst = ('literal_' + str(node.type), node.value, target)
+        inst = (node.type.opcodes['literal'], node.value, target)
         self.code.append(inst)
         # Save the name of the temporary variable where the value was placed 
         node.gen_location = target
@@ -401,10 +512,34 @@ class GenerateCode(ast.NodeVisitor):
          self.code = BasicBlock()
          whileblock.next_block = self.code
 
+    def visit_ForStatement(self, node):
+         # Declare the loop variable and compute the range in the current block
+         name = self.variable_name(node)
+         self.code.append((int_type.opcodes['global' if node.is_global else 'alloc'], name))
+         self.visit(node.start)
+         self.visit(node.stop)
+
+         forblock = ForBlock()
+         self.code.next_block = forblock
+         forblock.var = name
+         forblock.start = node.start.gen_location
+         forblock.stop = node.stop.gen_location
+         forblock.step = node.step_value
+         forblock.testvar = self.new_temp(bool_type)
+
+         # Traverse the body
+         forblock.body = BasicBlock()
+         self.code = forblock.body
+         self.visit(node.statements)
+
+         # Create the terminating block
+         self.code = BasicBlock()
+         forblock.next_block = self.code
+
     def visit_ReturnStatement(self, node):
         # Evaluate the expression
         self.visit(node.expr)
-        inst = ('return_' + str(node.expr.type), node.expr.gen_location)
+        inst = (node.expr.type.opcodes['return'], node.expr.gen_location)
         self.code.append(inst)
 
     def visit_FunctionDeclaration(self, node):
@@ -413,23 +548,31 @@ class GenerateCode(ast.NodeVisitor):
 
         self.code = BasicBlock()
         # Get the return type names and parameter type names
-        rettypename = str(node.prototype.typename.type)
-        parmtypenames = [ str(parm.type) for parm in node.prototype.parameters]
+        rettypename = node.prototype.typename.type.name
+        parmtypenames = [ parm.type.name for parm in node.prototype.parameters]
 
         self.functions.append(Function(node.prototype.name, 
                                        rettypename, 
                                        parmtypenames, 
                                        self.code))
         
+        saved_names = self.slot_names, self.local_names
+        self.slot_names = {}
+        self.local_names = set(self.global_names)
+
+        # Find the array accesses that need no bounds check
+        remove_bounds_checks(node)
+
         # Emit the function parameters
         for n, parm in enumerate(node.prototype.parameters):
-            inst = ('parm_' + str(parm.type), parm.name, n)
+            inst = (parm.type.opcodes['parm'], self.variable_name(parm), n)
             self.code.append(inst)
 
         # Visit the function body
         self.visit(node.statements)
 
-        # Restore the last saved block
+        # Restore the last saved block and the names of the top level
+        self.slot_names, self.local_names = saved_names
         self.code = saved_code
 
 # STEP 3: Testing
@@ -448,33 +591,43 @@ class GenerateCode(ast.NodeVisitor):
 #                       DO NOT MODIFY ANYTHING BELOW       
 # ----------------------------------------------------------------------
 
-def compile_ircode(source):
+def compile_ircode(source, session=None):
     '''
-    Generate intermediate code from source.
+    Generate intermediate code from source.  Errors are reported to
+    session (see session.py), if given.
     '''
     from .parser import parse
     from .checker import check_program
-    from .errors import errors_reported
-
-    ast = parse(source)
-    check_program(ast)
-
-    # If no errors occurred, generate code
-    if not errors_reported():
-        gen = GenerateCode()
-        gen.visit(ast)
-        return gen.functions
-    else:
-        return []
+    from .session import using_session
+    from .timing import phase
+
+    with using_session(session) as session:
+        ast = parse(source)
+        check_program(ast)
+
+        # If no errors occurred, generate code
+        if not session.errors_reported():
+            gen = GenerateCode()
+            with phase('ircode'):
+                gen.visit(ast)
+            session.remember('ircode', gen.functions)
+            return gen.functions
+        else:
+            return []
 
 def main():
-    import sys
-
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.ircode filename\n')
-        raise SystemExit(1)
-
-    source = open(sys.argv[1]).read()
+    import argparse
+    from .timing import enable_timing, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.ircode')
+    argparser.add_argument('filename')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
+
+    source = open(args.filename).read()
     functions = compile_ircode(source)
     for func in functions:
         print(':::::::::::::::: FUNCTION: %s %s %s' % (func.name,
@@ -484,5 +637,8 @@ def main():
         PrintBlocks().visit(func.start_block)
         print()
 
+    if args.time_passes:
+        print_timings()
+
 if __name__ == '__main__':
     main()
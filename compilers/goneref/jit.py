@@ -0,0 +1,144 @@
+# gone/jit.py
+'''
+Calling Gone from Python
+========================
+
+run.py runs a whole program by calling its main() function.  This file
+lets Python code call any Gone function directly::
+
+    from goneref.jit import JITModule
+
+    mod = JITModule("""
+    func fact(n int) int {
+        if n < 2 {
+            return 1;
+        }
+        return n * fact(n - 1);
+    }
+    """, opt_level=2)
+
+    print(mod.fact(10))            # 3628800
+    fact = mod.function('fact')
+    values = [ fact(n) for n in range(10) ]
+
+The source is compiled once when the JITModule is created.  The
+ctypes signature of each function comes from the return type and
+parameter types in the intermediate code (int -> c_int, float ->
+c_double, bool -> c_uint8).  Wrappers are made the first time a
+function is looked up and cached after that, so a call costs only
+the ctypes call itself.  The global initialization code (__init) runs
+exactly once per module, before the first function is returned.
+
+Output from print statements is buffered by the runtime.  Call
+flush() to write it out.
+'''
+
+import ctypes
+import threading
+
+from .session import CompilationSession
+from .llvmgen import llvm_function_name
+
+# ctypes types for Gone types.  LLVM only defines the lowest bit of an
+# i1 value, so bools are passed as bytes and masked on return.  An
+# array is passed as the address of its descriptor (see llvmgen.py).
+ctypes_types = {
+    'int' : ctypes.c_int,
+    'float' : ctypes.c_double,
+    'bool' : ctypes.c_uint8,
+    'void' : None,
+    'int[]' : ctypes.c_void_p,
+    'float[]' : ctypes.c_void_p,
+    'bool[]' : ctypes.c_void_p,
+}
+
+class CompileError(Exception):
+    '''
+    Raised when a Gone program fails to compile.  The error messages
+    (see errors.py) are in the messages attribute.
+    '''
+    def __init__(self, messages):
+        Exception.__init__(self, '%d errors' % len(messages))
+        self.messages = messages
+
+def bool_result(func):
+    '''
+    Wrap a ctypes function returning an i1 value so that it returns a Python bool
+    '''
+    def call(*args):
+        return bool(func(*args) & 1)
+    call.__name__ = func.__name__
+    call.argtypes = func.argtypes
+    return call
+
+class JITModule(object):
+    '''
+    A Gone program compiled in the LLVM JIT.  Functions can be looked up
+    with function(name) or as attributes.
+    '''
+    def __init__(self, source, opt_level=0, ssa=False, fast_math=False, cpu=None, features=None):
+        from .ircode import compile_ircode
+        from .llvmgen import generate_llvm
+        from .run import compile_jit
+
+        session = CompilationSession(cache=False)
+        functions = compile_ircode(source, session)
+        if session.errors_reported():
+            raise CompileError(session.error_messages())
+
+        self.signatures = { func.name: (func.return_type, func.parameters)
+                            for func in functions if func.name != '__init' }
+        self.engine = compile_jit(generate_llvm(functions, ssa, fast_math), opt_level, cpu, features)
+        self._functions = {}
+        self._initialized = False
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        '''
+        Run the global initialization code if it hasn't been run yet
+        '''
+        with self._lock:
+            if not self._initialized:
+                init_func = ctypes.CFUNCTYPE(None)(self.engine.get_function_address('__init'))
+                init_func()
+                self._initialized = True
+
+    def function(self, name):
+        '''
+        Return a Python callable for the Gone function name
+        '''
+        func = self._functions.get(name)
+        if func is None:
+            if name not in self.signatures:
+                raise KeyError('No function %r' % name)
+            self.initialize()
+            rettypename, parmtypenames = self.signatures[name]
+            functype = ctypes.CFUNCTYPE(ctypes_types[rettypename],
+                                        *[ctypes_types[typename] for typename in parmtypenames])
+            func = functype(self.engine.get_function_address(llvm_function_name(name)))
+            func.__name__ = name
+            # Machine code lives as long as the engine does
+            func.module = self
+            if rettypename == 'bool':
+                func = bool_result(func)
+                func.module = self
+            self._functions[name] = func
+        return func
+
+    def functions(self):
+        '''
+        Return a dict mapping the name of every Gone function to a callable
+        '''
+        return { name: self.function(name) for name in self.signatures }
+
+    def flush(self):
+        '''
+        Write out any output buffered by the runtime
+        '''
+        from .run import flush_output
+        flush_output()
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name not in self.__dict__.get('signatures', ()):
+            raise AttributeError(name)
+        return self.function(name)
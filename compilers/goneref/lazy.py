@@ -0,0 +1,134 @@
+# gone/lazy.py
+'''
+Lazy JIT Compilation
+====================
+
+run.py compiles every function in the program before main() starts,
+even functions that are never called.  In lazy mode, a function goes
+through LLVM generation, optimization and machine code generation only
+the first time it is called.
+
+Every function has a slot: a function pointer in memory.  Calls from
+one Gone function to another load the pointer from the slot and call
+it.  At first every slot points to a stub.  The stub is a ctypes
+callback into Python that compiles the function into its own LLVM
+module and adds it to the execution engine.  It then stores the
+address of the machine code in the slot and calls it.  Later calls go
+straight to the machine code (through one indirect call).
+
+An exception can't pass through the machine code that called a stub.
+If compiling a function fails, the stub records the exception, sets
+an abort flag and returns.  Code compiled here checks the flag after
+every call through a slot, and returns at once if it is set.  The
+program unwinds back to run(), which raises the exception.
+
+__init is compiled first because it defines the global variables that
+other functions refer to.  To run a program lazily::
+
+    bash % python3 -m gone.run --lazy big.g
+'''
+
+import ctypes
+import llvmlite.binding as llvm
+
+from .timing import phase
+from .jit import ctypes_types
+from .llvmgen import llvm_function_name
+from .parallel import module_declarations, generate_partition
+from .run import load_runtime, create_target_machine, parse_module, flush_output
+
+class LazyJIT(object):
+    '''
+    Compiles the functions of a program (a list of intermediate code
+    functions) on demand.
+    '''
+    def __init__(self, functions, opt_level=0, ssa=False, fast_math=False, cpu=None, features=None):
+        load_runtime()
+        self.functions = { func.name: func for func in functions }
+        self.declarations = module_declarations(functions)
+        self.opt_level = opt_level
+        self.ssa = ssa
+        self.fast_math = fast_math
+        self.target_machine = create_target_machine(opt_level, cpu=cpu, features=features)
+        self.engine = llvm.create_mcjit_compiler(llvm.parse_assembly(''), self.target_machine)
+
+        # Addresses of compiled functions
+        self.compiled = {}
+
+        # Function pointer slots and the stubs they start out pointing to
+        self.slots = {}
+        self.stubs = {}
+        signatures = self.declarations[2]
+        for name, (rettypename, parmtypenames) in signatures.items():
+            if name == '__init':
+                continue
+            functype = ctypes.CFUNCTYPE(ctypes_types[rettypename],
+                                        *[ctypes_types[typename] for typename in parmtypenames])
+            self.stubs[name] = functype(self.make_stub(name, functype))
+            self.slots[name] = ctypes.c_void_p(ctypes.cast(self.stubs[name], ctypes.c_void_p).value)
+        self.slot_addresses = { name: ctypes.addressof(slot) for name, slot in self.slots.items() }
+
+        # Set when a stub fails to compile its function (see make_stub())
+        self.aborted = ctypes.c_int(0)
+        self.error = None
+
+    def make_stub(self, name, functype):
+        def stub(*args):
+            try:
+                address = self.compile_function(name)
+            except BaseException as err:
+                self.error = err
+                self.aborted.value = 1
+                # The caller returns without looking at the result
+                return 0
+            return functype(address)(*args)
+        return stub
+
+    def compile_function(self, name):
+        '''
+        Compile the function name (if it hasn't been compiled yet) and
+        return the address of its machine code
+        '''
+        address = self.compiled.get(name)
+        if address is None:
+            if name != '__init' and '__init' not in self.compiled:
+                self.compile_function('__init')
+            llvm_code = generate_partition([self.functions[name]], self.declarations,
+                                           self.ssa, self.fast_math, self.slot_addresses,
+                                           ctypes.addressof(self.aborted))
+            mod = parse_module(llvm_code, self.opt_level, self.target_machine)
+            with phase('codegen'):
+                self.engine.add_module(mod)
+                self.engine.finalize_object()
+                address = self.engine.get_function_address(llvm_function_name(name))
+            self.compiled[name] = address
+            if name in self.slots:
+                self.slots[name].value = address
+        return address
+
+    def run(self):
+        '''
+        Run the program's __init and main functions.  Returns the value
+        returned by main, or raises the exception if compiling a
+        function failed.
+        '''
+        init_func = ctypes.CFUNCTYPE(None)(self.compile_function('__init'))
+        main_func = ctypes.CFUNCTYPE(ctypes.c_int)(self.compile_function('main'))
+        self.error = None
+        self.aborted.value = 0
+        with phase('run'):
+            try:
+                init_func()
+                result = main_func() if not self.aborted.value else 0
+            finally:
+                flush_output()
+        if self.error is not None:
+            raise self.error
+        return result
+
+def run_lazy(functions, opt_level=0, ssa=False, fast_math=False, cpu=None, features=None):
+    '''
+    Run a program (a list of intermediate code functions), compiling
+    functions as they are first called
+    '''
+    return LazyJIT(functions, opt_level, ssa, fast_math, cpu, features).run()
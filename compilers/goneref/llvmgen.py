@@ -16,7 +16,7 @@ from . import bblock
 
 from llvmlite.ir import (
     Module, IRBuilder, Function, IntType, DoubleType, VoidType, Constant, GlobalVariable,
-    FunctionType
+    FunctionType, Undefined, LiteralStructType, ArrayType, MetaDataString
     )
 
 # Declare the LLVM type objects that you want to use for the types
@@ -28,6 +28,7 @@ float_type  = DoubleType()        # 64-bit float
 bool_type   = IntType(1)          # 1-bit integer (bool)
 string_type = None                # Up to you (leave until the end)
 void_type   = VoidType()
+char_type   = IntType(8)
 
 # A dictionary that maps the typenames used in IR to the corresponding
 # LLVM types defined above.   This is mainly provided for convenience
@@ -40,6 +41,47 @@ typemap = {
     'void' : void_type
 }
 
+# Arrays.  An array is described by a pointer to its elements and its
+# length, {T*, i32}.  Arrays are passed to functions as a pointer to
+# this descriptor.  array_elements maps the suffix of array
+# instructions (e.g. global_array_int) to the element type, and
+# element_sizes gives the number of bytes of each element.
+array_elements = {
+    'array_int' : int_type,
+    'array_float' : float_type,
+    'array_bool' : bool_type,
+}
+
+element_sizes = {
+    int_type : 4,
+    float_type : 8,
+    bool_type : 1,
+}
+
+def descriptor_type(element):
+    return LiteralStructType([element.as_pointer(), int_type])
+
+for typename, element in [('int', int_type), ('float', float_type), ('bool', bool_type)]:
+    typemap[typename + '[]'] = descriptor_type(element).as_pointer()
+
+class ArrayRef(object):
+    '''
+    An array in generated code: the address of its descriptor, a
+    pointer to its first element and its length
+    '''
+    def __init__(self, descriptor, items, length):
+        self.descriptor = descriptor
+        self.items = items
+        self.length = length
+
+# Extern functions that are implemented by the Gone runtime (gonert.c)
+# instead of the C library.  putchar() goes through the runtime's output
+# buffer so that its output stays in order with print statements.
+runtime_externs = {
+    'putchar' : '_gone_putchar',
+    'flush' : '_gone_flush',
+}
+
 # The following class is going to generate the LLVM instruction stream.  
 # The basic features of this class are going to mirror the experiments
 # you tried in Exercise 5.  The execution module is very similar
@@ -47,7 +89,7 @@ typemap = {
 # in the class. 
 
 class GenerateLLVM(object):
-    def __init__(self, name='module'):
+    def __init__(self, name='module', fast_math=False):
         # Perform the basic LLVM initialization.  You need the following parts:
         #
         #    1.  A top-level Module object
@@ -95,13 +137,33 @@ class GenerateLLVM(object):
         # Last block that performed an unconditional branch
         self.last_branch = None
 
+        # If set, float operations carry LLVM's 'fast' flag (see float_op())
+        self.fast_math = fast_math
+
+        # Functions called through a pointer in memory (see declare_slot())
+        self.slots = {}
+
+        # Flag checked after each call through a slot (see declare_abort_flag())
+        self.abort_flag = None
+
+        # Global arrays of a fixed size defined in this module {name: ArrayRef}
+        self.global_arrays = {}
+
+        # Number of for loops so far (see loop_metadata())
+        self.loop_count = 0
+
     def start_function(self, name, rettypename, parmtypenames):
         rettype = typemap[rettypename]
         parmtypes = [typemap[pname] for pname in parmtypenames]
         func_type = FunctionType(rettype, parmtypes)   #  Type.function(rettype, parmtypes, False)
 
-        # Create the function for which we're generating code
-        self.function = Function(self.module, func_type, name=name)   #Function.new(self.module, func_type, name)
+        # Create the function for which we're generating code.  It may
+        # already have been declared by declare_function().
+        existing = self.globals.get(name)
+        if isinstance(existing, Function) and existing.is_declaration:
+            self.function = existing
+        else:
+            self.function = Function(self.module, func_type, name=name)   #Function.new(self.module, func_type, name)
 
         # Make the builder and entry block
         self.block = self.function.append_basic_block('entry')
@@ -114,13 +176,46 @@ class GenerateLLVM(object):
         self.locals = {}
         self.temps = {}
 
+        # Local and parameter arrays {name: ArrayRef}, and the
+        # descriptors of the arrays to free when the function returns
+        self.arrays = {}
+        self.heap_arrays = []
+
         # Make the return variable
-        if rettype is not void_type:
-            self.locals['return'] = self.builder.alloca(rettype, name='return')
+        self.return_type = rettype
+        self.declare_return(rettype)
 
         # Put an entry in the globals
         self.globals[name] = self.function
 
+    def declare_function(self, name, rettypename, parmtypenames):
+        # Declare a function that is defined in a different module
+        func_type = FunctionType(typemap[rettypename], [typemap[pname] for pname in parmtypenames])
+        self.globals[name] = Function(self.module, func_type, name=name)
+
+    def declare_slot(self, name, rettypename, parmtypenames, address):
+        # Calls to the function name go through a function pointer stored
+        # in memory at a fixed address (used by lazy.py)
+        func_type = FunctionType(typemap[rettypename], [typemap[pname] for pname in parmtypenames])
+        self.slots[name] = Constant(IntType(64), address).inttoptr(func_type.as_pointer().as_pointer())
+
+    def declare_abort_flag(self, address):
+        # After each call through a slot, return at once if the int at
+        # address is nonzero (used by lazy.py to stop the program)
+        self.abort_flag = Constant(IntType(64), address).inttoptr(int_type.as_pointer())
+
+    def declare_global(self, name, typename):
+        # Declare a global variable that is defined in a different module
+        if typename in array_elements:
+            vartype = descriptor_type(array_elements[typename])
+        else:
+            vartype = typemap[typename]
+        self.globals[name] = GlobalVariable(self.module, vartype, name=name)
+
+    def declare_return(self, rettype):
+        if rettype is not void_type:
+            self.locals['return'] = self.builder.alloca(rettype, name='return')
+
     def declare_runtime_library(self):
         # Certain functions such as I/O and string handling are often easier
         # to implement in an external C library.  This method should make
@@ -143,6 +238,12 @@ class GenerateLLVM(object):
                                                FunctionType(void_type, [int_type]),
                                                    name='_print_bool')
 
+    def runtime_function(self, name, rettype, parmtypes):
+        # Declare a runtime function the first time it is used
+        if name not in self.runtime:
+            self.runtime[name] = Function(self.module, FunctionType(rettype, parmtypes), name=name)
+        return self.runtime[name]
+
     def generate_code(self, ircode):
         # Given a sequence of SSA intermediate code tuples, generate LLVM
         # instructions using the current builder (self.builder).  Each
@@ -161,6 +262,7 @@ class GenerateLLVM(object):
         if self.last_branch != self.block:
             self.builder.branch(self.exit_block)
         self.builder.position_at_end(self.exit_block)
+        self.free_arrays()
         
         if 'return' in self.locals:
             self.builder.ret(self.builder.load(self.locals['return']))
@@ -186,6 +288,107 @@ class GenerateLLVM(object):
             self.builder.branch(next_block)
         self.last_branch = self.block
 
+    def start_loop(self, block, assigned):
+        # Start the test block of a loop (see GenerateSSALLVM)
+        self.set_block(block)
+
+    def end_loop(self, block):
+        pass
+
+    def set_variable(self, name, value):
+        self.builder.store(value, self.lookup_var(name))
+
+    # For loops (see GenerateBlocksLLVM.visit_ForBlock())
+    def trip_count(self, start, stop, step):
+        '''
+        Return the number of times a loop from start to stop by step
+        runs, as an unsigned int.  The distance between start and stop
+        always fits in 32 bits unsigned.
+        '''
+        low, high = (start, stop) if step > 0 else (stop, start)
+        distance = self.builder.sub(high, low)
+        count = self.builder.add(self.builder.udiv(self.builder.sub(distance, Constant(int_type, 1)),
+                                                   Constant(int_type, abs(step))),
+                                 Constant(int_type, 1))
+        runs = self.builder.icmp_signed('>', high, low)
+        return self.builder.select(runs, count, Constant(int_type, 0), name='count')
+
+    def loop_metadata(self, vectorize):
+        '''
+        Make the llvm.loop metadata for the back-edge of a for loop.
+        Every for loop terminates.  If vectorize is True, the loop is
+        also vectorized (and interleaved, i.e. unrolled) at -O2, where
+        only loops tagged this way are.  Each loop needs a node of its
+        own, whose first operand is the node itself.
+        '''
+        self.loop_count += 1
+        hints = [ self.module.add_metadata([MetaDataString(self.module, 'llvm.loop.mustprogress')]) ]
+        if vectorize:
+            hints.append(self.module.add_metadata([MetaDataString(self.module, 'llvm.loop.vectorize.enable'),
+                                                   Constant(bool_type, 1)]))
+        loop = self.module.add_metadata([MetaDataString(self.module, 'gone.for.%d' % self.loop_count)])
+        loop.operands = (loop,) + tuple(hints)
+        return loop
+
+    def vectorizable(self, block):
+        '''
+        Return True if LLVM's loop vectorizer can handle the body of a
+        ForBlock.  LLVM warns about every tagged loop it can't
+        vectorize, so only straight-line code without calls, prints or
+        bounds checks is tagged.  It may only store to local variables.
+        A variable declared outside the loop must be updated as a
+        reduction (see is_reduction()).
+        '''
+        body = block.body
+        ops = []
+        while isinstance(body, bblock.Block):
+            if not isinstance(body, bblock.BasicBlock):
+                return False
+            ops.extend(body.instructions)
+            body = body.next_block
+        declared = { op[1] for op in ops if op[0].startswith('alloc_') }
+        for op in ops:
+            if op[0] in ('call_func', 'check_index') or op[0].startswith(('print_', 'new_array_',
+                                                                          'alloc_array_')):
+                return False
+            if op[0].startswith('store_') and not op[0].startswith('store_index'):
+                if op[2] in self.globals:
+                    return False
+                if op[2] not in declared and not self.is_reduction(op, ops):
+                    return False
+        return True
+
+    def is_reduction(self, store, ops):
+        '''
+        Return True if store, an instruction in the body of a for loop,
+        updates its variable as x = x + e or x = x * e, where e doesn't
+        use x, and x is used nowhere else in the loop.  LLVM can only
+        carry values like these around a vectorized loop.  A float
+        reduction also needs fast math, which lets LLVM reorder the
+        operations.
+        '''
+        opcode, source, name = store
+        typename = opcode[len('store_'):]
+        if typename not in ('int', 'float') or (typename == 'float' and not self.fast_math):
+            return False
+        loads = [ op for op in ops if op[0] == 'load_' + typename and op[1] == name ]
+        stores = [ op for op in ops if op[0] == opcode and op[2] == name ]
+        if len(loads) != 1 or len(stores) != 1:
+            return False
+        defs = { op[-1]: op for op in ops }
+        update = defs.get(source)
+        if not update or update[0] not in ('add_' + typename, 'mul_' + typename):
+            return False
+        left, right, _ = update[1:]
+        value = loads[0][2]
+        if value not in (left, right):
+            return False
+
+        def uses_value(temp):
+            return temp == value or any(uses_value(arg) for arg in defs.get(temp, ())[1:-1]
+                                        if isinstance(arg, str))
+        return not uses_value(right if left == value else left)
+
     # ----------------------------------------------------------------------
     # Opcode implementation.   You must implement the opcodes.  A few
     # sample opcodes have been given to get you started.
@@ -203,20 +406,22 @@ class GenerateLLVM(object):
 
         
     # Allocation of variables.  Declare as local variables and set to
-    # a sensible initial value.
+    # a sensible initial value.  The stack slots all go in the entry
+    # block, even for variables declared in a loop, so mem2reg can turn
+    # them into registers.
     def emit_alloc_int(self, name):
-        var = self.builder.alloca(int_type, name=name)
+        var = self.entry_alloca(int_type, name)
         self.builder.store(Constant(int_type, 0), var)
         self.locals[name] = var
 
     def emit_alloc_float(self, name):
-        var = self.builder.alloca(float_type, name=name)
+        var = self.entry_alloca(float_type, name)
         self.builder.store(Constant(float_type, 0.0), var)
         self.locals[name] = var
 
     def emit_alloc_bool(self, name):
-        var = self.builder.alloca(bool_type, name=name)
-        var.builder.store(Constant(bool_type, 0), var)
+        var = self.entry_alloca(bool_type, name)
+        self.builder.store(Constant(bool_type, 0), var)
         self.locals[name] = var
 
     # Global variables
@@ -262,33 +467,186 @@ class GenerateLLVM(object):
     def emit_store_bool(self, source, target):
         self.builder.store(self.temps[source], self.lookup_var(target))
 
+    # Arrays.  The storage of a fixed-size array is a global or a stack
+    # slot in the entry block of the function.  Other arrays are
+    # allocated by the runtime.
+    def entry_alloca(self, vartype, name):
+        with self.builder.goto_entry_block():
+            return self.builder.alloca(vartype, name=name)
+
+    def field(self, descriptor, n):
+        return self.builder.gep(descriptor, [Constant(int_type, 0), Constant(int_type, n)])
+
+    def store_descriptor(self, descriptor, items, length):
+        self.builder.store(items, self.field(descriptor, 0))
+        self.builder.store(length, self.field(descriptor, 1))
+
+    def array_ref(self, name):
+        if name in self.arrays:
+            return self.arrays[name]
+        elif name in self.global_arrays:
+            return self.global_arrays[name]
+        else:
+            # Allocated at run time, or defined in another module
+            descriptor = self.globals[name]
+            return ArrayRef(descriptor, self.builder.load(self.field(descriptor, 0)),
+                            self.builder.load(self.field(descriptor, 1)))
+
+    def emit_global_array(self, element, name, length):
+        vartype = descriptor_type(element)
+        var = GlobalVariable(self.module, vartype, name=name)
+        if length is None:
+            var.initializer = Constant(vartype, None)
+        else:
+            storage = GlobalVariable(self.module, ArrayType(element, length), name=name + '.items')
+            storage.initializer = Constant(storage.value_type, None)
+            items = storage.gep([Constant(int_type, 0), Constant(int_type, 0)])
+            var.initializer = Constant(vartype, [items, Constant(int_type, length)])
+            self.global_arrays[name] = ArrayRef(var, items, Constant(int_type, length))
+        self.globals[name] = var
+
+    def emit_global_array_int(self, name, length):
+        self.emit_global_array(int_type, name, length)
+
+    def emit_global_array_float(self, name, length):
+        self.emit_global_array(float_type, name, length)
+
+    def emit_global_array_bool(self, name, length):
+        self.emit_global_array(bool_type, name, length)
+
+    def emit_alloc_array(self, element, name, length):
+        vartype = descriptor_type(element)
+        descriptor = self.entry_alloca(vartype, name)
+        self.locals[name] = descriptor
+        if length is None:
+            # No elements until new_array.  Freed when the function returns.
+            with self.builder.goto_entry_block():
+                self.builder.store(Constant(vartype, None), descriptor)
+            self.heap_arrays.append(descriptor)
+            return
+        storage = self.entry_alloca(ArrayType(element, length), name + '.items')
+        memset = self.module.declare_intrinsic('llvm.memset', [char_type.as_pointer(), IntType(64)])
+        self.builder.call(memset, [self.builder.bitcast(storage, char_type.as_pointer()),
+                                   Constant(char_type, 0),
+                                   Constant(IntType(64), length * element_sizes[element]),
+                                   Constant(bool_type, 0)])
+        items = self.builder.gep(storage, [Constant(int_type, 0), Constant(int_type, 0)])
+        self.store_descriptor(descriptor, items, Constant(int_type, length))
+        self.arrays[name] = ArrayRef(descriptor, items, Constant(int_type, length))
+
+    def emit_alloc_array_int(self, name, length):
+        self.emit_alloc_array(int_type, name, length)
+
+    def emit_alloc_array_float(self, name, length):
+        self.emit_alloc_array(float_type, name, length)
+
+    def emit_alloc_array_bool(self, name, length):
+        self.emit_alloc_array(bool_type, name, length)
+
+    def emit_new_array(self, element, name, size, lineno):
+        descriptor = self.lookup_var(name)
+        if name in self.locals:
+            # The array made the last time this declaration ran is gone
+            free = self.runtime_function('_gone_free_array', void_type, [char_type.as_pointer()])
+            old = self.builder.load(self.field(descriptor, 0))
+            self.builder.call(free, [self.builder.bitcast(old, char_type.as_pointer())])
+        new = self.runtime_function('_gone_new_array', char_type.as_pointer(),
+                                    [int_type, int_type, int_type])
+        length = self.temps[size]
+        items = self.builder.bitcast(
+            self.builder.call(new, [length, Constant(int_type, element_sizes[element]),
+                                    Constant(int_type, lineno)]),
+            element.as_pointer())
+        self.store_descriptor(descriptor, items, length)
+        if name in self.locals:
+            self.arrays[name] = ArrayRef(descriptor, items, length)
+
+    def emit_new_array_int(self, name, size, lineno):
+        self.emit_new_array(int_type, name, size, lineno)
+
+    def emit_new_array_float(self, name, size, lineno):
+        self.emit_new_array(float_type, name, size, lineno)
+
+    def emit_new_array_bool(self, name, size, lineno):
+        self.emit_new_array(bool_type, name, size, lineno)
+
+    def free_arrays(self):
+        # Free the arrays allocated by the function
+        for descriptor in self.heap_arrays:
+            free = self.runtime_function('_gone_free_array', void_type, [char_type.as_pointer()])
+            items = self.builder.load(self.field(descriptor, 0))
+            self.builder.call(free, [self.builder.bitcast(items, char_type.as_pointer())])
+
+    def emit_parm_array(self, name, num):
+        # The descriptor can't change while the function runs
+        descriptor = self.function.args[num]
+        descriptor.name = name
+        self.arrays[name] = ArrayRef(descriptor, self.builder.load(self.field(descriptor, 0)),
+                                     self.builder.load(self.field(descriptor, 1)))
+
+    emit_parm_array_int = emit_parm_array_float = emit_parm_array_bool = emit_parm_array
+
+    def emit_load_array(self, name, target):
+        self.temps[target] = self.array_ref(name)
+
+    emit_load_array_int = emit_load_array_float = emit_load_array_bool = emit_load_array
+
+    def emit_len_array(self, source, target):
+        self.temps[target] = self.temps[source].length
+
+    def emit_check_index(self, name, index, lineno):
+        check = self.runtime_function('_gone_check_index', void_type, [int_type, int_type, int_type])
+        self.builder.call(check, [self.temps[index], self.array_ref(name).length,
+                                  Constant(int_type, lineno)])
+
+    def element_pointer(self, name, index):
+        return self.builder.gep(self.array_ref(name).items, [self.temps[index]], inbounds=True)
+
+    def emit_load_index(self, name, index, target):
+        self.temps[target] = self.builder.load(self.element_pointer(name, index), target)
+
+    emit_load_index_int = emit_load_index_float = emit_load_index_bool = emit_load_index
+
+    def emit_store_index(self, source, name, index):
+        self.builder.store(self.temps[source], self.element_pointer(name, index))
+
+    emit_store_index_int = emit_store_index_float = emit_store_index_bool = emit_store_index
+
+    # Float operations.  In fast-math mode, LLVM may reassociate them,
+    # contract multiplies and adds into fused multiply-adds, assume
+    # there are no NaNs or infinities and ignore the sign of zero.
+    def float_op(self, instr):
+        if self.fast_math:
+            instr.flags.append('fast')
+        return instr
+
     # Binary + operator
     def emit_add_int(self, left, right, target):
         self.temps[target] = self.builder.add(self.temps[left], self.temps[right], target)
 
     def emit_add_float(self, left, right, target):
-        self.temps[target] = self.builder.fadd(self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fadd(self.temps[left], self.temps[right], target))
 
     # Binary - operator
     def emit_sub_int(self, left, right, target):
         self.temps[target] = self.builder.sub(self.temps[left], self.temps[right], target)
 
     def emit_sub_float(self, left, right, target):
-        self.temps[target] = self.builder.fsub(self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fsub(self.temps[left], self.temps[right], target))
 
     # Binary * operator
     def emit_mul_int(self, left, right, target):
         self.temps[target] = self.builder.mul(self.temps[left], self.temps[right], target)
 
     def emit_mul_float(self, left, right, target):
-        self.temps[target] = self.builder.fmul(self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fmul(self.temps[left], self.temps[right], target))
 
     # Binary / operator
     def emit_div_int(self, left, right, target):
         self.temps[target] = self.builder.sdiv(self.temps[left], self.temps[right], target)
 
     def emit_div_float(self, left, right, target):
-        self.temps[target] = self.builder.fdiv(self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fdiv(self.temps[left], self.temps[right], target))
 
     # Unary + operator
     def emit_uadd_int(self, source, target):
@@ -305,17 +663,17 @@ class GenerateLLVM(object):
             target)
 
     def emit_usub_float(self, source, target):
-        self.temps[target] = self.builder.fsub(
+        self.temps[target] = self.float_op(self.builder.fsub(
             Constant(float_type, 0.0),
             self.temps[source],
-            target)
+            target))
 
     # Binary < operator
     def emit_lt_int(self, left, right, target):
         self.temps[target] = self.builder.icmp_signed('<', self.temps[left], self.temps[right], target)
 
     def emit_lt_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('<', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('<', self.temps[left], self.temps[right], target))
 
 
     # Binary <= operator
@@ -323,7 +681,7 @@ class GenerateLLVM(object):
         self.temps[target] = self.builder.icmp_signed('<=', self.temps[left], self.temps[right], target)
 
     def emit_le_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('<=', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('<=', self.temps[left], self.temps[right], target))
 
 
     # Binary > operator
@@ -331,14 +689,14 @@ class GenerateLLVM(object):
         self.temps[target] = self.builder.icmp_signed('>', self.temps[left], self.temps[right], target)
 
     def emit_gt_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('>', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('>', self.temps[left], self.temps[right], target))
 
     # Binary >= operator
     def emit_ge_int(self, left, right, target):
         self.temps[target] = self.builder.icmp_signed('>=', self.temps[left], self.temps[right], target)
 
     def emit_ge_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('>=', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('>=', self.temps[left], self.temps[right], target))
 
     # Binary == operator
     def emit_eq_int(self, left, right, target):
@@ -348,7 +706,7 @@ class GenerateLLVM(object):
         self.temps[target] = self.builder.icmp_signed('==', self.temps[left], self.temps[right], target)
 
     def emit_eq_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('==', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('==', self.temps[left], self.temps[right], target))
 
     # Binary != operator
     def emit_ne_int(self, left, right, target):
@@ -358,7 +716,7 @@ class GenerateLLVM(object):
         self.temps[target] = self.builder.icmp_signed('!=', self.temps[left], self.temps[right], target)
 
     def emit_ne_float(self, left, right, target):
-        self.temps[target] = self.builder.fcmp_ordered('!=', self.temps[left], self.temps[right], target)
+        self.temps[target] = self.float_op(self.builder.fcmp_ordered('!=', self.temps[left], self.temps[right], target))
 
     # Binary && operator
     def emit_and_bool(self, left, right, target):
@@ -388,14 +746,48 @@ class GenerateLLVM(object):
         rettype = typemap[rettypename]
         parmtypes = [typemap[pname] for pname in parmtypenames]
         func_type = FunctionType(rettype, parmtypes)
-        self.globals[name] = Function(self.module, func_type, name=name)
+        self.globals[name] = Function(self.module, func_type, name=runtime_externs.get(name, name))
+
+    # Global variables and init functions of other modules (see modules.py)
+    def emit_extern_int(self, name):
+        self.declare_global(name, 'int')
+
+    def emit_extern_float(self, name):
+        self.declare_global(name, 'float')
+
+    def emit_extern_bool(self, name):
+        self.declare_global(name, 'bool')
+
+    def emit_extern_array_int(self, name):
+        self.declare_global(name, 'array_int')
+
+    def emit_extern_array_float(self, name):
+        self.declare_global(name, 'array_float')
+
+    def emit_extern_array_bool(self, name):
+        self.declare_global(name, 'array_bool')
+
+    def emit_init_module(self, name):
+        func = Function(self.module, FunctionType(void_type, []), name='__init_' + name)
+        self.builder.call(func, [])
 
     # Call an external function.
     def emit_call_func(self, funcname, *args):
         target = args[-1]
-        func = self.globals[funcname]
+        if funcname in self.slots:
+            func = self.builder.load(self.slots[funcname])
+        else:
+            func = self.globals[funcname]
         argvals = [self.temps[name] for name in args[:-1]]
+        # Arrays are passed as the address of their descriptor
+        argvals = [value.descriptor if isinstance(value, ArrayRef) else value for value in argvals]
         self.temps[target] = self.builder.call(func, argvals)
+        if funcname in self.slots and self.abort_flag is not None:
+            self.temps[target + '.aborted'] = self.builder.icmp_signed('!=', self.builder.load(self.abort_flag),
+                                                                       Constant(int_type, 0))
+            called = self.add_block('called')
+            self.cbranch(target + '.aborted', self.exit_block, called)
+            self.set_block(called)
 
     # Return statements
     def emit_return_int(self, source):
@@ -429,6 +821,10 @@ class GenerateLLVM(object):
         self.builder.store(self.function.args[num], var)
         self.locals[name] = var
 
+def llvm_function_name(name):
+    # Gone's main() is renamed so it doesn't clash with the C main()
+    return '_gone_main' if name == 'main' else name
+
 # This class walks the basic block structure of our intermediate code
 # and turns it into LLVM blocks.   It uses a few methods added to the
 # GenerateLLVM() class defined above.
@@ -437,11 +833,7 @@ class GenerateBlocksLLVM(bblock.BlockVisitor):
         self.generator = generator
 
     def generate_function(self, func):
-        if func.name == 'main':
-            name = '_gone_main'
-        else:
-            name = func.name
-
+        name = llvm_function_name(func.name)
         self.generator.start_function(name, func.return_type, func.parameters)
         self.visit(func.start_block)
         self.generator.terminate()
@@ -500,38 +892,311 @@ class GenerateBlocksLLVM(bblock.BlockVisitor):
         
         self.generator.set_block(after_loop)
 
-#######################################################################
-#                 DO NOT MODIFY ANYTHING BELOW HERE
-#######################################################################
+    def visit_ForBlock(self, block):
+        # A canonical counted loop.  The number of trips is computed
+        # before the loop, and a counter goes from 0 up to it alongside
+        # the loop variable, so LLVM knows the trip count and the loop
+        # variable never overflows.  The back-edge is tagged with
+        # llvm.loop metadata (see GenerateLLVM.loop_metadata()).
+        gen = self.generator
+        gen.generate_code(block)
+        start = gen.temps[block.start]
+        count = gen.trip_count(start, gen.temps[block.stop], block.step)
+        preheader = gen.builder.block
+
+        test_block = gen.add_block('fortest')
+        loop_block = gen.add_block('for')
+        after_loop = gen.add_block('afterfor')
+        gen.branch(test_block)
+        gen.start_loop(test_block, assigned_variables(block.body))
+        trips = gen.builder.phi(int_type, name='trips')
+        trips.add_incoming(Constant(int_type, 0), preheader)
+        value = gen.builder.phi(int_type, name=block.var)
+        value.add_incoming(start, preheader)
+        gen.temps[block.testvar] = gen.builder.icmp_unsigned('<', trips, count, block.testvar)
+        gen.cbranch(block.testvar, loop_block, after_loop)
 
-def compile_llvm(source):
-    from .ircode import compile_ircode
+        # Emit the loop body
+        gen.set_block(loop_block)
+        gen.set_variable(block.var, value)
+        self.visit(block.body)
+
+        # Step and branch back, unless the body ended with a return
+        if gen.last_branch != gen.block:
+            latch = gen.builder.block
+            trips.add_incoming(gen.builder.add(trips, Constant(int_type, 1), flags=['nuw']), latch)
+            value.add_incoming(gen.builder.add(value, Constant(int_type, block.step)), latch)
+            gen.branch(test_block)
+            latch.instructions[-1].set_metadata('llvm.loop',
+                                                gen.loop_metadata(gen.vectorizable(block)))
+        gen.end_loop(test_block)
+
+        gen.set_block(after_loop)
+
+# SSA code generation.  The generator above keeps every local variable
+# in an alloca'd stack slot and loads/stores it on every access.  LLVM's
+# mem2reg pass cleans that up, but only when optimizing, and it costs
+# compile time.  The classes below instead keep track of the current
+# value of each local variable as code is generated and build phi nodes
+# where control flow merges:
+#
+#    merge      A phi for each variable whose value differs between
+#               the then and else branches.
+#    whiletest  A phi for each variable assigned in the loop body.
+#               The loop body is scanned for stores before it is
+#               generated so the phis can be made up front.  Their
+#               back-edge values are filled in once the body is done.
+#    exit       A phi for the return value.
+#
+# Global variables are still accessed through memory.
+
+class GenerateSSALLVM(GenerateLLVM):
+    def start_function(self, name, rettypename, parmtypenames):
+        super().start_function(name, rettypename, parmtypenames)
 
-    # Compile intermediate code and get the function list
-    functions = compile_ircode(source)
+        # Current value of each local variable
+        self.values = {}
 
-    # Make the low-level code generator
-    generator = GenerateLLVM()
+        # Variable values on each edge into a block: block -> [(pred, values)]
+        self.incoming = {}
 
-    # Make the block generator
-    blockgen = GenerateBlocksLLVM(generator)
+        # Phi nodes for loop-carried variables: block -> {name: phi}
+        self.loop_phis = {}
 
-    for func in functions:
-        blockgen.generate_function(func)
+    def declare_return(self, rettype):
+        # The return value is tracked in self.values like any other variable
+        pass
 
-    return str(generator.module)
+    def add_incoming(self, block):
+        self.incoming.setdefault(block, []).append((self.block, dict(self.values)))
 
-def main():
-    import sys
+    def cbranch(self, testvar, true_block, false_block):
+        self.add_incoming(true_block)
+        self.add_incoming(false_block)
+        super().cbranch(testvar, true_block, false_block)
+
+    def branch(self, next_block):
+        if self.last_branch != self.block:
+            self.add_incoming(next_block)
+        super().branch(next_block)
+
+    def set_block(self, block):
+        super().set_block(block)
+        preds = self.incoming.get(block)
+        if not preds:
+            # Unreachable block.  Any values will do.
+            return
+
+        self.values = {}
+        names = set().union(*(values for _, values in preds))
+        for name in sorted(names):
+            incoming = [ (pred, values.get(name)) for pred, values in preds ]
+            if name == 'return':
+                # No return value on paths that fall off the end of the function
+                undefined = Constant(self.return_type, Undefined)
+                incoming = [ (pred, undefined if value is None else value) for pred, value in incoming ]
+            elif any(value is None for _, value in incoming):
+                # Went out of scope on some path
+                continue
+            first = incoming[0][1]
+            if all(value is first for _, value in incoming):
+                self.values[name] = first
+            else:
+                phi = self.builder.phi(first.type, name=name)
+                for pred, value in incoming:
+                    phi.add_incoming(value, pred)
+                self.values[name] = phi
+
+    def start_loop(self, block, assigned):
+        '''
+        Make phi nodes at the top of loop test block for variables
+        assigned in the loop body.  Called instead of set_block().
+        '''
+        super().set_block(block)
+        phis = {}
+        if block in self.incoming:
+            (pred, values), = self.incoming[block]
+            self.values = dict(values)
+            for name in sorted(assigned):
+                if name in values:
+                    phi = self.builder.phi(values[name].type, name=name)
+                    phi.add_incoming(values[name], pred)
+                    self.values[name] = phis[name] = phi
+        self.loop_phis[block] = phis
+
+    def end_loop(self, block):
+        '''
+        Fill in the back-edge values of the loop test block phi nodes
+        '''
+        for pred, values in self.incoming[block][1:]:
+            for name, phi in self.loop_phis[block].items():
+                phi.add_incoming(values.get(name, phi), pred)
+
+    def terminate(self):
+        self.branch(self.exit_block)
+        self.set_block(self.exit_block)
+        self.free_arrays()
+        if self.return_type is void_type:
+            self.builder.ret_void()
+        elif 'return' in self.values:
+            self.builder.ret(self.values['return'])
+        else:
+            self.builder.ret(Constant(self.return_type, Undefined))
+
+    # Local variables live in self.values.  Anything else is a global.
+    def emit_alloc_int(self, name):
+        self.values[name] = Constant(int_type, 0)
+
+    def emit_alloc_float(self, name):
+        self.values[name] = Constant(float_type, 0.0)
 
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.llvmgen filename\n')
-        raise SystemExit(1)
+    def emit_alloc_bool(self, name):
+        self.values[name] = Constant(bool_type, 0)
+
+    def emit_parm(self, name, num):
+        arg = self.function.args[num]
+        arg.name = name
+        self.values[name] = arg
+
+    emit_parm_int = emit_parm_float = emit_parm_bool = emit_parm
+
+    def emit_load(self, name, target):
+        if name in self.values:
+            self.temps[target] = self.values[name]
+        else:
+            self.temps[target] = self.builder.load(self.globals[name], target)
+
+    emit_load_int = emit_load_float = emit_load_bool = emit_load
+
+    def emit_store(self, source, target):
+        if target in self.values:
+            self.values[target] = self.temps[source]
+        else:
+            self.builder.store(self.temps[source], self.globals[target])
 
-    source = open(sys.argv[1]).read()
-    llvm_code = compile_llvm(source)
+    emit_store_int = emit_store_float = emit_store_bool = emit_store
+
+    def set_variable(self, name, value):
+        if name in self.values:
+            self.values[name] = value
+        else:
+            self.builder.store(value, self.globals[name])
+
+    def emit_return(self, source):
+        self.values['return'] = self.temps[source]
+        self.branch(self.exit_block)
+
+    emit_return_int = emit_return_float = emit_return_bool = emit_return
+
+class GenerateBlocksSSALLVM(GenerateBlocksLLVM):
+    def visit_WhileBlock(self, block):
+        test_block = self.generator.add_block('whiletest')
+        self.generator.branch(test_block)
+        self.generator.start_loop(test_block, assigned_variables(block.body))
+
+        self.generator.generate_code(block)
+        loop_block = self.generator.add_block('loop')
+        after_loop = self.generator.add_block('afterloop')
+        self.generator.cbranch(block.testvar, loop_block, after_loop)
+
+        self.generator.set_block(loop_block)
+        self.visit(block.body)
+        self.generator.branch(test_block)
+        self.generator.end_loop(test_block)
+
+        self.generator.set_block(after_loop)
+
+def assigned_variables(block):
+    '''
+    Return the set of variable names stored to anywhere in a chain of
+    blocks (including nested if/while blocks)
+    '''
+    names = set()
+    while isinstance(block, bblock.Block):
+        for op in block.instructions:
+            if op[0].startswith('store_'):
+                names.add(op[2])
+        if isinstance(block, bblock.IfBlock):
+            names |= assigned_variables(block.if_branch)
+            names |= assigned_variables(block.else_branch)
+        elif isinstance(block, bblock.WhileBlock):
+            names |= assigned_variables(block.body)
+        block = block.next_block
+    return names
+
+#######################################################################
+#                 DO NOT MODIFY ANYTHING BELOW HERE
+#######################################################################
+
+def make_generator(ssa=False, fast_math=False):
+    '''
+    Make the low-level code generator and the block generator that
+    drives it.  Returns (generator, blockgen).
+    '''
+    if ssa:
+        generator = GenerateSSALLVM(fast_math=fast_math)
+        return generator, GenerateBlocksSSALLVM(generator)
+    else:
+        generator = GenerateLLVM(fast_math=fast_math)
+        return generator, GenerateBlocksLLVM(generator)
+
+def generate_llvm(functions, ssa=False, fast_math=False):
+    '''
+    Generate LLVM IR (a string) for a list of intermediate code functions
+    '''
+    from .timing import phase
+
+    with phase('llvmgen'):
+        generator, blockgen = make_generator(ssa, fast_math)
+        for func in functions:
+            blockgen.generate_function(func)
+
+        return str(generator.module)
+
+def compile_llvm(source, ssa=False, fast_math=False, session=None):
+    '''
+    Compile source to LLVM IR (a string).  If ssa is True, local
+    variables are kept in SSA registers instead of stack slots.  If
+    fast_math is True, float operations may be optimized in ways that
+    change their results (see GenerateLLVM.float_op()).  Errors are
+    reported to session (see session.py), if given.  The 'ssa' and
+    'fast_math' options of the session turn these on as well.
+    '''
+    from .ircode import compile_ircode
+    from .session import using_session
+
+    with using_session(session) as session:
+        # Compile intermediate code and get the function list
+        functions = compile_ircode(source)
+        ssa = ssa or session.options.get('ssa', False)
+        fast_math = fast_math or session.options.get('fast_math', False)
+        llvm_code = generate_llvm(functions, ssa, fast_math)
+        session.remember('llvm', llvm_code)
+    return llvm_code
+
+def main():
+    import argparse
+    from .timing import enable_timing, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.llvmgen')
+    argparser.add_argument('filename')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
+
+    source = open(args.filename).read()
+    llvm_code = compile_llvm(source, args.ssa, args.fast_math)
     print(llvm_code)
 
+    if args.time_passes:
+        print_timings()
+
 if __name__ == '__main__':
     main()
 
@@ -0,0 +1,355 @@
+# gone/modules.py
+'''
+Modules
+=======
+
+A program can be split into several files.  A declaration such as::
+
+    import geometry;
+
+makes the functions, constants and variables defined at the top level
+of geometry.g available to the rest of the file.  Names aren't
+qualified: as with extern, all the modules of a program share one
+namespace.  main() and names a module imports itself are not exported.
+
+Each module is compiled on its own into an object file (geometry.o)
+and an interface file (geometry.gi).  The interface is a small JSON
+file with the signatures of everything the module exports::
+
+    {"module": "geometry",
+     "functions": [["area", "float", ["float", "float"]]],
+     "consts": [["PI", "float", 3.14159], ["START", "int", null]],
+     "vars": [["count", "int"], ["samples", "float[]"]],
+     "imports": {"vector": "<key of vector.gi>"},
+     "source": "<hash of geometry.g>",
+     "options": {...}}
+
+Importers are checked against the interface alone.  The source of an
+imported module is only read to see if it changed, never parsed, unless
+the module has to be built again.  That happens when its source or the
+code generation options changed, or when the interface of a module it
+imports changed.  Changing the body of a function changes a module's
+object file but not its interface, so the modules that import it are
+left alone.
+
+The values of constants are part of the interface when they are known
+at compile time, and importers use them directly (see
+checker.constant_value()).  Other constants are read from the module's
+storage, like variables.
+
+The global declarations of each module are run by its own init
+function (__init_geometry).  The __init of the main program calls those
+of all the modules it uses, directly or not, in dependency order.
+
+ModuleLoader finds, builds and loads modules.  run.py and compile.py
+make one and link the object files of the modules it loaded with the
+program::
+
+    bash % python3 -m gone.run -I lib/ program.g
+'''
+
+import os
+import json
+import hashlib
+import tempfile
+
+from .ast import FunctionPrototype, ParmDeclaration, VarDeclaration, ConstDeclaration, \
+    FunctionDeclaration, ImportDeclaration, Typename, ArrayType
+from .errors import error
+
+# Version of the interface file format
+interface_format = 2
+
+class Interface(object):
+    '''
+    What a module exports.  functions is a list of (name, rettypename,
+    parmtypenames), consts a list of (name, typename, value) where value
+    is None unless known at compile time, and vars a list of (name,
+    typename).
+    imports maps the modules it imports to the keys of their interfaces
+    when it was built.  source is a hash of the module's source and
+    options the code generation options it was built with.
+    '''
+    def __init__(self, name, functions, consts, vars, imports, source, options):
+        self.name = name
+        self.functions = functions
+        self.consts = consts
+        self.vars = vars
+        self.imports = imports
+        self.source = source
+        self.options = options
+
+    @property
+    def key(self):
+        '''
+        Hash of the exported declarations.  Importers must be built
+        again when it changes.
+        '''
+        exports = json.dumps([self.functions, self.consts, self.vars])
+        return hashlib.sha1(exports.encode('utf-8')).hexdigest()
+
+    def declarations(self, lineno):
+        '''
+        Make AST nodes declaring the exported names (for the checker)
+        '''
+        nodes = []
+        for name, rettypename, parmtypenames in self.functions:
+            parms = [ ParmDeclaration('arg%d' % n, type_node(typename, lineno), lineno=lineno)
+                      for n, typename in enumerate(parmtypenames) ]
+            nodes.append(FunctionPrototype(name, parms, Typename(rettypename, lineno=lineno),
+                                           lineno=lineno))
+        for name, typename, value in self.consts:
+            nodes.append(ConstDeclaration(name, None, typename=Typename(typename, lineno=lineno),
+                                          value=value, lineno=lineno))
+        for name, typename in self.vars:
+            nodes.append(VarDeclaration(name, type_node(typename, lineno), None, lineno=lineno))
+        return nodes
+
+    def to_json(self):
+        return json.dumps({ 'format' : interface_format, 'module' : self.name,
+                            'functions' : self.functions, 'consts' : self.consts,
+                            'vars' : self.vars, 'imports' : self.imports,
+                            'source' : self.source, 'options' : self.options },
+                          indent=1, sort_keys=True)
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        if data.get('format') != interface_format:
+            raise ValueError('Unsupported interface format')
+        return cls(data['module'], [ (name, rettypename, list(parmtypenames))
+                                     for name, rettypename, parmtypenames in data['functions'] ],
+                   [ tuple(const) for const in data['consts'] ],
+                   [ tuple(var) for var in data['vars'] ],
+                   data['imports'], data['source'], data['options'])
+
+def type_node(typename, lineno):
+    '''
+    Make the AST node for a type name of an interface.  An array type
+    (int[]) is an array of any size.
+    '''
+    if typename.endswith('[]'):
+        return ArrayType(Typename(typename[:-2], lineno=lineno), None, lineno=lineno)
+    return Typename(typename, lineno=lineno)
+
+def module_interface(ast, name, source, options, imports):
+    '''
+    Make the interface of a checked module
+    '''
+    functions = []
+    consts = []
+    vars = []
+    statements = ast.statements.statements if ast.statements else []
+    for stmt in statements:
+        if isinstance(stmt, FunctionDeclaration) and stmt.prototype.name != 'main':
+            functions.append((stmt.prototype.name, str(stmt.prototype.type),
+                              [ str(parm.type) for parm in stmt.prototype.parameters ]))
+        elif isinstance(stmt, ConstDeclaration):
+            consts.append((stmt.name, str(stmt.type), stmt.value))
+        elif isinstance(stmt, VarDeclaration):
+            vars.append((stmt.name, str(stmt.type)))
+    return Interface(name, functions, consts, vars, imports, source, options)
+
+def source_hash(source):
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def write_file(filename, data):
+    '''
+    Replace the contents of a file in one step, so that a concurrent
+    build never sees it half written
+    '''
+    directory = os.path.dirname(filename) or '.'
+    fd, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmpname, filename)
+    finally:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+
+class ModuleLoader(object):
+    '''
+    Finds, builds and loads the modules imported by a program.  path is
+    the list of directories searched for name.g.  Interface and object
+    files are written next to each source, or into outdir if given.
+    The remaining arguments are the options modules are compiled with.
+    '''
+    def __init__(self, path=None, outdir=None, opt_level=0, ssa=False, fast_math=False,
+                 cpu=None, features=None):
+        self.path = list(path) if path else ['.']
+        self.outdir = outdir
+        self.options = { 'opt_level' : opt_level, 'ssa' : ssa, 'fast_math' : fast_math,
+                         'cpu' : cpu, 'features' : features }
+
+        # Interfaces loaded so far {name: Interface}, and the order in
+        # which they finished loading (each after the modules it imports)
+        self.interfaces = {}
+        self.order = []
+
+        # Source file of each module {name: filename}
+        self.sources = {}
+
+        # Modules being loaded (to find import cycles), and modules that
+        # couldn't be loaded (their errors have been reported already)
+        self.loading = []
+        self.failed = set()
+
+        # Modules compiled (because they were out of date)
+        self.built = []
+
+    def find_source(self, name):
+        for directory in self.path:
+            filename = os.path.join(directory, name + '.g')
+            if os.path.exists(filename):
+                return filename
+        return None
+
+    def output_filename(self, source, extension):
+        base = os.path.splitext(source)[0] + extension
+        if self.outdir is not None:
+            base = os.path.join(self.outdir, os.path.basename(base))
+        return base
+
+    def load(self, name, lineno):
+        '''
+        Return the interface of a module, building it first if it is out
+        of date.  Problems are reported at lineno of the current session
+        (the import).  Returns None if the module can't be loaded.
+        '''
+        if name in self.interfaces:
+            return self.interfaces[name]
+        if name in self.failed:
+            return None
+        if name in self.loading:
+            cycle = self.loading[self.loading.index(name):] + [ name ]
+            error(lineno, 'Import cycle: %s' % ' -> '.join(cycle))
+            return None
+
+        filename = self.find_source(name)
+        if filename is None:
+            error(lineno, 'No module named %s' % name)
+            return None
+        with open(filename) as f:
+            source = f.read()
+
+        self.loading.append(name)
+        try:
+            interface = self.load_interface(filename, source)
+            if interface is None:
+                interface = self.build(name, filename, source, lineno)
+        finally:
+            self.loading.pop()
+
+        if interface is not None:
+            self.sources[name] = filename
+            self.interfaces[name] = interface
+            self.order.append(name)
+        else:
+            self.failed.add(name)
+        return interface
+
+    def load_interface(self, filename, source):
+        '''
+        Return the interface of a module from its interface file, or
+        None if the module is out of date
+        '''
+        try:
+            with open(self.output_filename(filename, '.gi')) as f:
+                interface = Interface.from_json(f.read())
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if (interface.source != source_hash(source) or interface.options != self.options or
+            not os.path.exists(self.output_filename(filename, '.o'))):
+            return None
+
+        # The modules it imports must still export the same things.  If
+        # one can't be loaded, building the module reports the problem.
+        for dep, key in interface.imports.items():
+            if dep in self.loading or self.find_source(dep) is None:
+                return None
+            dep_interface = self.load(dep, 0)
+            if dep_interface is None or dep_interface.key != key:
+                return None
+        return interface
+
+    def build(self, name, filename, source, lineno):
+        '''
+        Compile a module into its object and interface files.  Errors
+        in the module are reported with its own file name.
+        '''
+        from .parser import parse
+        from .checker import check_program
+        from .ircode import GenerateCode
+        from .llvmgen import generate_llvm
+        from .run import create_target_machine, parse_module
+        from .session import CompilationSession
+        from .timing import phase
+
+        session = CompilationSession(filename=filename, options=dict(self.options, module=name),
+                                     echo=False, cache=False, modules=self)
+        ast = parse(source, session)
+        statements = ast.statements.statements if ast and ast.statements else []
+        # If an import fails, checking the rest would only report names
+        # it should have defined
+        imported = not session.errors_reported()
+        with session.active():
+            for stmt in statements:
+                if imported and isinstance(stmt, ImportDeclaration):
+                    imported = self.load(stmt.name, stmt.lineno) is not None
+        if imported:
+            check_program(ast, session)
+            for stmt in statements:
+                if isinstance(stmt, FunctionDeclaration) and stmt.prototype.name == 'main':
+                    session.error(stmt.lineno, 'A module can not define main()')
+        if session.errors_reported() or not imported:
+            # Pass the errors on to the importer
+            for diag_filename, diag_lineno, message in session.diagnostics:
+                error(diag_lineno, message, diag_filename)
+            return None
+
+        gen = GenerateCode()
+        with phase('ircode'):
+            gen.visit(ast)
+        functions = gen.functions
+        functions[0].name = '__init_' + name
+        llvm_code = generate_llvm(functions, self.options['ssa'], self.options['fast_math'])
+
+        # Position independent, so the object can go into an executable or the JIT
+        target_machine = create_target_machine(self.options['opt_level'], reloc='pic',
+                                               cpu=self.options['cpu'],
+                                               features=self.options['features'],
+                                               codemodel='small')
+        mod = parse_module(llvm_code, self.options['opt_level'], target_machine)
+        with phase('codegen'):
+            obj = target_machine.emit_object(mod)
+
+        imports = { stmt.name: self.interfaces[stmt.name].key for stmt in statements
+                    if isinstance(stmt, ImportDeclaration) }
+        interface = module_interface(ast, name, source_hash(source), self.options, imports)
+
+        # The interface goes last.  A module is only up to date once both exist.
+        write_file(self.output_filename(filename, '.o'), obj)
+        write_file(self.output_filename(filename, '.gi'), interface.to_json().encode('utf-8'))
+        self.built.append(name)
+        return interface
+
+    def init_order(self, name):
+        '''
+        Return the modules that name needs (itself included), each after
+        the modules it imports
+        '''
+        order = []
+        def visit(module):
+            if module not in order:
+                for dep in sorted(self.interfaces[module].imports):
+                    visit(dep)
+                order.append(module)
+        visit(name)
+        return order
+
+    def objects(self):
+        '''
+        Return the object files of all modules loaded
+        '''
+        return [ self.output_filename(self.sources[name], '.o') for name in self.order ]
@@ -0,0 +1,210 @@
+# gone/parallel.py
+'''
+Parallel Code Generation
+========================
+
+compile_llvm() puts every function into a single LLVM module, and
+building, optimizing and generating machine code for that module
+happens one function at a time.  For programs with thousands of
+functions, that is most of the compile time.
+
+This file splits the functions of a program into partitions of about
+equal size and compiles each partition into its own LLVM module in a
+separate process.  llvmlite objects can't be passed between processes,
+so each worker builds its module from the intermediate code, optimizes
+it, and sends back an object file.  The object files are then linked
+into an executable (compile.py) or loaded into the JIT (run.py).
+
+Every partition declares everything it uses from elsewhere.  That
+includes the global variables (defined by __init), the extern
+functions and any functions in other partitions that it calls.  The
+declarations are made from the same intermediate code, so the
+signatures always agree.
+
+Use -j with run.py or compile.py::
+
+    bash % python3 -m gone.compile -j 8 big.g
+'''
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from . import bblock
+from .timing import phase
+
+def count_instructions(block):
+    '''
+    Count the instructions in a chain of blocks (including nested blocks)
+    '''
+    count = 0
+    while isinstance(block, bblock.Block):
+        count += len(block.instructions)
+        if isinstance(block, bblock.IfBlock):
+            count += count_instructions(block.if_branch) + count_instructions(block.else_branch)
+        elif isinstance(block, bblock.WhileBlock):
+            count += count_instructions(block.body)
+        block = block.next_block
+    return count
+
+def iter_instructions(block):
+    '''
+    Iterate over the instructions in a chain of blocks (including nested blocks)
+    '''
+    while isinstance(block, bblock.Block):
+        yield from block.instructions
+        if isinstance(block, bblock.IfBlock):
+            yield from iter_instructions(block.if_branch)
+            yield from iter_instructions(block.else_branch)
+        elif isinstance(block, bblock.WhileBlock):
+            yield from iter_instructions(block.body)
+        block = block.next_block
+
+def partition_functions(functions, count):
+    '''
+    Split a list of functions into at most count lists of roughly equal
+    total size.  __init always goes in the first partition.  The
+    functions in each partition keep their original order.
+    '''
+    sizes = [ count_instructions(func.start_block) for func in functions ]
+    totals = [0] * count
+    assignment = [0] * len(functions)
+    # Largest functions first, each into the partition that is smallest so far
+    for n in sorted(range(len(functions)), key=lambda n: -sizes[n]):
+        if functions[n].name == '__init':
+            part = 0
+        else:
+            part = totals.index(min(totals))
+        assignment[n] = part
+        totals[part] += sizes[n]
+    partitions = [ [ func for func, part in zip(functions, assignment) if part == p ]
+                   for p in range(count) ]
+    return [ partition for partition in partitions if partition ]
+
+def module_declarations(functions):
+    '''
+    Return the global variables [(name, typename)], extern functions
+    [(name, rettypename, parmtypenames)] and function signatures
+    {name: (rettypename, parmtypenames)} of a program
+    '''
+    global_vars = []
+    externs = []
+    for func in functions:
+        if func.name == '__init':
+            for op in iter_instructions(func.start_block):
+                if op[0].startswith('global_'):
+                    global_vars.append((op[1], op[0][7:]))
+                elif op[0] in ('extern_int', 'extern_float', 'extern_bool', 'extern_array_int',
+                               'extern_array_float', 'extern_array_bool'):
+                    global_vars.append((op[1], op[0][7:]))
+                elif op[0] == 'extern_func':
+                    externs.append((op[1], op[2], list(op[3:])))
+    signatures = { func.name: (func.return_type, func.parameters) for func in functions }
+    return global_vars, externs, signatures
+
+def generate_partition(functions, declarations, ssa=False, fast_math=False, slots=None,
+                       abort_flag=None):
+    '''
+    Generate the LLVM IR (a string) for one partition of a program.
+    If slots (a dict mapping function names to addresses) is given,
+    functions in other partitions are called through the function
+    pointers at those addresses instead of by name.  If abort_flag
+    (the address of an int) is also given, each function returns
+    right after such a call if the int is nonzero.
+    '''
+    from .llvmgen import make_generator, llvm_function_name
+
+    global_vars, externs, signatures = declarations
+    generator, blockgen = make_generator(ssa, fast_math)
+    if abort_flag is not None:
+        generator.declare_abort_flag(abort_flag)
+
+    # The partition holding __init defines the globals and externs itself
+    defined = { func.name for func in functions }
+    if '__init' not in defined:
+        for name, typename in global_vars:
+            generator.declare_global(name, typename)
+        for name, rettypename, parmtypenames in externs:
+            generator.emit_extern_func(name, rettypename, *parmtypenames)
+
+    called = { op[1] for func in functions for op in iter_instructions(func.start_block)
+               if op[0] == 'call_func' }
+    for name in sorted(called - defined):
+        if name not in signatures:
+            continue
+        if slots is not None:
+            generator.declare_slot(name, *signatures[name], slots[name])
+        else:
+            generator.declare_function(llvm_function_name(name), *signatures[name])
+
+    for func in functions:
+        blockgen.generate_function(func)
+    return str(generator.module)
+
+def compile_partition(functions, declarations, options):
+    '''
+    Worker process: compile one partition into an object file.  Returns
+    the contents of the object file as bytes.
+    '''
+    from .run import create_target_machine, parse_module
+
+    llvm_code = generate_partition(functions, declarations, options['ssa'], options['fast_math'])
+    if options['jit']:
+        # Same code model as run.compile_jit()
+        target_machine = create_target_machine(options['opt_level'],
+                                               cpu=options['cpu'], features=options['features'])
+    else:
+        target_machine = create_target_machine(options['opt_level'], reloc='pic',
+                                               cpu=options['cpu'], features=options['features'],
+                                               codemodel='small')
+    mod = parse_module(llvm_code, options['opt_level'], target_machine)
+    return target_machine.emit_object(mod)
+
+def compile_parallel(functions, jobs=None, opt_level=0, ssa=False, fast_math=False,
+                     cpu=None, features=None, jit=False):
+    '''
+    Compile the intermediate code functions of a program in jobs
+    processes (default: one per CPU).  Returns a list of object files
+    (as bytes).  If jit is True, the object files are meant to be
+    loaded into the JIT instead of linked.
+    '''
+    jobs = jobs or os.cpu_count()
+    partitions = partition_functions(functions, jobs)
+    declarations = module_declarations(functions)
+    options = { 'opt_level' : opt_level, 'ssa' : ssa, 'fast_math' : fast_math,
+                'cpu' : cpu, 'features' : features, 'jit' : jit }
+    with phase('codegen'):
+        with ProcessPoolExecutor(len(partitions)) as pool:
+            futures = [ pool.submit(compile_partition, partition, declarations, options)
+                        for partition in partitions ]
+            return [ future.result() for future in futures ]
+
+def compile_jit_parallel(functions, jobs=None, opt_level=0, ssa=False, fast_math=False,
+                         cpu=None, features=None, extra_objects=()):
+    '''
+    Compile a program in parallel and load the object files into the
+    JIT, along with the object files named in extra_objects.  Returns
+    the execution engine (see run.compile_jit()).
+    '''
+    from .run import load_runtime, create_target_machine
+
+    load_runtime()
+    objects = compile_parallel(functions, jobs, opt_level, ssa, fast_math, cpu, features, jit=True)
+    target_machine = create_target_machine(opt_level, cpu=cpu, features=features)
+    return load_objects(objects + list(extra_objects), target_machine)
+
+def load_objects(objects, target_machine):
+    '''
+    Load object files (made for the JIT) into a new execution engine
+    and return it.  Each object is its contents (bytes) or a file
+    name.  The engine takes ownership of target_machine, which can't
+    be used once the engine is gone.
+    '''
+    import llvmlite.binding as llvm
+
+    with phase('jit-finalize'):
+        engine = llvm.create_mcjit_compiler(llvm.parse_assembly(''), target_machine)
+        for obj in objects:
+            engine.add_object_file(obj if isinstance(obj, str) else llvm.ObjectFileRef.from_data(obj))
+        engine.finalize_object()
+        engine.run_static_constructors()
+    return engine
@@ -15,10 +15,12 @@ statements :  statements statement
 statement :  const_declaration
           |  var_declaration
           |  extern_declaration
+          |  import_declaration
           |  assign_statement
           |  print_statement
           |  if_statement
           |  while_statement
+          |  for_statement
           |  return_statement
           |  func_declaration
     
@@ -29,6 +31,8 @@ var_declaration : VAR ID datatype ;
 
 extern_declaration : EXTERN func_prototype ;
 
+import_declaration : IMPORT ID ;
+
 assign_statement : location = expression ;
 
 print_statement : PRINT expression ;
@@ -38,6 +42,11 @@ if_statement : IF expression { statements }
 
 while_statement : WHILE expression { statements }
 
+for_statement : FOR ID in expression .. expression { statements }
+              | FOR ID in expression .. expression by expression { statements }
+
+(in and by are only special here.  They can still be used as names.)
+
 return_statement : RETURN expression ;
 
 func_declaration : func_prototype { statements }
@@ -120,6 +129,9 @@ from .tokenizer import GoneLexer
 # Read instructions in ast.py
 from .ast import *
 
+from .timing import phase, timing_enabled
+from .session import using_session
+
 class GoneParser(Parser):
     # Same token set as defined in the lexer
     tokens = GoneLexer.tokens
@@ -189,10 +201,12 @@ class GoneParser(Parser):
        'var_declaration',
        'func_declaration',
        'extern_declaration',
+       'import_declaration',
        'assign_statement',
        'print_statement',
        'ifelse_statement',
        'while_statement',
+       'for_statement',
        'return_statement')
     def statement(self, p):
         return p[0]
@@ -217,6 +231,10 @@ class GoneParser(Parser):
     def extern_declaration(self, p):
         return ExternFunctionDeclaration(p.func_prototype, lineno=p.lineno)
 
+    @_('IMPORT ID SEMI')
+    def import_declaration(self, p):
+        return ImportDeclaration(p.ID, lineno=p.lineno)
+
     @_('FUNC ID LPAREN parameters RPAREN datatype')
     def func_prototype(self, p):
         return FunctionPrototype(p.ID, p.parameters, p.datatype, lineno=p.lineno)
@@ -258,6 +276,23 @@ class GoneParser(Parser):
     def while_statement(self, p):
         return WhileStatement(p.expression, p.basicblock, lineno=p.lineno)
 
+    @_('FOR ID ID expression DOTDOT expression LBRACE basicblock RBRACE')
+    def for_statement(self, p):
+        self.expect_word(p.ID1, 'in', p.lineno)
+        return ForStatement(p.ID0, p.expression0, p.expression1, None, p.basicblock, lineno=p.lineno)
+
+    @_('FOR ID ID expression DOTDOT expression ID expression LBRACE basicblock RBRACE')
+    def for_statement(self, p):
+        self.expect_word(p.ID1, 'in', p.lineno)
+        self.expect_word(p.ID2, 'by', p.lineno)
+        return ForStatement(p.ID0, p.expression0, p.expression1, p.expression2, p.basicblock,
+                            lineno=p.lineno)
+
+    def expect_word(self, word, expected, lineno):
+        # in and by aren't keywords, so they're parsed as names
+        if word != expected:
+            error(lineno, "Syntax error in input at token '%s'" % word)
+
     @_('RETURN expression SEMI')
     def return_statement(self, p):
         return ReturnStatement(p.expression, lineno=p.lineno)
@@ -387,32 +422,50 @@ class GoneParser(Parser):
 #                     DO NOT MODIFY ANYTHING BELOW HERE
 # ----------------------------------------------------------------------
 
-def parse(source):
+def parse(source, session=None, lineno=1):
     '''
     Parse source code into an AST. Return the top of the AST tree.
+    Errors are reported to session (see session.py), if given.
+    lineno is the line number of the first line of source.
     '''
-    lexer = GoneLexer()
-    parser = GoneParser()
-    ast = parser.parse(lexer.tokenize(source))
+    with using_session(session) as session:
+        lexer = GoneLexer()
+        parser = GoneParser()
+        tokens = lexer.tokenize(source, lineno=lineno)
+        if timing_enabled():
+            # Lex everything up front so that lexing and parsing are timed separately
+            with phase('lex'):
+                tokens = iter(list(tokens))
+        with phase('parse'):
+            ast = parser.parse(tokens)
+        session.remember('ast', ast)
     return ast
 
 def main():
     '''
     Main program. Used for testing.
     '''
-    import sys
+    import argparse
+    from .timing import enable_timing, print_timings
 
-    if len(sys.argv) != 2:
-        sys.stderr.write('Usage: python3 -m gone.parser filename\n')
-        raise SystemExit(1)
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.parser')
+    argparser.add_argument('filename')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
 
     # Parse and create the AST
-    ast = parse(open(sys.argv[1]).read())
+    ast = parse(open(args.filename).read())
 
     # Output the resulting parse tree structure
     for depth, node in flatten(ast):
         print('%s%s' % (' '*(4*depth), node))
 
+    if args.time_passes:
+        print_timings()
+
 if __name__ == '__main__':
     main()
 
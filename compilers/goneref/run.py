@@ -8,46 +8,220 @@ import os.path
 import ctypes
 import llvmlite.binding as llvm
 
+from .timing import phase
+from .runtime import link_runtime
+
 _path = os.path.dirname(__file__)
+_runtime = None
 
-def run(llvm_ir):
-    # Load the runtime
-    ctypes._dlopen(os.path.join(_path, 'gonert.so'), ctypes.RTLD_GLOBAL)
+def load_runtime():
+    '''
+    Load the Gone runtime library (gonert.so) into the process so that
+    JIT-compiled code can call it.  Returns the ctypes library object.
+    '''
+    global _runtime
+    if _runtime is None:
+        _runtime = ctypes.CDLL(os.path.join(_path, 'gonert.so'), ctypes.RTLD_GLOBAL)
+    return _runtime
+
+def flush_output():
+    '''
+    Write out any output buffered by the runtime
+    '''
+    load_runtime()._gone_flush()
+
+# Optimization levels accepted by optimize() and the -O option
+opt_levels = [0, 1, 2, 3]
+
+def pass_manager_builder(opt_level):
+    '''
+    Return a pass manager builder set up for the given level (1-3)
+    '''
+    pmb = llvm.create_pass_manager_builder()
+    pmb.opt_level = opt_level
+    pmb.loop_vectorize = opt_level >= 3
+    pmb.slp_vectorize = opt_level >= 3
+    return pmb
+
+def optimize(mod, opt_level, target_machine=None):
+    '''
+    Run the standard LLVM optimization pipeline for the given level
+    (0-3) over a parsed LLVM module.  Level 0 leaves the module alone.
+    Level 3 also runs the loop and SLP vectorizers.  If a
+    target machine is given, its cost model is used to decide what
+    is worth vectorizing.
+    '''
+    if opt_level not in opt_levels:
+        raise ValueError('Bad optimization level %r' % opt_level)
+    if opt_level == 0:
+        return
+
+    pmb = pass_manager_builder(opt_level)
+    pm = llvm.create_module_pass_manager()
+    if target_machine:
+        target_machine.add_analysis_passes(pm)
+    pmb.populate(pm)
+    pm.run(mod)
+
+def host_cpu():
+    '''
+    Return the name and features (a string such as '+avx2,+fma,...')
+    of the host CPU
+    '''
+    llvm.initialize()
+    llvm.initialize_native_target()
+    return llvm.get_host_cpu_name(), llvm.get_host_cpu_features().flatten()
 
-    # Initialize LLVM
+def create_target_machine(opt_level=0, reloc='default', cpu=None, features=None,
+                          codemodel='jitdefault'):
+    '''
+    Initialize LLVM and return a target machine.  By default, code is
+    tuned for (and may only run on) the host CPU.  Pass cpu='generic'
+    for code that runs on any machine of the same architecture.  If a
+    cpu is given, features default to none beyond those of that CPU.
+    The default relocation and code models are the ones for the JIT.
+    Object files for the system linker should use reloc='pic' and
+    codemodel='small'.
+    '''
     llvm.initialize()
     llvm.initialize_native_target()
     llvm.initialize_native_asmprinter()
 
+    if cpu is None:
+        cpu, host_features = host_cpu()
+        if features is None:
+            features = host_features
+    elif features is None:
+        features = ''
     target = llvm.Target.from_default_triple()
-    target_machine = target.create_target_machine()
-    mod = llvm.parse_assembly(llvm_ir)
-    mod.verify()
+    return target.create_target_machine(cpu=cpu, features=features,
+                                        opt=opt_level, reloc=reloc, codemodel=codemodel)
+
+def parse_module(llvm_ir, opt_level=0, target_machine=None, context=None):
+    '''
+    Parse and verify LLVM IR (a string), link in the runtime functions
+    written in LLVM IR (see runtime.py) and optimize it at the given
+    level for the given target machine.  Returns the LLVM module.  The
+    module goes in the given LLVM context (by default, the global one).
+    Threads compiling at the same time need a context each.
+    '''
+    with phase('llvm-verify'):
+        mod = llvm.parse_assembly(llvm_ir, context)
+        if target_machine:
+            mod.triple = target_machine.triple
+            mod.data_layout = str(target_machine.target_data)
+        link_runtime(mod, context)
+        mod.verify()
+
+    with phase('llvm-optimize'):
+        optimize(mod, opt_level, target_machine)
+    return mod
+
+def compile_jit(llvm_ir, opt_level=0, cpu=None, features=None, objects=()):
+    '''
+    Compile LLVM IR (a string) to machine code in the JIT.  Returns
+    the execution engine holding the compiled code.  cpu and features
+    override the host CPU (see create_target_machine()).  objects is
+    a list of object files (such as imported modules) to load as well.
+    '''
+    # Load the runtime
+    load_runtime()
 
-    engine = llvm.create_mcjit_compiler(mod, target_machine)
+    target_machine = create_target_machine(opt_level, cpu=cpu, features=features)
+    mod = parse_module(llvm_ir, opt_level, target_machine)
 
-    # Execute the __init() function
-    init_ptr = engine.get_function_address('__init')
-    init_func = ctypes.CFUNCTYPE(None)(init_ptr)
-    init_func()
+    with phase('codegen'):
+        engine = llvm.create_mcjit_compiler(mod, target_machine)
+        for filename in objects:
+            engine.add_object_file(filename)
+        engine.finalize_object()
 
-    main_ptr = engine.get_function_address('_gone_main')
-    main_func = ctypes.CFUNCTYPE(ctypes.c_int)(main_ptr)
-    return main_func()
+    with phase('jit-finalize'):
+        engine.run_static_constructors()
+    return engine
+
+def run(llvm_ir, opt_level=0, cpu=None, features=None, objects=()):
+    engine = compile_jit(llvm_ir, opt_level, cpu, features, objects)
+    return run_engine(engine)
+
+def run_engine(engine):
+    '''
+    Run the program compiled into an execution engine
+    '''
+    with phase('jit-finalize'):
+        init_ptr = engine.get_function_address('__init')
+        init_func = ctypes.CFUNCTYPE(None)(init_ptr)
+        main_ptr = engine.get_function_address('_gone_main')
+        main_func = ctypes.CFUNCTYPE(ctypes.c_int)(main_ptr)
+
+    with phase('run'):
+        try:
+            # Execute the __init() function
+            init_func()
+            return main_func()
+        finally:
+            flush_output()
 
 def main():
-    from .errors import errors_reported
+    import argparse
     from .llvmgen import compile_llvm
-    import sys
+    from .modules import ModuleLoader
+    from .session import CompilationSession
+    from .timing import enable_timing, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.run')
+    argparser.add_argument('filename')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=opt_levels, default=0,
+                           help='LLVM optimization level')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--cpu', default=None,
+                           help='target CPU name (default: the host CPU, or "generic")')
+    argparser.add_argument('--features', default=None,
+                           help='target CPU features such as "+avx2,+fma" (default: those of the host CPU, or none with --cpu)')
+    argparser.add_argument('-j', dest='jobs', type=int, default=None,
+                           help='compile in this many processes (see parallel.py)')
+    argparser.add_argument('--lazy', action='store_true',
+                           help='compile each function the first time it is called (see lazy.py)')
+    argparser.add_argument('-I', dest='module_path', action='append', default=[],
+                           help='directory to search for imported modules (see modules.py)')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
 
-    if len(sys.argv) != 2:
-        sys.stderr.write("Usage: python3 -m gone.run filename\n")
-        raise SystemExit(1)
+    source = open(args.filename).read()
+    modules = ModuleLoader([os.path.dirname(args.filename) or '.'] + args.module_path,
+                           opt_level=args.opt_level, ssa=args.ssa, fast_math=args.fast_math,
+                           cpu=args.cpu, features=args.features)
+    session = CompilationSession(modules=modules, cache=False)
+    if args.lazy:
+        from .ircode import compile_ircode
+        from .lazy import run_lazy
+        functions = compile_ircode(source, session)
+        if modules.order:
+            session.error(0, 'Imported modules are not supported with --lazy')
+        if not session.errors_reported():
+            run_lazy(functions, args.opt_level, args.ssa, args.fast_math, args.cpu, args.features)
+    elif args.jobs:
+        from .ircode import compile_ircode
+        from .parallel import compile_jit_parallel
+        functions = compile_ircode(source, session)
+        if not session.errors_reported():
+            engine = compile_jit_parallel(functions, args.jobs, args.opt_level, args.ssa,
+                                          args.fast_math, args.cpu, args.features,
+                                          modules.objects())
+            run_engine(engine)
+    else:
+        llvm_code = compile_llvm(source, args.ssa, args.fast_math, session)
+        if not session.errors_reported():
+            run(llvm_code, args.opt_level, args.cpu, args.features, modules.objects())
 
-    source = open(sys.argv[1]).read()
-    llvm_code = compile_llvm(source)
-    if not errors_reported():
-        run(llvm_code)
+    if args.time_passes:
+        print_timings()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,252 @@
+# gone/runtime.py
+'''
+Runtime functions in LLVM IR.
+
+Calls from Gone code into the C runtime (gonert.c) are opaque to LLVM.
+It can't inline them or see what they do.  This file defines the
+hottest runtime functions (_print_int, _print_bool and _gone_putchar)
+directly in LLVM IR.  They write into the runtime's output buffer the
+same way the C versions do.  The resulting module is linked into each
+Gone module before optimization (see link_runtime()), so LLVM can
+inline these helpers into Gone code in both the JIT and standalone
+executables.
+
+The functions have linkonce_odr linkage, and unused copies are
+discarded.  A copy that is not inlined becomes a weak symbol.  When
+linking an executable, the strong C definition of the same name in
+gonert.o wins over it.  In the JIT, the module calls its own copy.
+Both versions do the same thing.  _gone_flush() and _print_float()
+stay in C.  Printing a float exactly the way printf("%f") does is too
+involved to write out by hand here.
+
+_gone_check_index, the bounds check of array accesses, only exists
+here.  It calls _gone_index_error() in gonert.c when an index is out
+of range.
+'''
+
+import os
+import re
+
+from llvmlite.ir import (
+    Module, IRBuilder, Function, FunctionType, IntType, ArrayType, Constant,
+    GlobalVariable, VoidType
+    )
+
+_path = os.path.dirname(__file__)
+
+def runtime_constant(name):
+    '''
+    Return the value of an integer constant #defined in gonert.c
+    '''
+    with open(os.path.join(_path, 'gonert.c')) as f:
+        match = re.search(r'^#define\s+%s\s+(\d+)\s*$' % name, f.read(), re.MULTILINE)
+    if not match:
+        raise RuntimeError('%s not defined in gonert.c' % name)
+    return int(match.group(1))
+
+# Size of the output buffer.  The same buffer is used from C and from LLVM IR
+outbuf_size = runtime_constant('GONE_OUTBUF_SIZE')
+
+int_type = IntType(32)
+char_type = IntType(8)
+size_type = IntType(64)
+void_type = VoidType()
+
+class RuntimeBuilder(object):
+    '''
+    Builds the LLVM module holding the runtime functions.
+    '''
+    def __init__(self, name='gonert'):
+        self.module = Module(name=name)
+
+        # Variables and functions defined in gonert.c
+        self.outbuf = GlobalVariable(self.module, ArrayType(char_type, outbuf_size), name='_gone_outbuf')
+        self.outlen = GlobalVariable(self.module, size_type, name='_gone_outlen')
+        self.linebuffered = GlobalVariable(self.module, int_type, name='_gone_linebuffered')
+        self.flush = Function(self.module, FunctionType(int_type, []), name='_gone_flush')
+
+        self.define_putchar()
+        self.define_print_int()
+        self.define_print_bool()
+        self.define_check_index()
+
+    def start_function(self, name, rettype, parmtypes):
+        func = Function(self.module, FunctionType(rettype, parmtypes), name=name)
+        func.linkage = 'linkonce_odr'
+        self.function = func
+        self.builder = IRBuilder(func.append_basic_block('entry'))
+        return func
+
+    # Code generation helpers.  These mirror the static helper functions in gonert.c
+
+    def reserve(self, n):
+        '''
+        Make sure there is room for n more characters in the buffer.
+        Returns the current buffer length.
+        '''
+        builder = self.builder
+        full = builder.icmp_unsigned('>', builder.add(builder.load(self.outlen), Constant(size_type, n)),
+                                     Constant(size_type, outbuf_size))
+        with builder.if_then(full, likely=False):
+            builder.call(self.flush, [])
+        return builder.load(self.outlen)
+
+    def bufptr(self, pos):
+        return self.builder.gep(self.outbuf, [Constant(size_type, 0), pos])
+
+    def store_char(self, char, pos):
+        '''
+        Store a character at buffer position pos.  Returns the next position.
+        '''
+        if isinstance(char, str):
+            char = Constant(char_type, ord(char))
+        self.builder.store(char, self.bufptr(pos))
+        return self.builder.add(pos, Constant(size_type, 1))
+
+    def newline(self, pos):
+        '''
+        Store a newline at buffer position pos and update the buffer
+        length.  The buffer is written out if line buffering is on.
+        '''
+        builder = self.builder
+        builder.store(self.store_char('\n', pos), self.outlen)
+        linebuffered = builder.icmp_signed('!=', builder.load(self.linebuffered), Constant(int_type, 0))
+        with builder.if_then(linebuffered, likely=False):
+            builder.call(self.flush, [])
+
+    # Runtime functions
+
+    def define_putchar(self):
+        func = self.start_function('_gone_putchar', int_type, [int_type])
+        builder = self.builder
+        c = func.args[0]
+        pos = self.reserve(1)
+        is_newline = builder.icmp_signed('==', c, Constant(int_type, ord('\n')))
+        with builder.if_else(is_newline) as (then, otherwise):
+            with then:
+                self.newline(pos)
+            with otherwise:
+                builder.store(self.store_char(builder.trunc(c, char_type), pos), self.outlen)
+        builder.ret(c)
+
+    def define_print_int(self):
+        func = self.start_function('_print_int', void_type, [int_type])
+        builder = self.builder
+        x = func.args[0]
+
+        # Room for a sign, 10 digits and a newline
+        start = self.reserve(12)
+        zero = Constant(size_type, 0)
+        ten = Constant(size_type, 10)
+        one = Constant(size_type, 1)
+
+        # Absolute value, widened so that the most negative int is fine
+        negative = builder.icmp_signed('<', x, Constant(int_type, 0))
+        wide = builder.sext(x, size_type)
+        value = builder.select(negative, builder.sub(zero, wide), wide)
+        with builder.if_then(negative):
+            self.store_char('-', start)
+        first = builder.add(start, builder.zext(negative, size_type))
+
+        # Count the digits
+        entry = builder.block
+        count_block = func.append_basic_block('count')
+        builder.branch(count_block)
+        builder.position_at_end(count_block)
+        rest = builder.phi(size_type)
+        ndigits = builder.phi(size_type)
+        rest.add_incoming(value, entry)
+        ndigits.add_incoming(zero, entry)
+        next_rest = builder.udiv(rest, ten)
+        next_ndigits = builder.add(ndigits, one)
+        rest.add_incoming(next_rest, count_block)
+        ndigits.add_incoming(next_ndigits, count_block)
+        digits_block = func.append_basic_block('digits')
+        builder.cbranch(builder.icmp_unsigned('!=', next_rest, zero), count_block, digits_block)
+
+        # Store the digits from right to left
+        builder.position_at_end(digits_block)
+        end = builder.add(first, next_ndigits)
+        store_block = func.append_basic_block('store')
+        builder.branch(store_block)
+        builder.position_at_end(store_block)
+        rest = builder.phi(size_type)
+        pos = builder.phi(size_type)
+        rest.add_incoming(value, digits_block)
+        pos.add_incoming(end, digits_block)
+        next_pos = builder.sub(pos, one)
+        digit = builder.trunc(builder.add(builder.urem(rest, ten), Constant(size_type, ord('0'))), char_type)
+        self.store_char(digit, next_pos)
+        next_rest = builder.udiv(rest, ten)
+        rest.add_incoming(next_rest, store_block)
+        pos.add_incoming(next_pos, store_block)
+        done_block = func.append_basic_block('done')
+        builder.cbranch(builder.icmp_unsigned('!=', next_rest, zero), store_block, done_block)
+
+        builder.position_at_end(done_block)
+        self.newline(end)
+        builder.ret_void()
+
+    def define_print_bool(self):
+        func = self.start_function('_print_bool', void_type, [int_type])
+        builder = self.builder
+        x = func.args[0]
+        pos = self.reserve(6)
+        with builder.if_else(builder.icmp_signed('!=', x, Constant(int_type, 0))) as (then, otherwise):
+            with then:
+                true_pos = pos
+                for c in 'true':
+                    true_pos = self.store_char(c, true_pos)
+                true_block = builder.block
+            with otherwise:
+                false_pos = pos
+                for c in 'false':
+                    false_pos = self.store_char(c, false_pos)
+                false_block = builder.block
+        end = builder.phi(size_type)
+        end.add_incoming(true_pos, true_block)
+        end.add_incoming(false_pos, false_block)
+        self.newline(end)
+        builder.ret_void()
+
+    def define_check_index(self):
+        func = self.start_function('_gone_check_index', void_type, [int_type, int_type, int_type])
+        builder = self.builder
+        index, length, lineno = func.args
+        index_error = Function(self.module, FunctionType(void_type, [int_type, int_type, int_type]),
+                               name='_gone_index_error')
+        index_error.attributes.add('noreturn')
+        # A negative index is a very large unsigned number
+        outside = builder.icmp_unsigned('>=', index, length)
+        with builder.if_then(outside, likely=False):
+            builder.call(index_error, [index, length, lineno])
+            builder.unreachable()
+        builder.ret_void()
+
+_runtime_ir = None
+
+def runtime_ir():
+    '''
+    Return the runtime module as LLVM IR (a string)
+    '''
+    global _runtime_ir
+    if _runtime_ir is None:
+        _runtime_ir = str(RuntimeBuilder().module)
+    return _runtime_ir
+
+def link_runtime(mod, context=None):
+    '''
+    Link the runtime functions into a parsed LLVM module (an
+    llvmlite.binding.ModuleRef) in the given LLVM context
+    '''
+    import llvmlite.binding as llvm
+    runtime = llvm.parse_assembly(runtime_ir(), context)
+    runtime.triple = mod.triple
+    runtime.data_layout = mod.data_layout
+    mod.link_in(runtime)
+
+def main():
+    print(runtime_ir())
+
+if __name__ == '__main__':
+    main()
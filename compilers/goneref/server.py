@@ -0,0 +1,324 @@
+# gone/server.py
+'''
+Compile Server
+==============
+
+Every run of llvmgen.py or compile.py imports SLY, llvmlite and the
+compiler, builds the parser tables and sets up LLVM before it compiles
+anything.  The compile server does all that once and then stays
+running, waiting for requests on a Unix domain socket::
+
+    bash % python3 -m gone.server --workers 4 &
+    bash % python3 -m gone.client llvm foo.g
+
+The protocol is described in client.py.  A request can ask for LLVM
+IR, an object file, or the output of running the program.  Programs
+run in the interpreter (interp.py) with their output captured, so that
+concurrent requests can't mix up their output (the JIT runtime has a
+single output buffer for the whole process).  A program that runs
+longer than the time limit (--time-limit, 10 seconds by default) is
+stopped, so it can't tie up a worker.
+
+Requests are handled concurrently by a pool of worker threads.  Each
+compilation has its own CompilationSession (see session.py), so
+errors never leak from one request into another.  LLVM releases the
+GIL while it optimizes and generates code.  LLVM objects aren't safe
+to share between threads, so each thread has its own LLVM context and
+target machines.  Results for llvm and obj requests are kept in an LRU
+cache keyed by the source and options, so compiling the same source
+again is just a lookup.
+
+The server shuts down gracefully on SIGINT, SIGTERM or a 'shutdown'
+request: it stops accepting connections, finishes the requests in
+progress and removes the socket file.
+'''
+
+import os
+import io
+import sys
+import json
+import base64
+import time
+import signal
+import socket
+import hashlib
+import threading
+import socketserver
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .client import default_socket_path, send_message, recv_message
+from .interp import Interpreter, link_functions, OutputSink
+
+class ResultCache(object):
+    '''
+    Thread-safe LRU cache of responses
+    '''
+    def __init__(self, size=256):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            response = self.entries.get(key)
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return response
+
+    def put(self, key, response):
+        with self.lock:
+            self.entries[key] = response
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+class TimeLimitExceeded(Exception):
+    pass
+
+class LimitedInterpreter(Interpreter):
+    '''
+    Interpreter (see interp.py) that raises TimeLimitExceeded once the
+    program has run for more than time_limit seconds.  The clock is
+    checked on every call and loop back-edge, so a program can't run
+    much longer than that.
+    '''
+    def __init__(self, time_limit, output=None):
+        Interpreter.__init__(self, output=output)
+        self.time_limit = time_limit
+        self.deadline = time.monotonic() + time_limit
+
+    def check_time(self):
+        if time.monotonic() > self.deadline:
+            raise TimeLimitExceeded('Program ran for more than %g seconds' % self.time_limit)
+
+    def execute_function(self, funcname, args):
+        self.check_time()
+        return Interpreter.execute_function(self, funcname, args)
+
+    def run_jump(self, target):
+        if target < self.pc:
+            self.check_time()
+        self.pc = target
+
+    def run_for_next(self, name, stop, step, body_target):
+        Interpreter.run_for_next(self, name, stop, step, body_target)
+        if self.pc == body_target:
+            self.check_time()
+
+class RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        try:
+            message = recv_message(self.request)
+        except (ConnectionError, ValueError) as e:
+            return
+        response = self.server.compile_server.submit(message)
+        try:
+            send_message(self.request, response)
+        except OSError:
+            # The client went away
+            pass
+
+class UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # Wait for handlers still running when the server closes
+    daemon_threads = False
+    block_on_close = True
+
+def server_running(path):
+    '''
+    Return True if a server accepts connections on the socket path
+    '''
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except OSError:
+            return False
+    return True
+
+class CompileServer(object):
+    '''
+    Compile server listening on the Unix socket path.  workers is the
+    number of requests handled at the same time.  Programs run for
+    'run' requests are stopped after time_limit seconds.
+    '''
+    def __init__(self, path=None, workers=None, cache_size=256, time_limit=10.0):
+        self.path = path or default_socket_path()
+        self.time_limit = time_limit
+        self.pool = ThreadPoolExecutor(workers or os.cpu_count())
+        self.cache = ResultCache(cache_size)
+        self.local = threading.local()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.warm_up()
+
+        if os.path.exists(self.path):
+            # Left behind by a server that didn't shut down cleanly,
+            # unless another server is still listening on it
+            if server_running(self.path):
+                raise RuntimeError('A server is already listening on %s' % self.path)
+            os.unlink(self.path)
+        self.server = UnixServer(self.path, RequestHandler)
+        self.server.compile_server = self
+
+    def warm_up(self):
+        '''
+        Import the compiler and initialize LLVM before the first request
+        '''
+        from . import parser, checker, ircode, llvmgen, interp
+        from .runtime import runtime_ir
+        from .run import create_target_machine
+        create_target_machine()
+        runtime_ir()
+
+    def llvm_context(self):
+        # The global LLVM context isn't safe to use from several threads
+        if not hasattr(self.local, 'context'):
+            import llvmlite.binding as llvm
+            self.local.context = llvm.create_context()
+        return self.local.context
+
+    def target_machine(self, options):
+        # Target machines aren't safe to share between threads
+        machines = self.local.__dict__.setdefault('machines', {})
+        opt_level = options.get('opt_level', 0)
+        if opt_level not in machines:
+            from .run import create_target_machine
+            machines[opt_level] = create_target_machine(opt_level, reloc='pic', codemodel='small')
+        return machines[opt_level]
+
+    def submit(self, message):
+        '''
+        Handle a request in the worker pool and return the response
+        '''
+        with self.lock:
+            self.requests += 1
+        try:
+            return self.pool.submit(self.handle, message).result()
+        except RuntimeError:
+            # The pool has been shut down
+            return { 'ok' : False, 'diagnostics' : [], 'error' : 'Server is shutting down' }
+
+    def handle(self, message):
+        op = message.get('op')
+        try:
+            if op == 'ping':
+                return { 'ok' : True, 'diagnostics' : [], 'pid' : os.getpid(),
+                         'requests' : self.requests, 'cache_hits' : self.cache.hits,
+                         'cache_misses' : self.cache.misses }
+            elif op == 'shutdown':
+                threading.Thread(target=self.shutdown).start()
+                return { 'ok' : True, 'diagnostics' : [] }
+            elif op in ('llvm', 'obj', 'run'):
+                source = message.get('source')
+                if source is None:
+                    with open(message['path']) as f:
+                        source = f.read()
+                filename = message.get('filename') or message.get('path') or '<source>'
+                options = message.get('options') or {}
+                return self.compile(op, source, filename, options)
+            else:
+                return { 'ok' : False, 'diagnostics' : [], 'error' : 'Unknown op %r' % op }
+        except Exception as e:
+            return { 'ok' : False, 'diagnostics' : [], 'error' : '%s: %s' % (type(e).__name__, e) }
+
+    def compile(self, op, source, filename, options):
+        from .session import CompilationSession
+
+        key = None
+        if op != 'run':
+            key = hashlib.sha1(json.dumps([op, source, filename, options], sort_keys=True).encode('utf-8')).digest()
+            response = self.cache.get(key)
+            if response is not None:
+                return response
+
+        session = CompilationSession(filename=filename, options=options, echo=False, cache=False)
+        if op == 'run':
+            from .ircode import compile_ircode
+            functions = compile_ircode(source, session)
+            if session.errors_reported():
+                return { 'ok' : False, 'diagnostics' : session.error_messages() }
+            output = io.BytesIO()
+            interpreter = LimitedInterpreter(self.time_limit, OutputSink(output))
+            interpreter.register_functions(link_functions(functions))
+            try:
+                interpreter.execute_function('__init', [])
+                result = interpreter.execute_function('main', [])
+            except TimeLimitExceeded as e:
+                return { 'ok' : False, 'diagnostics' : [], 'error' : str(e) }
+            finally:
+                interpreter.output.flush()
+            return { 'ok' : True, 'diagnostics' : [], 'result' : result,
+                     'output' : output.getvalue().decode('utf-8', 'replace') }
+
+        from .llvmgen import compile_llvm
+        llvm_code = compile_llvm(source, session=session)
+        if session.errors_reported():
+            response = { 'ok' : False, 'diagnostics' : session.error_messages() }
+        elif op == 'llvm':
+            response = { 'ok' : True, 'diagnostics' : [], 'llvm' : llvm_code }
+        else:
+            from .run import parse_module
+            target_machine = self.target_machine(options)
+            mod = parse_module(llvm_code, options.get('opt_level', 0), target_machine,
+                               self.llvm_context())
+            obj = target_machine.emit_object(mod)
+            response = { 'ok' : True, 'diagnostics' : [],
+                         'object' : base64.b64encode(obj).decode('ascii') }
+        self.cache.put(key, response)
+        return response
+
+    def serve_forever(self):
+        try:
+            self.server.serve_forever()
+        finally:
+            self.close()
+
+    def shutdown(self):
+        '''
+        Stop accepting requests.  serve_forever() returns once the
+        requests in progress are done.
+        '''
+        self.server.shutdown()
+
+    def close(self):
+        self.server.server_close()
+        self.pool.shutdown(wait=True)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.server')
+    argparser.add_argument('--socket', default=None,
+                           help='socket path (default: %s)' % default_socket_path())
+    argparser.add_argument('--workers', type=int, default=None,
+                           help='requests handled at the same time (default: one per CPU)')
+    argparser.add_argument('--cache-size', type=int, default=256,
+                           help='number of compiled results to keep')
+    argparser.add_argument('--time-limit', type=float, default=10.0,
+                           help='seconds a program may run for a run request')
+    args = argparser.parse_args()
+
+    try:
+        server = CompileServer(args.socket, args.workers, args.cache_size, args.time_limit)
+    except RuntimeError as e:
+        raise SystemExit('gone.server: %s' % e)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever() to stop, so it can't run in this thread
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    print('gone.server: listening on %s' % server.path, file=sys.stderr)
+    server.serve_forever()
+    print('gone.server: stopped', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+# gone/session.py
+'''
+Compilation sessions.
+
+A CompilationSession holds the state of one compilation: the error
+messages reported so far (diagnostics), the compiler options, and a
+cache of the results of each stage.  Pass a session to parse(),
+check_program(), compile_ircode() or compile_llvm()::
+
+       session = CompilationSession(filename='foo.g')
+       llvm_code = compile_llvm(source, session=session)
+       if session.errors_reported():
+           for filename, lineno, message in session.diagnostics:
+               ...
+
+While a stage runs, its session is the current session (see
+current_session()).  The error() function in errors.py reports to the
+current session, so code deep inside the compiler doesn't need to know
+which compilation it's part of.  The current session is kept in a
+context variable, so each thread (and each asyncio task) has its own.
+Many sources can be compiled at the same time in one process without
+their errors getting mixed up.
+
+Code that doesn't use sessions at all gets a default session shared by
+the whole process.  That keeps the old behavior of errors.py (a single
+error count, reset with clear_errors()).
+'''
+
+import sys
+import contextvars
+from contextlib import contextmanager
+
+class CompilationSession(object):
+    '''
+    State of one compilation.  options is a dict of compiler options
+    (such as 'ssa' and 'fast_math').  If echo is True, errors are also
+    printed to stderr as they are reported.  If cache is True, the
+    result of each compiler stage is kept in self.cache.  modules is
+    the ModuleLoader (see modules.py) that finds imported modules.
+    '''
+    def __init__(self, filename=None, options=None, echo=True, cache=True, modules=None):
+        self.filename = filename
+        self.options = dict(options or {})
+        self.echo = echo
+        self.modules = modules
+
+        # Errors reported so far [(filename, lineno, message)]
+        self.diagnostics = []
+
+        # Results of compiler stages ('ast', 'ircode', 'llvm')
+        self.cache = {} if cache else None
+
+    def error(self, lineno, message, filename=None):
+        '''
+        Report a compiler error
+        '''
+        filename = filename or self.filename
+        self.diagnostics.append((filename, lineno, message))
+        if self.echo:
+            print(format_error(lineno, message, filename), file=sys.stderr)
+
+    def errors_reported(self):
+        '''
+        Return the number of errors reported
+        '''
+        return len(self.diagnostics)
+
+    def clear_errors(self):
+        '''
+        Forget all errors reported so far
+        '''
+        self.diagnostics.clear()
+
+    def remember(self, stage, result):
+        '''
+        Keep the result of a compiler stage (if caching is on)
+        '''
+        if self.cache is not None:
+            self.cache[stage] = result
+
+    def error_messages(self):
+        '''
+        Return the errors reported as a list of formatted messages
+        '''
+        return [ format_error(lineno, message, filename)
+                 for filename, lineno, message in self.diagnostics ]
+
+    @contextmanager
+    def active(self):
+        '''
+        Make this the current session for the enclosed block of code
+        '''
+        token = _current_session.set(self)
+        try:
+            yield self
+        finally:
+            _current_session.reset(token)
+
+def format_error(lineno, message, filename=None):
+    if not filename:
+        return "{}: {}".format(lineno, message)
+    else:
+        return "{}:{}: {}".format(filename, lineno, message)
+
+# Results aren't cached by default, so big programs aren't kept alive
+_default_session = CompilationSession(cache=False)
+_current_session = contextvars.ContextVar('gone_session', default=None)
+
+def current_session():
+    '''
+    Return the current session (or the default session if none is active)
+    '''
+    session = _current_session.get()
+    return session if session is not None else _default_session
+
+@contextmanager
+def using_session(session=None):
+    '''
+    Run the enclosed block of code in session.  If session is None, the
+    current session stays in effect.  Returns the session in use.
+    '''
+    if session is None:
+        yield current_session()
+    else:
+        with session.active():
+            yield session
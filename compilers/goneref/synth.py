@@ -0,0 +1,320 @@
+# gone/synth.py
+'''
+Synthetic Gone Program Generator
+================================
+
+This program generates random, type-correct Gone programs for the
+purposes of testing the compiler on large inputs.  Generation is
+seeded, so the same options always produce the same program.
+
+The shape of the generated programs is controlled by a few options:
+
+    functions    Number of functions (in addition to main)
+    depth        Maximum nesting depth of if/while statements
+    expr_size    Maximum number of operators in an expression
+    statements   Number of statements per block
+    globals      Number of global variables
+    consts       Number of constants
+
+Generated programs always terminate.  Loops are counted with a
+dedicated counter variable and functions only call "leaf" functions
+that make no calls themselves, so there is no recursion.  Integer
+variables are scaled back down whenever they grow too large.
+
+To make a program::
+
+    bash % python3 -m gone.synth --seed 1 --functions 100 > prog.g
+
+To make a program of (at least) a given size, keep adding functions
+until the size is reached::
+
+    bash % python3 -m gone.synth --seed 1 --size 10MB -o big.g
+'''
+
+import io
+import sys
+import random
+
+# Types used in generated programs.  Strings are not supported by the
+# code generators so they are left out.
+types = ['int', 'float', 'bool']
+
+# Integers are scaled down when they get bigger than this
+int_limit = 10000
+
+class ProgramGenerator(object):
+    '''
+    Generates a Gone program and writes it to a file.
+    '''
+    def __init__(self, seed=0, functions=10, depth=2, expr_size=4,
+                 statements=4, globals=5, consts=5):
+        self.random = random.Random(seed)
+        self.num_functions = functions
+        self.depth = depth
+        self.expr_size = expr_size
+        self.num_statements = statements
+        self.num_globals = globals
+        self.num_consts = consts
+
+        # Global symbols: name -> type
+        self.consts = {}
+        self.globals = {}
+
+        # Functions that make no calls: name -> (rettype, parmtypes)
+        self.leaf_functions = {}
+
+        # All functions in order of definition
+        self.functions = []
+
+        # Symbols visible in the function being generated
+        self.readable = {}
+        self.writable = {}
+        self.can_call = False
+
+    def write(self, out, target_size=None):
+        '''
+        Write the program to the file out.  If target_size is given, functions
+        are added until at least that many characters have been written.
+        '''
+        self.written = 0
+        def emit(text):
+            self.written += len(text)
+            out.write(text)
+
+        emit('/* Generated by gone.synth */\n\n')
+        for n in range(self.num_consts):
+            emit(self.make_const('C%d' % n))
+        for n in range(self.num_globals):
+            emit(self.make_global('g%d' % n))
+        emit('\n')
+
+        n = 0
+        while n < self.num_functions or (target_size and self.written < target_size):
+            emit(self.make_function('f%d' % n))
+            n += 1
+        emit(self.make_main())
+
+    # Declarations
+    def make_const(self, name):
+        ty = self.random.choice(types)
+        self.readable = dict(self.consts)
+        expr = self.make_expr(ty, self.expr_size)
+        self.consts[name] = ty
+        return 'const %s = %s;\n' % (name, expr)
+
+    def make_global(self, name):
+        ty = self.random.choice(types)
+        self.readable = dict(self.consts, **self.globals)
+        expr = self.make_expr(ty, self.expr_size)
+        self.globals[name] = ty
+        return 'var %s %s = %s;\n' % (name, ty, expr)
+
+    def make_function(self, name):
+        rettype = self.random.choice(types)
+        parmtypes = [ self.random.choice(types) for n in range(self.random.randint(0, 3)) ]
+        parms = { 'p%d' % n: ty for n, ty in enumerate(parmtypes) }
+        locals_ = { 'l%d' % n: self.random.choice(types)
+                    for n in range(self.random.randint(1, 4)) }
+
+        self.readable = dict(self.consts, **self.globals)
+        self.readable.update(parms)
+        self.writable = dict(self.globals, **parms)
+
+        # Leaf functions make no calls.  Other functions only call leaves.
+        is_leaf = not self.leaf_functions or self.random.random() < 0.3
+        self.can_call = not is_leaf
+
+        lines = []
+        lines.append('func %s(%s) %s {\n' % (name,
+                     ', '.join('%s %s' % (pname, ty) for pname, ty in parms.items()),
+                     rettype))
+        for lname, ty in locals_.items():
+            lines.append('    var %s %s = %s;\n' % (lname, ty, self.make_expr(ty, self.expr_size)))
+            self.readable[lname] = ty
+            self.writable[lname] = ty
+
+        self.loop_counter = 0
+        body = self.make_block(1, self.depth)
+        counters = [ '    var w%d int = 0;\n' % n for n in range(self.loop_counter) ]
+        lines.extend(counters)
+        lines.extend(body)
+        lines.append('    return %s;\n' % self.make_expr(rettype, self.expr_size))
+        lines.append('}\n\n')
+
+        if is_leaf:
+            self.leaf_functions[name] = (rettype, parmtypes)
+        self.functions.append((name, rettype, parmtypes))
+        return ''.join(lines)
+
+    def make_main(self):
+        self.readable = dict(self.consts, **self.globals)
+        self.writable = dict(self.globals)
+        self.can_call = False
+        lines = [ 'func main() int {\n' ]
+        for name, rettype, parmtypes in self.functions:
+            args = ', '.join(self.make_expr(ty, 1) for ty in parmtypes)
+            lines.append('    print %s(%s);\n' % (name, args))
+        for name in self.globals:
+            lines.append('    print %s;\n' % name)
+        lines.append('    return 0;\n}\n')
+        return ''.join(lines)
+
+    # Statements
+    def make_block(self, indent, depth):
+        lines = []
+        for n in range(self.random.randint(1, self.num_statements)):
+            lines.extend(self.make_statement(indent, depth))
+        return lines
+
+    def make_statement(self, indent, depth):
+        pad = '    ' * indent
+        choice = self.random.random()
+        if depth > 0 and choice < 0.2:
+            cond = self.make_expr('bool', self.expr_size)
+            lines = [ '%sif %s {\n' % (pad, cond) ]
+            lines.extend(self.make_block(indent+1, depth-1))
+            if self.random.random() < 0.5:
+                lines.append('%s} else {\n' % pad)
+                lines.extend(self.make_block(indent+1, depth-1))
+            lines.append('%s}\n' % pad)
+            return lines
+
+        elif depth > 0 and choice < 0.35:
+            counter = 'w%d' % self.loop_counter
+            self.loop_counter += 1
+            lines = [ '%s%s = 0;\n' % (pad, counter),
+                      '%swhile %s < %d {\n' % (pad, counter, self.random.randint(1, 4)) ]
+            lines.extend(self.make_block(indent+1, depth-1))
+            lines.append('%s    %s = %s + 1;\n' % (pad, counter, counter))
+            lines.append('%s}\n' % pad)
+            return lines
+
+        elif choice < 0.45:
+            ty = self.random.choice(types)
+            return [ '%sprint %s;\n' % (pad, self.make_expr(ty, self.expr_size)) ]
+
+        else:
+            name = self.random.choice(list(self.writable))
+            ty = self.writable[name]
+            lines = [ '%s%s = %s;\n' % (pad, name, self.make_expr(ty, self.expr_size)) ]
+            if ty == 'int':
+                lines.append('%sif %s > %d || %s < -%d {\n' % (pad, name, int_limit, name, int_limit))
+                lines.append('%s    %s = %s / %d;\n' % (pad, name, name, int_limit))
+                lines.append('%s}\n' % pad)
+            return lines
+
+    # Expressions
+    def make_expr(self, ty, size):
+        '''
+        Make an expression of type ty with at most size operators
+        '''
+        if size <= 0:
+            return self.make_term(ty)
+
+        choice = self.random.random()
+        if ty == 'bool':
+            if choice < 0.4:
+                operand_type = self.random.choice(['int', 'float'])
+                left = self.make_expr(operand_type, size // 2)
+                right = self.make_expr(operand_type, size // 2)
+                op = self.random.choice(['<', '<=', '>', '>=', '==', '!='])
+                return '%s %s %s' % (left, op, right)
+            elif choice < 0.6:
+                left = self.make_expr('bool', size // 2)
+                right = self.make_expr('bool', size // 2)
+                return '(%s %s %s)' % (left, self.random.choice(['&&', '||']), right)
+            elif choice < 0.7:
+                return '!%s' % self.make_term('bool')
+        else:
+            if choice < 0.5:
+                left = self.make_expr(ty, size - 1)
+                right = self.make_expr(ty, (size - 1) // 2)
+                return '(%s %s %s)' % (left, self.random.choice(['+', '-']), right)
+            elif choice < 0.65:
+                # Multiply and divide only by small literals so values stay bounded
+                left = self.make_expr(ty, size - 1)
+                if ty == 'int':
+                    right = str(self.random.randint(1, 3))
+                else:
+                    right = self.random.choice(['0.5', '1.5', '2.0', '3.0'])
+                return '(%s %s %s)' % (left, self.random.choice(['*', '/']), right)
+            elif choice < 0.7:
+                return '-%s' % self.make_term(ty)
+        return self.make_term(ty)
+
+    def make_term(self, ty):
+        '''
+        Make a literal, a variable reference or a function call of type ty
+        '''
+        choice = self.random.random()
+        if choice < 0.5:
+            names = [ name for name, symty in self.readable.items() if symty == ty ]
+            if names:
+                return self.random.choice(names)
+        elif choice < 0.6 and self.can_call:
+            funcs = [ (name, parmtypes) for name, (rettype, parmtypes) in self.leaf_functions.items()
+                      if rettype == ty ]
+            if funcs:
+                name, parmtypes = self.random.choice(funcs)
+                return '%s(%s)' % (name, ', '.join(self.make_term(pty) for pty in parmtypes))
+        return self.make_literal(ty)
+
+    def make_literal(self, ty):
+        if ty == 'int':
+            return str(self.random.randint(0, 100))
+        elif ty == 'float':
+            return '%.2f' % self.random.uniform(0.0, 100.0)
+        else:
+            return self.random.choice(['true', 'false'])
+
+def generate_program(seed=0, target_size=None, **options):
+    '''
+    Generate a program and return it as a string.  options are passed
+    to ProgramGenerator.
+    '''
+    out = io.StringIO()
+    ProgramGenerator(seed, **options).write(out, target_size)
+    return out.getvalue()
+
+def parse_size(text):
+    '''
+    Convert a size such as '100', '10KB' or '5MB' into a number of bytes
+    '''
+    text = text.upper()
+    for suffix, scale in (('KB', 1024), ('MB', 1024*1024), ('GB', 1024*1024*1024)):
+        if text.endswith(suffix):
+            return int(float(text[:-len(suffix)]) * scale)
+    return int(text)
+
+def main():
+    import argparse
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.synth')
+    argparser.add_argument('--seed', type=int, default=0)
+    argparser.add_argument('--functions', type=int, default=10)
+    argparser.add_argument('--depth', type=int, default=2, help='maximum nesting of if/while')
+    argparser.add_argument('--expr-size', type=int, default=4, help='maximum operators per expression')
+    argparser.add_argument('--statements', type=int, default=4, help='maximum statements per block')
+    argparser.add_argument('--globals', type=int, default=5)
+    argparser.add_argument('--consts', type=int, default=5)
+    argparser.add_argument('--size', default=None,
+                           help='keep adding functions until the program is this big (e.g. 10MB)')
+    argparser.add_argument('-o', '--output', help='output file (default: stdout)')
+    args = argparser.parse_args()
+
+    generator = ProgramGenerator(args.seed,
+                                 functions=args.functions,
+                                 depth=args.depth,
+                                 expr_size=args.expr_size,
+                                 statements=args.statements,
+                                 globals=args.globals,
+                                 consts=args.consts)
+    target_size = parse_size(args.size) if args.size else None
+    if args.output:
+        with open(args.output, 'w') as out:
+            generator.write(out, target_size)
+    else:
+        generator.write(sys.stdout, target_size)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+# gone/tiered.py
+'''
+Tiered Execution
+================
+
+The interpreter (interp.py) starts running a program right away but
+runs it slowly.  The JIT (run.py) runs it fast but compiles the whole
+program first.  This file combines the two.  Every function starts out
+in the interpreter.  The interpreter counts the calls to each function
+and the loop back-edges taken in it.  Once the count reaches a
+threshold, the function is compiled to machine code (one function per
+LLVM module, as in lazy.py).  All later calls run the native version,
+both calls from interpreted code and calls from other native code.
+
+Native functions call other functions through function pointer slots
+(see lazy.py).  The slot of a function that hasn't been promoted yet
+points to a stub that calls back into the interpreter.  The slot is
+patched when the function is promoted.
+
+There is no on-stack replacement.  A function promoted because of a
+long-running loop keeps running in the interpreter until it returns,
+so promoting main() makes no difference.
+
+The interpreter and native code share one copy of everything:
+
+  * The global variables live in the memory of the JIT-compiled
+    __init module.  The interpreter reads and writes them through ctypes.
+  * Print statements in interpreted code call the runtime's print
+    functions, so output is formatted and buffered the same way as
+    in native code.
+  * Integer arithmetic wraps at 32 bits and division rounds toward
+    zero, as in native code.  Output doesn't depend on when functions
+    get promoted.
+
+Programs that use arrays can't be run this way yet.  The interpreter
+keeps arrays in Python objects, which native code can't see.
+
+To run a program::
+
+    bash % python3 -m gone.tiered --threshold 1000 --log program.g
+
+The log lists the functions that were promoted and when.
+'''
+
+import sys
+import time
+import ctypes
+
+from .interp import Interpreter, link_functions, run as interp_run
+from .lazy import LazyJIT
+from .jit import ctypes_types, bool_result
+from .run import load_runtime, flush_output
+from .typesys import _wrap_int
+
+# Default number of calls plus back-edges before a function is compiled
+default_threshold = 1000
+
+# ctypes types of global variables.  LLVM stores an i1 in a whole byte.
+global_ctypes = dict(ctypes_types, bool=ctypes.c_bool)
+
+class NativeGlobals(object):
+    '''
+    The global variables of a program, stored in the memory of
+    JIT-compiled code.  Other names (extern functions) are kept in a
+    dict as usual.
+    '''
+    def __init__(self, engine, global_vars):
+        self.variables = { name: global_ctypes[typename].from_address(engine.get_global_value_address(name))
+                           for name, typename in global_vars }
+        self.names = {}
+
+    def __getitem__(self, name):
+        var = self.variables.get(name)
+        if var is None:
+            return self.names[name]
+        return var.value
+
+    def __setitem__(self, name, value):
+        var = self.variables.get(name)
+        if var is None:
+            self.names[name] = value
+        else:
+            var.value = value
+
+    def __contains__(self, name):
+        return name in self.variables or name in self.names
+
+class RuntimeOutput(object):
+    '''
+    Output sink that writes into the runtime's output buffer
+    '''
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def write(self, data):
+        for c in data:
+            self.runtime._gone_putchar(c)
+
+    def flush(self):
+        self.runtime._gone_flush()
+
+class NativeTier(LazyJIT):
+    '''
+    Compiles promoted functions.  Slots of functions that haven't been
+    compiled call back into the interpreter.
+    '''
+    def __init__(self, interpreter, functions, **options):
+        self.interpreter = interpreter
+        LazyJIT.__init__(self, functions, **options)
+
+    def make_stub(self, name, functype):
+        def stub(*args):
+            return self.interpreter.execute_function(name, list(args))
+        return stub
+
+def uses_arrays(functions):
+    '''
+    Return True if a program (a list of intermediate code functions)
+    declares arrays
+    '''
+    from .parallel import iter_instructions
+    return any(op[0].startswith(('global_array_', 'alloc_array_', 'parm_array_'))
+               for func in functions for op in iter_instructions(func.start_block))
+
+class TieredInterpreter(Interpreter):
+    '''
+    Interpreter that hands functions over to the JIT once they're hot.
+    threshold is the number of calls plus loop back-edges that makes a
+    function hot.  Promotions are written to log (a text stream), if given.
+    '''
+    def __init__(self, functions, threshold=default_threshold, log=None, opt_level=0,
+                 ssa=False, fast_math=False, cpu=None, features=None):
+        if uses_arrays(functions):
+            raise NotImplementedError('Tiered execution does not support arrays')
+        self.runtime = load_runtime()
+        self.runtime._print_float.argtypes = [ctypes.c_double]
+        Interpreter.__init__(self, output=RuntimeOutput(self.runtime))
+        self.register_functions(link_functions(functions))
+
+        self.threshold = threshold
+        self.log = log
+        self.jit = NativeTier(self, functions, opt_level=opt_level, ssa=ssa,
+                              fast_math=fast_math, cpu=cpu, features=features)
+
+        # Name of the function being interpreted
+        self.funcname = None
+
+        # Counts of calls and back-edges per function
+        self.calls = dict.fromkeys(self.functions, 0)
+        self.backedges = dict.fromkeys(self.functions, 0)
+
+        # Promoted functions (name -> ctypes function) and the promotion
+        # history [(name, calls, backedges, compile seconds)]
+        self.native = {}
+        self.promotions = []
+
+    def promote(self, name):
+        '''
+        Compile the function name and use the native code from now on
+        '''
+        start = time.perf_counter()
+        address = self.jit.compile_function(name)
+        elapsed = time.perf_counter() - start
+        rettypename, parmtypenames = self.jit.declarations[2][name]
+        functype = ctypes.CFUNCTYPE(ctypes_types[rettypename],
+                                    *[ctypes_types[typename] for typename in parmtypenames])
+        func = functype(address)
+        func.__name__ = name
+        if rettypename == 'bool':
+            func = bool_result(func)
+        self.native[name] = func
+        self.promotions.append((name, self.calls[name], self.backedges[name], elapsed))
+        if self.log:
+            self.log.write('tiered: promoted %s after %d calls and %d back-edges (compiled in %.1f ms)\n' % (
+                name, self.calls[name], self.backedges[name], 1000 * elapsed))
+
+    def check_hot(self, name):
+        if name not in self.native and self.calls[name] + self.backedges[name] >= self.threshold:
+            self.promote(name)
+
+    def execute_function(self, funcname, args):
+        func = self.native.get(funcname)
+        if func is None:
+            self.calls[funcname] += 1
+            self.check_hot(funcname)
+            func = self.native.get(funcname)
+        if func is not None:
+            return func(*args)
+
+        saved = self.funcname
+        self.funcname = funcname
+        try:
+            return Interpreter.execute_function(self, funcname, args)
+        finally:
+            self.funcname = saved
+
+    def run_jump(self, target):
+        if target < self.pc:
+            self.backedges[self.funcname] += 1
+            self.check_hot(self.funcname)
+        self.pc = target
+
+    def run_for_next(self, name, stop, step, body_target):
+        Interpreter.run_for_next(self, name, stop, step, body_target)
+        if self.pc == body_target:
+            self.backedges[self.funcname] += 1
+            self.check_hot(self.funcname)
+
+    # Integer operations wrap at 32 bits like native code
+    def run_add_int(self, left, right, target):
+        self.frame[target] = _wrap_int(self.frame[left] + self.frame[right])
+
+    def run_sub_int(self, left, right, target):
+        self.frame[target] = _wrap_int(self.frame[left] - self.frame[right])
+
+    def run_mul_int(self, left, right, target):
+        self.frame[target] = _wrap_int(self.frame[left] * self.frame[right])
+
+    def run_usub_int(self, source, target):
+        self.frame[target] = _wrap_int(-self.frame[source])
+
+    def run_div_int(self, left, right, target):
+        # Round toward zero like LLVM's sdiv
+        quotient = abs(self.frame[left]) // abs(self.frame[right])
+        if (self.frame[left] < 0) != (self.frame[right] < 0):
+            quotient = -quotient
+        self.frame[target] = _wrap_int(quotient)
+
+    def run_print_int(self, source):
+        self.runtime._print_int(self.frame[source])
+
+    def run_print_float(self, source):
+        self.runtime._print_float(self.frame[source])
+
+    def run_print_bool(self, source):
+        self.runtime._print_bool(self.frame[source])
+
+    def run_print_string(self, source):
+        self.output.write(('%s\n' % self.frame[source]).encode('utf-8'))
+
+    def run(self):
+        '''
+        Run the program.  __init always runs natively, since it defines
+        the global variables.  Returns the value returned by main().
+        '''
+        init_func = ctypes.CFUNCTYPE(None)(self.jit.compile_function('__init'))
+        self.globals = NativeGlobals(self.jit.engine, self.jit.declarations[0])
+        for name, rettypename, parmtypenames in self.jit.declarations[1]:
+            self.run_extern_func(name, rettypename, *parmtypenames)
+        try:
+            init_func()
+            return self.execute_function('main', [])
+        finally:
+            flush_output()
+
+def run(functions, threshold=default_threshold, log=None, opt_level=0, ssa=False,
+        fast_math=False, cpu=None, features=None):
+    '''
+    Run a program (the list of functions made by compile_ircode())
+    with tiered execution.  Returns the value returned by main().
+    '''
+    interpreter = TieredInterpreter(functions, threshold, log, opt_level, ssa, fast_math, cpu, features)
+    return interpreter.run()
+
+def main():
+    import argparse
+    from .ircode import compile_ircode
+    from .errors import errors_reported
+    from .run import opt_levels
+    from .timing import enable_timing, phase, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.tiered')
+    argparser.add_argument('filename')
+    argparser.add_argument('--threshold', type=int, default=default_threshold,
+                           help='calls plus loop back-edges before a function is compiled (default: %d)'
+                           % default_threshold)
+    argparser.add_argument('--log', action='store_true',
+                           help='report each promoted function on stderr')
+    argparser.add_argument('-O', dest='opt_level', type=int, choices=opt_levels, default=0,
+                           help='LLVM optimization level for promoted functions')
+    argparser.add_argument('--ssa', action='store_true',
+                           help='keep local variables in SSA registers instead of stack slots')
+    argparser.add_argument('--fast-math', action='store_true',
+                           help='allow float optimizations that may change results')
+    argparser.add_argument('--cpu', default=None,
+                           help='target CPU name (default: the host CPU, or "generic")')
+    argparser.add_argument('--features', default=None,
+                           help='target CPU features such as "+avx2,+fma" (default: those of the host CPU, or none with --cpu)')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
+
+    source = open(args.filename).read()
+    functions = compile_ircode(source)
+    if not errors_reported():
+        with phase('run'):
+            try:
+                interpreter = TieredInterpreter(functions, args.threshold,
+                                                sys.stderr if args.log else None, args.opt_level,
+                                                args.ssa, args.fast_math, args.cpu, args.features)
+            except NotImplementedError as e:
+                print('gone.tiered: %s.  Running in the interpreter only.' % e, file=sys.stderr)
+                interp_run(functions)
+            else:
+                interpreter.run()
+
+    if args.time_passes:
+        print_timings()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# gone/timing.py
+'''
+Compiler phase timing support.
+
+Compiling a Gone program runs through a series of phases (lexing,
+parsing, checking, intermediate code, LLVM generation, machine code
+generation and so forth).  This file provides a way to find out where
+the time and memory go.  Each phase is wrapped in a phase() block:
+
+       with phase('parse'):
+           ast = parser.parse(tokens)
+
+When timing is turned off (the default), phase() does nothing.  When
+it's turned on with enable_timing(), each phase records the elapsed
+wall-clock time, the CPU time, and the peak amount of memory allocated
+by Python (as measured by the tracemalloc module).  Memory allocated
+inside LLVM itself is not visible to tracemalloc.  Note: tracing memory
+slows down Python allocation, so pass memory=False to enable_timing()
+if you only care about time.
+
+Phases may be nested (building an imported module runs its 'ircode'
+and 'codegen' phases inside the 'check' phase of the importer).  Time
+is charged to the innermost phase only, so the phase times add up to
+the total.  The peak memory of a phase includes the phases inside it.
+
+The function timings_reported() returns the collected timings as a
+dict suitable for dumping as JSON.  Use clear_timings() to reset.
+
+The function time_passes(source) runs the whole compiler on a source
+string and returns the timings for that compilation.
+'''
+
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Compiler phases in pipeline order.  Used to order the report.
+phase_names = [ 'lex', 'parse', 'check', 'ircode', 'llvmgen',
+                'llvm-verify', 'llvm-optimize', 'codegen', 'link', 'jit-finalize', 'run' ]
+
+_timings = None
+_trace_memory = False
+
+# Phases currently running, innermost last
+_open_phases = []
+
+def enable_timing(memory=True):
+    '''
+    Start recording phase timings.  If memory is True, peak memory
+    use is traced as well.
+    '''
+    global _timings, _trace_memory
+    _timings = {}
+    _trace_memory = memory and not tracemalloc.is_tracing()
+    if _trace_memory:
+        tracemalloc.start()
+
+def disable_timing():
+    '''
+    Stop recording phase timings.
+    '''
+    global _timings, _trace_memory
+    if _trace_memory:
+        tracemalloc.stop()
+    _timings = None
+    _trace_memory = False
+
+def timing_enabled():
+    '''
+    Return True if phase timings are being recorded
+    '''
+    return _timings is not None
+
+@contextmanager
+def phase(name):
+    '''
+    Record the time and memory used by the enclosed block of code
+    under the given phase name.  Repeated phases are accumulated.
+    Time spent in phases nested inside it is left out.
+    '''
+    if _timings is None:
+        yield
+        return
+
+    tracing = tracemalloc.is_tracing()
+    # Time and memory of this phase.  child_wall and child_cpu are the
+    # time spent in phases inside it.  peak is the highest memory use
+    # seen before tracemalloc's peak was last reset.
+    current = { 'child_wall' : 0.0, 'child_cpu' : 0.0, 'peak' : 0 }
+    if tracing:
+        memory, peak = tracemalloc.get_traced_memory()
+        if _open_phases:
+            # Save the peak of the enclosing phase before it's reset
+            _open_phases[-1]['peak'] = max(_open_phases[-1]['peak'], peak)
+        tracemalloc.reset_peak()
+        current['start_mem'] = memory
+    _open_phases.append(current)
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start_wall
+        cpu = time.process_time() - start_cpu
+        _open_phases.pop()
+        if _open_phases:
+            _open_phases[-1]['child_wall'] += wall
+            _open_phases[-1]['child_cpu'] += cpu
+        if tracing:
+            peak = max(current['peak'], tracemalloc.get_traced_memory()[1])
+            if _open_phases:
+                _open_phases[-1]['peak'] = max(_open_phases[-1]['peak'], peak)
+            peak -= current['start_mem']
+        else:
+            peak = None
+        record = _timings.setdefault(name, { 'wall' : 0.0, 'cpu' : 0.0,
+                                             'peak_memory' : peak, 'calls' : 0 })
+        record['wall'] += wall - current['child_wall']
+        record['cpu'] += cpu - current['child_cpu']
+        record['calls'] += 1
+        if peak is not None:
+            record['peak_memory'] = max(record['peak_memory'] or 0, peak)
+
+def timings_reported():
+    '''
+    Return a dict mapping phase names to dicts with 'wall' and 'cpu'
+    times (in seconds), 'peak_memory' (in bytes, or None if memory
+    was not traced) and the number of 'calls'.  Phases appear in
+    pipeline order.
+    '''
+    if _timings is None:
+        return {}
+    order = { name: n for n, name in enumerate(phase_names) }
+    return { name: dict(_timings[name])
+             for name in sorted(_timings, key=lambda name: order.get(name, len(order))) }
+
+def clear_timings():
+    '''
+    Clear all of the phase timings recorded so far.
+    '''
+    if _timings is not None:
+        _timings.clear()
+
+def print_timings(file=sys.stderr):
+    '''
+    Print a table of the recorded phase timings.
+    '''
+    timings = timings_reported()
+    total_wall = sum(rec['wall'] for rec in timings.values())
+    total_cpu = sum(rec['cpu'] for rec in timings.values())
+    print('===== Gone phase timings =====', file=file)
+    print('%-14s %10s %10s %8s %12s' % ('phase', 'wall (s)', 'cpu (s)', '%', 'peak mem'), file=file)
+    for name, rec in timings.items():
+        percent = 100.0 * rec['wall'] / total_wall if total_wall else 0.0
+        if rec['peak_memory'] is None:
+            mem = '-'
+        else:
+            mem = '%.1f KB' % (rec['peak_memory'] / 1024.0)
+        print('%-14s %10.4f %10.4f %7.1f%% %12s' % (name, rec['wall'], rec['cpu'], percent, mem), file=file)
+    print('%-14s %10.4f %10.4f' % ('total', total_wall, total_cpu), file=file)
+
+def time_passes(source, stage='jit', memory=True):
+    '''
+    Compile source and return the phase timings as a dict (see
+    timings_reported()).  stage selects how far to go: 'ircode' stops
+    after intermediate code, 'llvm' after LLVM generation and 'jit'
+    after the machine code is ready to run.  The program itself is
+    not executed.  Any timings recorded earlier are discarded.
+    '''
+    from .errors import errors_reported
+    from .ircode import compile_ircode
+    from .llvmgen import compile_llvm
+    from .run import compile_jit
+
+    if stage not in ('ircode', 'llvm', 'jit'):
+        raise ValueError('Unknown stage %r' % stage)
+
+    enable_timing(memory)
+    try:
+        if stage == 'ircode':
+            compile_ircode(source)
+        else:
+            llvm_code = compile_llvm(source)
+            if stage == 'jit' and not errors_reported():
+                compile_jit(llvm_code)
+        return timings_reported()
+    finally:
+        disable_timing()
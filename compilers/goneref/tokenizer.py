@@ -37,6 +37,7 @@ Reserved Keywords:
     IF      : 'if'
     ELSE    : 'else'
     WHILE   : 'while'
+    FOR     : 'for'
     RETURN  : 'return'
 
 Identifiers (Same rules as for Python):
@@ -67,6 +68,7 @@ Operators and Delimiters:
     RBRACE   : '}
     LBRACKET : '['
     RBRACKET : ']'
+    DOTDOT   : '..'
 
 Literals:
     INTEGER : '123'   (decimal)
@@ -127,8 +129,8 @@ class GoneLexer(Lexer):
     # ----------------------------------------------------------------------
     # Keyword set. This set lists all of the special names used in the
     # language such as 'if', 'else', 'while', 'return', etc.
-    keywords = { 'var', 'const', 'print', 'func', 'extern', 
-                 'true', 'false', 'if', 'else', 'while', 'return' }
+    keywords = { 'var', 'const', 'print', 'func', 'extern', 'import',
+                 'true', 'false', 'if', 'else', 'while', 'for', 'return' }
 
     # ----------------------------------------------------------------------
     # Token set. This set identifies the complete list of token names
@@ -150,7 +152,7 @@ class GoneLexer(Lexer):
 
         # Delimiters and other symbols
         'ASSIGN', 'LPAREN', 'RPAREN', 'SEMI', 'COMMA', 
-        'LBRACE', 'RBRACE', 'LBRACKET', 'RBRACKET',
+        'LBRACE', 'RBRACE', 'LBRACKET', 'RBRACKET', 'DOTDOT',
     }
 
     # ----------------------------------------------------------------------
@@ -210,6 +212,7 @@ class GoneLexer(Lexer):
     RBRACE    = r'\}'
     LBRACKET  = r'\['
     RBRACKET  = r'\]'
+    DOTDOT    = r'\.\.'
 
     # ----------------------------------------------------------------------
     # *** YOU MUST COMPLETE : write the regexs and additional code below ***
@@ -230,9 +233,10 @@ class GoneLexer(Lexer):
     #   1.23e-1
     #   1e1
     #
-    # The value should be converted to a Python float when lexed
+    # The value should be converted to a Python float when lexed.
+    # 0..10 is a range (see DOTDOT), not 0. followed by .10
 
-    @_(r'([0-9]+\.[0-9]*)|(\.[0-9]+)')
+    @_(r'([0-9]+\.(?!\.)[0-9]*)|(\.[0-9]+)')
     def FLOAT(self, t):
         t.value = float(t.value)
         return t
@@ -312,17 +316,27 @@ def main():
     '''
     Main program. For debugging purposes.
     '''
-    import sys
-    
-    if len(sys.argv) != 2:
-        sys.stderr.write("Usage: python3 -m gone.tokenizer filename\n")
-        raise SystemExit(1)
+    import argparse
+    from .timing import enable_timing, phase, print_timings
+
+    argparser = argparse.ArgumentParser(prog='python3 -m gone.tokenizer')
+    argparser.add_argument('filename')
+    argparser.add_argument('--time-passes', action='store_true',
+                           help='report time and memory used by each compiler phase')
+    args = argparser.parse_args()
+    if args.time_passes:
+        enable_timing()
 
     lexer = GoneLexer()
-    text = open(sys.argv[1]).read()
-    for tok in lexer.tokenize(text):
+    text = open(args.filename).read()
+    with phase('lex'):
+        tokens = list(lexer.tokenize(text))
+    for tok in tokens:
         print(tok)
 
+    if args.time_passes:
+        print_timings()
+
 if __name__ == '__main__':
     main()
 
@@ -20,17 +20,120 @@ Note: You will need to have some coordination with code the checker.py
 module. Try to keep the inner workings of types as isolated as possible. 
 Make helper functions as needed.  You may need to change this file
 later--ideally you don't want to change everything else when you do.
+
+This implementation started with strings.  Each type is now a single
+interned Type object with a small integer id, and the operator tables
+are turned into matrices indexed by type id.  Looking up an operator
+gives both its result type and its IR opcode, which the checker
+records on the node for ircode.py.
+
+Arrays of int, float and bool have types of their own (int[], ...).
+An array type knows its element type, and the typed IR instructions
+for arrays are named after it (load_array_int, load_index_int).
 '''
 
+class Type(object):
+    '''
+    A Gone type.  There is exactly one Type object for each type (see
+    lookup_type()), so types are compared by identity.  id is a small
+    integer used to index the operator tables below.  opcodes maps the
+    prefix of each typed IR instruction to its full name, e.g.
+    int_type.opcodes['load'] == 'load_int'.
+    '''
+    __slots__ = ('name', 'id', 'element', 'opcodes')
+
+    def __init__(self, name, id, element=None):
+        self.name = name
+        self.id = id
+        # Type of the elements of an array type (None for other types)
+        self.element = element
+        suffix = 'array_%s' % element.name if element else name
+        self.opcodes = { prefix: '%s_%s' % (prefix, suffix) for prefix in instruction_prefixes }
+        if element:
+            self.opcodes['new'] = 'new_%s' % suffix
+            for prefix in array_prefixes:
+                self.opcodes[prefix] = '%s_%s' % (prefix, element.name)
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return 'Type(%r)' % self.name
+
+    def __reduce__(self):
+        # A copy (e.g. in another process) is the same interned object
+        return (lookup_type, (self.name,))
+
+# Prefixes of IR instructions that take a type suffix (see ircode.py)
+instruction_prefixes = [ 'literal', 'load', 'store', 'print', 'global', 'alloc', 'parm',
+                         'return', 'extern' ]
+
+# Prefixes of IR instructions on arrays that take the element type as
+# suffix (e.g. int_array_type.opcodes['load_index'] == 'load_index_int')
+array_prefixes = [ 'load_index', 'store_index' ]
+
+_types = {}
+
+def lookup_type(name):
+    '''
+    Return the Type with a given name, or None
+    '''
+    return _types.get(name)
+
+def _make_type(name, element=None):
+    _types[name] = Type(name, len(_types), element)
+    return _types[name]
+
+int_type = _make_type('int')
+float_type = _make_type('float')
+string_type = _make_type('string')
+bool_type = _make_type('bool')
+
 # List of builtin types.  These will get added to the symbol table
-builtin_types = [ 'int', 'float', 'string', 'bool' ]
+builtin_types = [ int_type, float_type, string_type, bool_type ]
 
-# Bool type. Used in the checker for conditionals
-bool_type = 'bool'
+# Array types.  Arrays hold at most max_array_length elements, so that
+# adding a non-negative int no bigger than that to a valid index never
+# overflows (see bounds.py).
+int_array_type = _make_type('int[]', int_type)
+float_array_type = _make_type('float[]', float_type)
+bool_array_type = _make_type('bool[]', bool_type)
+
+max_array_length = 2**30
+
+def array_type(element):
+    '''
+    Return the type of an array of element, or None if there are no
+    such arrays
+    '''
+    return lookup_type('%s[]' % element.name) if element else None
 
 # Error type. Set in the checker on bad declarations, etc.
 error_type = None
 
+# Names of the IR opcodes for each operator.  The type of the operands
+# is appended (add_int)
+binary_ops = {
+    '+' : 'add',
+    '-' : 'sub',
+    '*' : 'mul',
+    '/' : 'div',
+    '<' : 'lt',
+    '<=' : 'le',
+    '>' : 'gt',
+    '>=' : 'ge',
+    '==' : 'eq',
+    '!=' : 'ne',
+    '&&' : 'and',
+    '||' : 'or'
+}
+
+unary_ops = {
+    '+' : 'uadd',
+    '-' : 'usub',
+    '!' : 'not'
+}
+
 # Dict mapping all valid binary operations to result type
 _supported_binops = {
     # Integer operations
@@ -89,16 +192,109 @@ _supported_unaryops = {
     ('!', 'bool') : 'bool'
 }
     
+# The tables above as matrices indexed by type id: for each operator,
+# _binop_matrix[op][left.id][right.id] and _unaryop_matrix[op][type.id]
+# hold (result type, opcode), or None if the operation isn't supported.
+# The opcode carries the type of the (left) operand.
+_binop_matrix = { op: [ [ None ] * len(_types) for left in _types ]
+                  for op in binary_ops }
+for (left, op, right), result in _supported_binops.items():
+    left, right = lookup_type(left), lookup_type(right)
+    _binop_matrix[op][left.id][right.id] = (lookup_type(result), '%s_%s' % (binary_ops[op], left))
+
+_unaryop_matrix = { op: [ None ] * len(_types) for op in unary_ops }
+for (op, operand), result in _supported_unaryops.items():
+    operand = lookup_type(operand)
+    _unaryop_matrix[op][operand.id] = (lookup_type(result), '%s_%s' % (unary_ops[op], operand))
+
+_no_operation = (error_type, None)
+
+# Python versions of the operations on int, float and bool, by opcode,
+# for computing constant expressions at compile time.  ints are 32 bits
+# wide, as in the generated code, and int division truncates toward 0.
+def _wrap_int(value):
+    return (value + 2**31) % 2**32 - 2**31
+
+def _div_int(left, right):
+    quotient = abs(left) // abs(right)
+    return -quotient if (left < 0) != (right < 0) else quotient
+
+_binop_functions = {
+    '+' : lambda left, right: left + right,
+    '-' : lambda left, right: left - right,
+    '*' : lambda left, right: left * right,
+    '/' : lambda left, right: left / right,
+    '<' : lambda left, right: left < right,
+    '<=' : lambda left, right: left <= right,
+    '>' : lambda left, right: left > right,
+    '>=' : lambda left, right: left >= right,
+    '==' : lambda left, right: left == right,
+    '!=' : lambda left, right: left != right,
+    '&&' : lambda left, right: left and right,
+    '||' : lambda left, right: left or right,
+}
+
+_unaryop_functions = {
+    '+' : lambda value: value,
+    '-' : lambda value: -value,
+    '!' : lambda value: not value,
+}
+
+_evaluators = { }
+for (left, op, right), result in _supported_binops.items():
+    if left == right and left in ('int', 'float', 'bool'):
+        function = _div_int if (op, left) == ('/', 'int') else _binop_functions[op]
+        if result == 'int':
+            function = (lambda function: lambda left, right: _wrap_int(function(left, right)))(function)
+        _evaluators['%s_%s' % (binary_ops[op], left)] = function
+for (op, operand), result in _supported_unaryops.items():
+    function = _unaryop_functions[op]
+    if result == 'int':
+        function = (lambda function: lambda value: _wrap_int(function(value)))(function)
+    _evaluators['%s_%s' % (unary_ops[op], operand)] = function
+
+def evaluate(opcode, *values):
+    '''
+    Compute the result of an operation (given by its opcode) on
+    constant values.  Returns None if it can't be done at compile time
+    (strings, or division by zero).
+    '''
+    function = _evaluators.get(opcode)
+    if function is None:
+        return None
+    try:
+        return function(*values)
+    except ZeroDivisionError:
+        return None
+
+def lookup_binop(left_type, op, right_type):
+    '''
+    Return (result type, opcode) for a binary operator, or
+    (error_type, None) if it isn't supported.
+    '''
+    if left_type is error_type or right_type is error_type:
+        return _no_operation
+    return _binop_matrix[op][left_type.id][right_type.id] or _no_operation
+
+def lookup_unaryop(op, type):
+    '''
+    Return (result type, opcode) for a unary operator, or
+    (error_type, None) if it isn't supported.
+    '''
+    if type is error_type:
+        return _no_operation
+    return _unaryop_matrix[op][type.id] or _no_operation
+
 def check_binop(left_type, op, right_type):
     ''' 
     Check the validity of a binary operator. Returns the result type if valid,
     Returns error_type otherwise. 
     '''
-    return _supported_binops.get((left_type, op, right_type), error_type)
+    return lookup_binop(left_type, op, right_type)[0]
 
 def check_unaryop(op, type):
     '''
     Check the validity of a unary operator. Returns the result type if valid,
     Returns error_type otherwise.
     '''
-    return _supported_unaryops.get((op, type), error_type)
+    return lookup_unaryop(op, type)[0]